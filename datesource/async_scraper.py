@@ -0,0 +1,404 @@
+from playwright.async_api import async_playwright
+import asyncio
+from datetime import datetime
+import os
+from urllib.parse import urljoin
+from storage import PropertyJournal
+from seen_index import SeenIndex, card_fingerprint, persist_record
+from readiness import goto_ready_async, FIELD_TIMEOUTS
+from timing import PhaseTimer
+from metrics import metrics
+from snapshots import open_store, save_snapshot
+from scheduler import AdaptiveRateLimiter, CrawlScheduler, FairSlots, ListingBudget, Throttled, backoff_delay
+from browser_pool import AsyncPagePool
+from sites import site_for_url
+
+
+class BrowserSearchPages:
+    # Search-result pages loaded in a Playwright page, read with the site's selectors
+    def __init__(self, page, site):
+        self.page = page
+        self.site = site
+
+    async def load(self, url, timer=None):
+        # Wait until the listing cards are in the DOM rather than sleeping
+        await goto_ready_async(self.page, url, self.site.search_ready_selector, timer)
+
+    async def cards(self):
+        cards = []
+        listings = await self.page.locator(self.site.card_selector).all()
+        for listing in listings:
+            link_elem = listing.locator(self.site.card_link_selector).first
+            link = await link_elem.get_attribute("href") if await link_elem.count() > 0 else None
+            if link:
+                cards.append((urljoin(self.page.url, link), await listing.inner_text()))
+        return cards
+
+    async def next_page_url(self):
+        next_page_elem = self.page.locator(self.site.next_selector).first
+        if await next_page_elem.count() > 0:
+            next_url = await next_page_elem.get_attribute("href")
+            if next_url:
+                return urljoin(self.page.url, next_url)
+        return None
+
+
+async def scrape_targets_async(targets, concurrency=4, rate_per_host=1.0, headless=True, backend="browser", max_listings=5000,
+                              block_resources=True, refresh=False):
+    # All targets are crawled concurrently and share one browser, one HTTP client and
+    # one pool of detail pages. Each site (sites.py) gets its own scheduler, with the
+    # site's rate limit per host, shared by its targets; `concurrency` is the budget of
+    # in-flight detail fetches across all sites, handed out fairly between them
+    # (scheduler.FairSlots) and capped per site by its max_concurrency.
+    async with async_playwright() as p:
+        browser_pool = AsyncPagePool(p, concurrency, headless, block_resources)
+        slots = FairSlots(concurrency)
+        schedulers = {}
+        for site in {target.site.name: target.site for target in targets}.values():
+            site_rate = site.rate_per_host or rate_per_host
+            site_concurrency = min(site.max_concurrency or concurrency, concurrency)
+            slots.set_limit(site.name, site.max_concurrency)
+            schedulers[site.name] = CrawlScheduler(AdaptiveRateLimiter(site_rate), concurrency=site_concurrency)
+            print(f"Site {site.name}: {site_rate} requests/s per host, up to {site_concurrency} workers")
+        client = None
+
+        if backend == "http":
+            # Imported here so the browser backend does not need httpx/lxml installed
+            from http_fetch import make_client, HttpSearchPages
+            client = make_client(concurrency)
+
+            async def fetch_detail(site, url, snapshots):
+                return await scrape_detail_http(client, browser_pool, url, snapshots, site)
+        else:
+            async def fetch_detail(site, url, snapshots):
+                return await scrape_detail_browser(browser_pool, url, snapshots, site)
+
+        print(f"Async mode ({backend} backend): {concurrency} workers, {rate_per_host} requests/s per host")
+
+        async def crawl_target(target):
+            site = target.site
+
+            async def scrape_detail(url, snapshots):
+                async with slots.slot(site.name):
+                    return await fetch_detail(site, url, snapshots)
+
+            if backend == "http":
+                search_pages = HttpSearchPages(client, site)
+            else:
+                search_pages = BrowserSearchPages(await browser_pool.new_page(), site)
+            try:
+                await crawl_search_pages(target, search_pages, scrape_detail, schedulers[site.name], max_listings,
+                                         refresh=refresh)
+            except Exception as e:
+                print(f"Target {target.name} failed: {e}")
+
+        try:
+            await asyncio.gather(*(crawl_target(target) for target in targets))
+        finally:
+            if client is not None:
+                await client.aclose()
+            # Close the browser
+            await browser_pool.close()
+
+
+async def crawl_search_pages(target, search_pages, scrape_detail, scheduler=None, max_listings=5000, page_buffer=2,
+                             refresh=False):
+    # Streams one target through three stages joined by bounded queues, so memory stays
+    # flat however many listings are collected:
+    #   produce_pages  loads result pages and queues their new/changed listing links
+    #   fetch_details  scrapes (fetches and parses) each page's detail pages via the scheduler
+    #   write_records  journals each page's records, in card order, and checkpoints the page
+    # A full queue holds the stage before it back; at most one page of records is buffered. max_listings is enforced on a counter
+    # (existing rows + listings journaled by this crawl), never on a list of records.
+    #
+    # With refresh, every result page is walked from page 1 (the resume checkpoint is
+    # neither read nor moved) and only listings whose card is new or shows a changed
+    # price or title are fetched; max_listings then counts only this run's records. A
+    # pass that reaches the last page marks the listings it did not see as delisted
+    # (see SeenIndex.refresh_status).
+    pass_started = datetime.now().isoformat(timespec='seconds')
+    search_url = target.search_url
+    print(f"Navigating to search page: {search_url} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    timer = PhaseTimer(search_url, "search")
+    try:
+        await search_pages.load(search_url, timer)
+    except Exception as e:
+        print(f"Navigation failed: {e}")
+        return
+    timer.log()
+    print(f"Search page ready in {timer.summary()}")
+
+    # New properties are appended to a journal; properties.csv is only rewritten on compaction
+    csv_file = target.csv_file
+    journal = PropertyJournal(csv_file)
+    print(f"Found {len(journal)} existing properties for {csv_file}")
+
+    # Index of already-scraped links, so unchanged listings are not fetched again
+    seen = SeenIndex(target.seen_db)
+    seen.bootstrap_from_csv(csv_file)
+    snapshots = open_store(target.snapshot_dir)
+
+    # Load last scraped page
+    last_page_file = target.last_page_file
+    start_page = 1
+    if not refresh and os.path.exists(last_page_file):
+        try:
+            with open(last_page_file, 'r') as f:
+                start_page = int(f.read().strip()) + 1
+            print(f"Resuming from page {start_page}")
+        except Exception as e:
+            print(f"Failed to read last page: {e}")
+            start_page = 1
+
+    scheduler = scheduler or CrawlScheduler()
+    pages = asyncio.Queue(maxsize=page_buffer)
+    records = asyncio.Queue(maxsize=2 * scheduler.concurrency)
+    stop = asyncio.Event()
+    collected = 0 if refresh else len(journal)
+    budget = ListingBudget(max_listings - collected)
+    if collected >= max_listings:
+        print(f"Reached max listings limit ({max_listings})")
+        stop.set()
+
+    complete, _, _ = await asyncio.gather(
+        produce_pages(target, search_pages, seen, start_page, pages, stop, refresh),
+        fetch_details(target, pages, records, scrape_detail, snapshots, scheduler, stop, budget),
+        write_records(target, records, journal, seen, collected, max_listings, stop, budget, checkpoint=not refresh),
+    )
+    if refresh and complete and not stop.is_set():
+        print(f"Refresh of {target.name} complete: {seen.mark_delisted(pass_started)} listings delisted")
+
+    # Final save: merge the journal into properties.csv
+    if len(journal):
+        try:
+            with metrics.time("persist"):
+                journal.compact()
+            print(f"Final save: {len(journal)} properties to {csv_file}")
+        except Exception as e:
+            print(f"Final CSV save failed: {e}")
+    else:
+        print("No properties found")
+
+    seen.close()
+
+
+async def produce_pages(target, search_pages, seen, page_number, pages, stop, refresh=False):
+    # Stage 1: walk the result pages and queue (page number, [(url, card text)]) for
+    # the listings whose card changed. Ends the queue with None. Returns True once the
+    # last result page has been queued.
+    try:
+        # Navigate to starting page
+        if page_number > 1:
+            timer = PhaseTimer(target.page_url(page_number), "search")
+            try:
+                await search_pages.load(timer.url, timer)
+                timer.log()
+            except Exception as e:
+                print(f"Failed to navigate to page {page_number}: {e}")
+                return
+
+        while not stop.is_set():
+            print(f"Scraping page {page_number}")
+
+            # Extract detail links from current page
+            detail_links = []
+            try:
+                with metrics.time("search_links"):
+                    cards = await search_pages.cards()
+                for url, card_text in cards:
+                    detail_links.append((url, card_text, card_fingerprint(card_text)))
+                print(f"Found {len(detail_links)} listings on page {page_number}")
+            except Exception as e:
+                print(f"Failed to extract links on page {page_number}: {e}")
+
+            # Skip listings whose search card has not changed since they were scraped
+            to_scrape = []
+            for url, card_text, card_fp in detail_links:
+                status = seen.refresh_status(url, card_text) if refresh else seen.should_scrape(url, card_fp)
+                if status:
+                    to_scrape.append((url, card_text))
+                    if refresh:
+                        print(f"Refreshing listing ({status}): {url}")
+                else:
+                    print(f"Skipping unchanged listing: {url}")
+            await pages.put((page_number, to_scrape))
+
+            # Check for next page; it loads while this page's listings are being scraped
+            next_url = await search_pages.next_page_url()
+            if not next_url:
+                print("No next page found")
+                return True
+            print(f"Next page URL: {next_url}")
+            for attempt in range(3):
+                timer = PhaseTimer(next_url, "search")
+                try:
+                    await search_pages.load(next_url, timer)
+                    timer.log()
+                    page_number += 1
+                    break
+                except Exception as e:
+                    print(f"Next page navigation failed (attempt {attempt + 1}/3): {e}")
+                    await asyncio.sleep(max(backoff_delay(attempt), getattr(e, "retry_after", None) or 0))
+            else:
+                print("Failed to navigate to next page after retries")
+                break
+    finally:
+        await pages.put(None)
+
+
+async def fetch_details(target, pages, records, scrape_detail, snapshots, scheduler, stop, budget=None):
+    # Stage 2: scrape each queued page's detail pages concurrently at the scheduler's pace
+    # (failed ones are retried after the rest of the page). Once the page is done, queues
+    # its records as (page number, url, card text, property_data) in card order, so
+    # the journal's order does not depend on which fetch finished first, then
+    # (page number, None, None, None). A listing is only started while the budget allows
+    # (max_listings), and its retries always are; a page cut short by the budget, or by
+    # stop, is not marked complete.
+    # Ends the queue with None.
+    budget = budget or ListingBudget(float("inf"))
+    try:
+        while True:
+            item = await pages.get()
+            if item is None:
+                break
+            if stop.is_set():
+                # Keep draining so the producer is never left blocked on a full queue
+                continue
+            page_number, to_scrape = item
+            cards = dict(to_scrape)
+            budget.start_batch()
+            scraped = await scheduler.run_async(list(cards), lambda url: scrape_detail(url, snapshots),
+                                                admit=lambda url: budget.admit(url, closed=stop.is_set()),
+                                                on_give_up=lambda url: budget.give_back())
+            for url, card_text in cards.items():
+                if url in scraped:
+                    await records.put((page_number, url, card_text, scraped[url]))
+            if budget.refused:
+                # Not checkpointed: the next run starts with this page again
+                if not stop.is_set():
+                    print(f"Reached max listings limit; leaving the rest of page {page_number}")
+                    stop.set()
+                continue
+            if scheduler.gave_up(target.search_url):
+                # The page is not checkpointed, so the next run starts with it again
+                print(f"Stopping {target.name}: the site keeps failing")
+                stop.set()
+                continue
+            await records.put((page_number, None, None, None))
+    finally:
+        await records.put(None)
+
+
+async def write_records(target, records, journal, seen, collected, max_listings, stop, budget=None, checkpoint=True):
+    # Stage 3: journal changed records (flushed in batches) and, once a page is complete,
+    # flush the journal and seen index before checkpointing the page
+    while True:
+        item = await records.get()
+        if item is None:
+            break
+        page_number, url, card_text, property_data = item
+        try:
+            if url is not None:
+                metrics.record_fields(property_data)
+                if persist_record(journal, seen, url, card_text, property_data):
+                    collected += 1
+                elif budget is not None:
+                    # Not a new listing after all: its fetch does not count
+                    budget.give_back()
+                if collected >= max_listings and not stop.is_set():
+                    print(f"Reached max listings limit ({max_listings})")
+                    stop.set()
+                continue
+            with metrics.time("persist"):
+                journal.flush()
+                seen.commit()
+        except Exception as e:
+            print(f"Failed to journal properties: {e}")
+            continue
+
+        print(f"Total properties collected so far: {collected}")
+        metrics.write()
+        if not checkpoint:
+            continue
+
+        # Save current page number
+        try:
+            with open(target.last_page_file, 'w') as f:
+                f.write(str(page_number))
+            print(f"Saved page {page_number} to {target.last_page_file}")
+        except Exception as e:
+            print(f"Failed to save page number: {e}")
+
+
+async def scrape_detail_browser(browser_pool, url, snapshots=None, site=None):
+    # One attempt in a pooled page; the scheduler handles retries. The page is only
+    # reused if the navigation went through (a throttled response still loaded fine).
+    page = await browser_pool.acquire()
+    reuse = False
+    try:
+        print(f"Scraping detail page: {url}")
+        property_data = await scrape_detail_page_async(page, url, snapshots, site)
+        reuse = property_data is not None
+        return property_data
+    except Throttled:
+        reuse = True
+        raise
+    finally:
+        await browser_pool.release(page, reuse)
+
+
+async def scrape_detail_http(client, browser_pool, url, snapshots=None, site=None):
+    from http_fetch import scrape_detail_page_http, needs_browser
+    print(f"Fetching detail page: {url}")
+    property_data = await scrape_detail_page_http(client, url, snapshots, site)
+    if property_data and needs_browser(property_data):
+        # Nothing in the static HTML: render the page with Playwright instead
+        print(f"Falling back to browser for {url}")
+        return await scrape_detail_browser(browser_pool, url, snapshots, site)
+    return property_data
+
+
+async def scrape_detail_page_async(page, url, snapshots=None, site=None):
+    # Scrapes url in `page`, which the caller owns (see browser_pool.AsyncPagePool),
+    # with the extraction of `site` (default: the one for url's host)
+    site = site or site_for_url(url)
+    timer = PhaseTimer(url)
+    try:
+        await goto_ready_async(page, url, site.detail_ready_selector, timer)
+    except Throttled:
+        # Raised so the scheduler can slow down for this host
+        timer.log()
+        raise
+    except Exception as e:
+        print(f"Detail page navigation failed: {e}")
+        timer.log()
+        return None
+
+    # Give the description a moment to render, then read every field in one round-trip
+    with timer.phase("extract"):
+        if site.description_selector:
+            try:
+                await page.wait_for_selector(site.description_selector, timeout=FIELD_TIMEOUTS["description"])
+            except Exception as e:
+                print(f"Description XPath wait failed: {e}")
+        try:
+            raw = await page.evaluate(site.extract_js, site.extract_args)
+        except Exception as e:
+            print(f"Page extraction failed: {e}")
+            raw = {}
+
+    # Keep the rendered HTML so extraction fixes can be re-run without crawling
+    if snapshots is not None:
+        with timer.phase("snapshot"):
+            try:
+                save_snapshot(snapshots, url, await page.content())
+            except Exception as e:
+                print(f"Snapshot failed: {e}")
+
+    with timer.phase("parse"):
+        property_data = site.build(raw, url)
+
+    timer.log()
+    print(f"Detail page timings: {timer.summary()}")
+
+    return property_data
@@ -0,0 +1,126 @@
+import argparse
+import random
+import timeit
+import re
+from extract import empty_property_data
+from field_rules import parse_fallback_text, merge_fallback
+
+# Micro-benchmark: the compiled rule table (field_rules) against the per-line loop it
+# replaced in build_property_data. Both run over the same fallback texts, and their
+# outputs are compared before anything is timed.
+#
+#   python bench_field_rules.py                      # synthetic pages
+#   python bench_field_rules.py saved_page.html ...  # fallback text of saved detail pages
+#
+# The hand-written EDGE_CASES are always checked as well.
+
+AREAS = ["Lekki Phase 1, Lekki, Lagos", "Cooper Road, Ikoyi, Lagos", "Allen Avenue, Ikeja, Lagos", "Yaba, Lagos"]
+KINDS = ["Detached Duplex", "Semi Detached Duplex", "Flat / Apartment", "Terraced Duplex", "Mini Flat"]
+FILLER = ["Home", "Properties", "Agents", "Blog", "Add Listing", "Property Details", "Similar Properties",
+          "Features", "Swimming pool", "24 hours power supply", "Fitted kitchen", "Serviced", "Report this listing",
+          "Safety tips", "Do not pay any inspection fee before viewing the property", "Share", "Save"]
+
+# Texts where a careless rule table drifts from the line loop
+EDGE_CASES = [
+    # str.isdigit takes superscripts where \d does not
+    "Plot of m²\nLand measuring 500m²\nCall ²\nBedrooms ²\nToilets\t2\nToilets ³",
+    # Fill rules keep overwriting while the value they took still says N/A
+    "N/A bedroom\n4 bedroom duplex\n₦ N/A\n₦ 2,500,000\n₦ 3,000,000\nCall N/A 1\nCall 08031234567\n"
+    "Lagos N/A\nLekki Phase 1, Lagos\nPhoto 1 of N/A\n1 of 12",
+    # Every matching line says N/A: the last one is kept
+    "N/A bedroom\nbedroom N/A too\nIkoyi N/A\n₦N/A",
+    "",
+]
+
+
+def legacy_fallback(property_data, text_content):
+    # The original line loop from build_property_data, kept as the reference
+    lines = text_content.split("\n")
+    for line in lines:
+        line = line.strip()
+        if "bedroom" in line.lower() and "N/A" in property_data["Title"]:
+            property_data["Title"] = line
+        if any(x in line for x in ["Lagos", "Lekki", "Ikoyi"]) and "N/A" in property_data["Address"]:
+            property_data["Address"] = line
+        if "₦" in line and "N/A" in property_data["Price"]:
+            property_data["Price"] = line.replace("₦", "").replace(",", "").strip()
+        if any(c.isdigit() for c in line) and "Call" in line and "N/A" in property_data["Contact"]:
+            property_data["Contact"] = line.replace("Call", "").replace("Show Phone", "").strip()
+        if "of" in line and any(c.isdigit() for c in line) and "N/A" in property_data["Photos"]:
+            property_data["Photos"] = line.split("of")[-1].strip()
+        if "Bedrooms" in line and any(c.isdigit() for c in line):
+            property_data["Bedrooms"] = re.search(r'\d+', line).group() if re.search(r'\d+', line) else "N/A"
+        if "Bathrooms" in line and any(c.isdigit() for c in line):
+            property_data["Bathrooms"] = re.search(r'\d+', line).group() if re.search(r'\d+', line) else "N/A"
+        if "Toilets" in line and any(c.isdigit() for c in line):
+            property_data["Toilets"] = re.search(r'\d+', line).group() if re.search(r'\d+', line) else "N/A"
+        if "Parking Spaces" in line and any(c.isdigit() for c in line):
+            property_data["Parking Spaces"] = re.search(r'\d+', line).group() if re.search(r'\d+', line) else "N/A"
+    return property_data
+
+
+def synthetic_page(rng):
+    # Roughly the shape of a detail page's main column: navigation, the listing header,
+    # a specifications table (tab separated cells), a description and page furniture
+    bedrooms = rng.randint(1, 6)
+    lines = rng.sample(FILLER, 6)
+    lines += [
+        f"{bedrooms} Bedroom {rng.choice(KINDS)} for rent",
+        f"  {rng.choice(AREAS)}  ",
+        f"₦{rng.randint(5, 300) * 100000:,} per annum",
+        f"1 of {rng.randint(3, 40)}",
+        f"Call 0803{rng.randint(1000000, 9999999)} Show Phone",
+        "",
+        f"Bedrooms\t{bedrooms}",
+        f"Bathrooms\t{rng.randint(1, bedrooms + 1)}",
+        f"Toilets\t{rng.randint(1, bedrooms + 2)}",
+        f"Parking Spaces\t{rng.randint(0, 6)}",
+        "",
+    ]
+    lines += [" ".join(rng.choices(FILLER, k=rng.randint(4, 20))) for _ in range(rng.randint(5, 30))]
+    lines += rng.sample(FILLER, 8)
+    return "\n".join(lines).strip()
+
+
+def load_texts(html_files):
+    from http_fetch import parse_detail_html
+    texts = []
+    for html_file in html_files:
+        with open(html_file, encoding='utf-8') as f:
+            fallback_text = parse_detail_html(f.read())["fallback_text"]
+        if fallback_text:
+            texts.append(fallback_text.strip())
+    return texts
+
+
+def check(texts):
+    for text in texts:
+        expected = legacy_fallback(empty_property_data("x"), text)
+        actual = merge_fallback(empty_property_data("x"), parse_fallback_text(text))
+        if expected != actual:
+            raise AssertionError(f"rule table disagrees with the line loop on {text!r}:\n{expected}\n{actual}")
+
+
+def run(texts, repeat):
+    check(EDGE_CASES)
+    check(texts)
+
+    legacy = min(timeit.repeat(lambda: [legacy_fallback(empty_property_data("x"), t) for t in texts],
+                               number=1, repeat=repeat))
+    rules = min(timeit.repeat(lambda: [merge_fallback(empty_property_data("x"), parse_fallback_text(t)) for t in texts],
+                              number=1, repeat=repeat))
+    lines = sum(text.count("\n") + 1 for text in texts)
+    print(f"{len(texts)} pages, {lines} lines, outputs identical")
+    print(f"line loop:  {legacy * 1e6 / len(texts):8.1f} us/page")
+    print(f"rule table: {rules * 1e6 / len(texts):8.1f} us/page ({legacy / rules:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the field rule table against the old line loop")
+    parser.add_argument("html_files", nargs="*", help="saved detail pages; default: synthetic pages")
+    parser.add_argument("--pages", type=int, default=2000, help="number of synthetic pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    texts = load_texts(args.html_files) if args.html_files else [synthetic_page(rng) for _ in range(args.pages)]
+    run(texts, args.repeat)
@@ -0,0 +1,248 @@
+import subprocess
+import tempfile
+import argparse
+import resource
+import asyncio
+import shutil
+import math
+import json
+import time
+import sys
+import os
+from fixture_site import FixtureSite
+from timing import timings
+
+# Offline benchmark: crawls fixture_site.py (generated or recorded pages, with injected
+# latency and errors) and reports listings/sec, p50/p95 per-listing latency, peak RSS
+# and bytes written for each scenario. Every scenario runs in a fresh process with its
+# own state directory, so peak RSS and I/O are its own.
+#
+#   python benchmark.py --scenarios http sharded --save-baseline bench_baseline.json
+#   ... make a change ...
+#   python benchmark.py --scenarios http sharded --baseline bench_baseline.json
+#
+# With --baseline the run fails (exit status 1) when a scenario is worse than the
+# baseline by more than --threshold.
+
+SCENARIOS = {
+    "crawl": "scrape_all_properties over every result page, in one headless browser",
+    "detail": "scrape_detail_page over every listing, one after another",
+    "http": "async crawl with the HTTP backend",
+    "sharded": "sharded crawl with the HTTP backend",
+}
+# metric -> whether higher is better
+COMPARED = {"listings_per_sec": True, "p50_ms": False, "p95_ms": False, "peak_rss_mb": False, "bytes_written_mb": False}
+
+
+class Discard:
+    # stdout sink that makes no write syscalls, so bytes written only counts the crawl's I/O
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def percentile(values, q):
+    # Nearest-rank percentile
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def bytes_written():
+    # write() syscall bytes of this process, from /proc (Linux); None elsewhere
+    try:
+        with open("/proc/self/io") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("wchar:"))
+    except (OSError, StopIteration):
+        return None
+
+
+def bench_target(spec):
+    from targets import parse_targets
+    target = parse_targets([f"{spec['base_url']}/for-rent/lagos"], "state")[0]
+    target.prepare()
+    return target
+
+
+def run_crawl(spec):
+    from crawler import scrape_targets
+    from storage import count_csv_rows
+    target = bench_target(spec)
+    scrape_targets([target], headless=True, rate_per_host=spec["rate"])
+    return count_csv_rows(target.csv_file)
+
+
+def run_detail(spec):
+    from playwright.sync_api import sync_playwright
+    from crawler import scrape_detail_page
+    from browser_pool import PagePool
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            pages = PagePool(browser)
+            return sum(1 for url in spec["urls"] if scrape_detail_page(pages, url))
+        finally:
+            browser.close()
+
+
+def run_http(spec):
+    from async_scraper import scrape_targets_async
+    from storage import count_csv_rows
+    target = bench_target(spec)
+    asyncio.run(scrape_targets_async([target], spec["concurrency"], spec["rate"], True, backend="http"))
+    return count_csv_rows(target.csv_file)
+
+
+def run_sharded(spec):
+    from sharded import run_sharded as crawl_sharded
+    from storage import count_csv_rows
+    target = bench_target(spec)
+    crawl_sharded(target, spec["shards"], "http", True, rate_per_host=spec["rate"], timings_file="timings.jsonl")
+    return count_csv_rows(target.csv_file)
+
+
+RUNNERS = {"crawl": run_crawl, "detail": run_detail, "http": run_http, "sharded": run_sharded}
+
+
+def run_child(spec):
+    # Runs inside the scenario's own process, with the scenario's work directory as cwd
+    real_stdout = sys.stdout
+    sys.stdout = Discard()
+    timings.configure("timings.jsonl")
+    written = bytes_written()
+    started = time.perf_counter()
+    listings = RUNNERS[spec["scenario"]](spec)
+    elapsed = time.perf_counter() - started
+    timings.close()
+    written = bytes_written() - written if written is not None else None
+
+    # Per-listing latency: the total of every detail page's PhaseTimer (timings.jsonl)
+    latencies = []
+    if os.path.exists("timings.jsonl"):
+        with open("timings.jsonl", encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry.get("kind") == "detail":
+                    latencies.append(entry["total"])
+    # ru_maxrss is in KiB on Linux; for sharded runs the workers' peak is the children's
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    result = {
+        "listings": listings,
+        "seconds": round(elapsed, 3),
+        "listings_per_sec": round(listings / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "bytes_written_mb": round(written / 2 ** 20, 3) if written is not None else None,
+    }
+    real_stdout.write(json.dumps(result) + "\n")
+
+
+def run_scenario(scenario, spec):
+    workdir = tempfile.mkdtemp(prefix=f"bench-{scenario}-")
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", json.dumps({**spec, "scenario": scenario})],
+            cwd=workdir, capture_output=True, text=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH")]))},
+        )
+        if completed.returncode != 0:
+            # The exception line of the traceback (Playwright appends a banner after it)
+            lines = completed.stderr.strip().splitlines() or ["failed"]
+            return {"error": next((line for line in reversed(lines) if "Error:" in line or "Exception:" in line), lines[-1])}
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, threshold):
+    # -> list of regression messages
+    regressions = []
+    for scenario, result in results.items():
+        before = baseline.get("results", {}).get(scenario)
+        if not before or "error" in before:
+            continue
+        if "error" in result:
+            regressions.append(f"{scenario}: failed ({result['error']})")
+            continue
+        if result["listings"] != before["listings"]:
+            regressions.append(f"{scenario}: {result['listings']} listings, baseline {before['listings']}")
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -threshold) if higher_is_better else (change > threshold):
+                regressions.append(f"{scenario}: {metric} {new} vs baseline {old} ({change:+.0%})")
+    return regressions
+
+
+def print_report(results):
+    columns = ["listings", "seconds", "listings_per_sec", "p50_ms", "p95_ms", "peak_rss_mb", "bytes_written_mb"]
+    print(f"{'scenario':<10}" + "".join(f"{name:>18}" for name in columns))
+    for scenario, result in results.items():
+        if "error" in result:
+            print(f"{scenario:<10}  failed: {result['error']}")
+        else:
+            print(f"{scenario:<10}" + "".join(f"{str(result.get(name)):>18}" for name in columns))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        run_child(json.loads(sys.argv[2]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against a local fixture site")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--pages", type=int, default=5, help="result pages on the fixture site")
+    parser.add_argument("--per-page", type=int, default=20)
+    parser.add_argument("--recorded", default=None, metavar="DIR", help="serve these recorded detail pages (a snapshot store) instead of generated ones")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds the site adds to every response")
+    parser.add_argument("--errors", type=float, default=0.02, help="fraction of responses that are 500s")
+    parser.add_argument("--unavailable", type=float, default=0.0, help="fraction of responses that are 503s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-per-host", type=float, default=1000.0, help="crawler rate limit; high so the crawler, not politeness, is measured")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--baseline", default=None, help="compare against the results saved in this file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression per metric")
+    parser.add_argument("--save-baseline", default=None, metavar="FILE", help="save this run's results as a baseline")
+    args = parser.parse_args()
+
+    fixture = {"pages": args.pages, "per_page": args.per_page, "recorded": args.recorded, "latency": args.latency,
+               "errors": args.errors, "unavailable": args.unavailable, "seed": args.seed}
+    results = {}
+    for scenario in args.scenarios:
+        # A fresh site per scenario, so every scenario sees the same injected errors
+        site = FixtureSite(args.pages, args.per_page, unavailable=args.unavailable, errors=args.errors,
+                           latency=args.latency, seed=args.seed, recorded=args.recorded)
+        base_url = site.start()
+        spec = {"base_url": base_url, "urls": site.listing_urls(base_url), "rate": args.rate_per_host,
+                "concurrency": args.concurrency, "shards": args.shards}
+        print(f"Running {scenario}: {SCENARIOS[scenario]}")
+        try:
+            results[scenario] = run_scenario(scenario, spec)
+        finally:
+            site.stop()
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({"fixture": fixture, "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("fixture") != fixture:
+            print(f"Warning: baseline was recorded with a different fixture: {baseline.get('fixture')}")
+        regressions = compare(results, baseline, args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,153 @@
+from urllib.parse import urlparse
+import asyncio
+from metrics import metrics
+
+# Browser pages reused across listings, with request routing that drops what the
+# extractors never look at.
+#
+# Opening a page per listing costs a renderer setup each time, and a photo-heavy
+# listing pulls megabytes of images plus fonts, ads and trackers. Every page of a pool
+# lives in one browser context whose routes abort:
+# - images, media and fonts, from any host (the photo count comes from the page text)
+# - every third-party request (scripts, trackers, ad frames), i.e. anything not on
+#   the listing site's domain or its subdomains
+# Routing turns off Playwright's HTTP cache for the context; what is left to load is
+# the documents and the site's own scripts and stylesheets.
+#
+# A page goes back to the pool after a scrape and is closed instead after a failed
+# navigation (it may be stuck) or after max_uses listings (renderer memory creeps up).
+
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+
+def site_of(url):
+    # Registrable-ish domain of a URL: the host without a leading "www."
+    host = urlparse(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_first_party(url, site):
+    host = urlparse(url).hostname or ""
+    return host == site or host.endswith(f".{site}")
+
+
+def should_block(request):
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    try:
+        frame = request.frame
+        if request.is_navigation_request() and frame.parent_frame is None:
+            # The page itself (or a redirect of it)
+            return False
+        site = site_of(frame.page.main_frame.url)
+    except Exception:
+        # e.g. service worker requests, which have no frame
+        return False
+    return bool(site) and not is_first_party(request.url, site)
+
+
+def block_resources(context):
+    def handle(route):
+        if should_block(route.request):
+            metrics.inc("blocked_requests")
+            route.abort()
+        else:
+            route.continue_()
+    context.route("**/*", handle)
+
+
+async def block_resources_async(context):
+    async def handle(route):
+        if should_block(route.request):
+            metrics.inc("blocked_requests")
+            await route.abort()
+        else:
+            await route.continue_()
+    await context.route("**/*", handle)
+
+
+class PagePool:
+    # Playwright sync API. The sync crawl scrapes one listing at a time, so one idle
+    # page is kept by default.
+    def __init__(self, browser, size=1, block=True, max_uses=100):
+        self.context = browser.new_context()
+        if block:
+            block_resources(self.context)
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = []
+        self.uses = {}
+
+    def new_page(self):
+        # A page of the pool's context that the caller owns (e.g. for search results)
+        return self.context.new_page()
+
+    def acquire(self):
+        return self.idle.pop() if self.idle else self.context.new_page()
+
+    def release(self, page, reuse=True):
+        uses = self.uses.pop(page, 0) + 1
+        if reuse and uses < self.max_uses and len(self.idle) < self.size:
+            self.uses[page] = uses
+            self.idle.append(page)
+        else:
+            page.close()
+
+    def close(self):
+        self.context.close()
+
+
+class AsyncPagePool:
+    # Playwright async API: at most `size` pages in use at once, shared by the detail
+    # workers. The browser is launched lazily, so the HTTP backend only pays for
+    # Chromium if a page actually needs JavaScript.
+    def __init__(self, playwright, size, headless=True, block=True, max_uses=100):
+        self.playwright = playwright
+        self.size = max(1, size)
+        self.headless = headless
+        self.block = block
+        self.max_uses = max_uses
+        self.browser = None
+        self.context = None
+        self.idle = []
+        self.uses = {}
+        self.slots = asyncio.Semaphore(self.size)
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        async with self.lock:
+            if self.browser is None:
+                self.browser = await self.playwright.chromium.launch(headless=self.headless)
+                self.context = await self.browser.new_context()
+                if self.block:
+                    await block_resources_async(self.context)
+        return self.context
+
+    async def new_page(self):
+        # A page of the pool's context that the caller owns (e.g. for search results)
+        return await (await self.start()).new_page()
+
+    async def acquire(self):
+        context = await self.start()
+        await self.slots.acquire()
+        try:
+            return self.idle.pop() if self.idle else await context.new_page()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    async def release(self, page, reuse=True):
+        try:
+            uses = self.uses.pop(page, 0) + 1
+            if reuse and uses < self.max_uses:
+                self.uses[page] = uses
+                self.idle.append(page)
+            else:
+                await page.close()
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+            self.browser = None
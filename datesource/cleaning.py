@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+import argparse
+
+# Batch cleaning and feature engineering for scraped listings. Every step works on
+# whole columns (pandas string methods, NumPy arithmetic, dict lookups via .map);
+# there is no per-row apply.
+
+MISSING = ["N/A", "", "nan"]
+ROOM_COLUMNS = ["Bedrooms", "Bathrooms", "Toilets", "Parking Spaces"]
+# Room counts above this are listing typos (e.g. a price typed into Bedrooms)
+MAX_ROOMS = 30
+
+PRICE_UNITS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "mil": 1e6, "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9}
+# Multiplier that turns a price for the period into a yearly one
+PERIODS_PER_YEAR = {"annum": 1, "year": 1, "month": 12, "week": 52, "day": 365, "night": 365}
+PERIOD_PATTERN = r"(?:per|/|a)\s*(annum|year|yr|month|mth|week|day|night)|\b(pa|p\.a)\b"
+PERIOD_ALIASES = {"yr": "year", "mth": "month", "pa": "annum", "p.a": "annum"}
+
+# Best-effort Lagos area -> Local Government Area lookup, keyed by lowercase area name
+LAGOS_LGAS = {
+    "Eti-Osa": ["lekki", "ikoyi", "victoria island (vi)", "victoria island", "vi", "ajah", "banana island",
+                "oniru", "chevron", "osapa", "osapa london", "ikota", "sangotedo", "lekki phase 1", "ikate",
+                "agungi", "jakande", "badore", "oke-ira", "ilasan", "idado", "igbo efon", "orchid", "vgc", "eko atlantic city",
+                "dolphin estate", "parkview estate", "ologolo", "thomas estate", "abraham adesanya"],
+    "Ibeju-Lekki": ["ibeju lekki", "ibeju-lekki", "awoyaya", "eleko", "lakowe", "abijo", "bogije", "lekki free trade zone"],
+    "Ikeja": ["ikeja", "ikeja gra", "gra ikeja", "allen avenue", "opebi", "alausa", "oregun", "maryland", "ojodu", "omole", "adeniyi jones"],
+    "Kosofe": ["magodo", "ketu", "ogudu", "ojota", "anthony", "gbagada", "ikosi", "isheri", "isheri north"],
+    "Surulere": ["surulere", "aguda", "ijesha", "itire"],
+    "Lagos Mainland": ["yaba", "ebute metta", "abule ijesha", "iwaya", "onike", "akoka"],
+    "Shomolu": ["shomolu", "somolu", "bariga", "palmgrove", "onipanu"],
+    "Mushin": ["mushin", "ilupeju", "idi araba", "papa ajao"],
+    "Oshodi-Isolo": ["oshodi", "isolo", "ejigbo", "ajao estate", "okota", "mafoluku"],
+    "Alimosho": ["ikotun", "egbeda", "idimu", "ipaja", "ayobo", "igando", "akowonjo", "abule egba", "gowon estate"],
+    "Ifako-Ijaiye": ["ogba", "ifako", "ijaiye", "agege", "iju", "ishaga", "alagbado"],
+    "Amuwo-Odofin": ["amuwo odofin", "festac", "satellite town", "mile 2", "ago palace"],
+    "Apapa": ["apapa"],
+    "Lagos Island": ["lagos island", "obalende", "ikoyi-obalende"],
+    "Ikorodu": ["ikorodu"],
+    "Ojo": ["ojo", "alaba", "iba"],
+    "Badagry": ["badagry"],
+    "Epe": ["epe"],
+}
+AREA_TO_LGA = {area: lga for lga, areas in LAGOS_LGAS.items() for area in areas}
+# Addresses often name the LGA itself ("Alimosho, Lagos")
+AREA_TO_LGA.update({lga.lower(): lga for lga in LAGOS_LGAS})
+
+
+def to_missing(df):
+    return df.replace(MISSING, np.nan)
+
+
+def on_uniques(series, parse):
+    # Titles, addresses and prices repeat heavily across listings, so parse each
+    # distinct value once (with Arrow-backed string kernels) and broadcast back
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    parsed = parse(pd.Series(uniques, dtype="string[pyarrow]"))
+    taken = codes.copy()
+    taken[codes < 0] = len(uniques)
+    if isinstance(parsed, tuple):
+        return tuple(broadcast(part, taken) for part in parsed)
+    return broadcast(parsed, taken)
+
+
+def broadcast(part, taken):
+    # Row i gets part[taken[i]]; taken == len(part) marks a missing input
+    extended = pd.concat([part.reset_index(drop=True), pd.Series([pd.NA], dtype=part.dtype)], ignore_index=True)
+    return extended.take(taken).reset_index(drop=True)
+
+
+def parse_price(price):
+    # "2500000", "₦2,500,000 per annum", "1.5 million", "150k / month" ->
+    # (amount in naira, period, yearly amount). Periodless prices are taken as stated.
+    text = price.astype("string").str.lower().str.replace(r"[₦,]", "", regex=True).str.strip()
+    number = text.str.extract(r"(\d+(?:\.\d+)?)\s*(k|thousand|million|mil|billion|bn|m|b)?\b", expand=True)
+    amount = pd.to_numeric(number[0], errors="coerce") * number[1].map(PRICE_UNITS).fillna(1).astype(float)
+    period_match = text.str.extract(PERIOD_PATTERN, expand=True)
+    period = period_match[0].fillna(period_match[1]).replace(PERIOD_ALIASES)
+    yearly = amount * period.map(PERIODS_PER_YEAR).fillna(1).astype(float)
+    return amount, period.astype("string"), yearly
+
+
+def parse_address(address):
+    # "Cooper Road, Ikoyi, Lagos" -> street "Cooper Road", area "Ikoyi", city "Lagos", LGA "Eti-Osa"
+    parts = address.astype("string").str.split(",")
+    count = parts.str.len()
+    city = parts.str[-1].str.strip()
+    area = parts.str[-2].str.strip().where(count >= 2)
+    street = parts.str[:-2].str.join(",").str.strip().where(count >= 3)
+    street = street.where(street != "")
+    lga = area.str.lower().map(AREA_TO_LGA)
+    # Some listings name the LGA-level area itself as the city (e.g. "Lekki")
+    lga = lga.fillna(city.str.lower().map(AREA_TO_LGA))
+    return street.astype("string"), area.astype("string"), lga.astype("string"), city.astype("string")
+
+
+def clean_rooms(df):
+    out = {}
+    for name in ROOM_COLUMNS:
+        rooms = on_uniques(df[name], to_number).round()
+        out[name] = rooms.where((rooms >= 0) & (rooms <= MAX_ROOMS)).astype("Int16")
+    # Bedrooms missing from the specifications are usually in the title ("4 bedroom flat")
+    from_title = on_uniques(df["Title"], lambda title: to_number(title.str.extract(r"(\d+)\s*bedroom", expand=False)))
+    out["Bedrooms"] = out["Bedrooms"].fillna(from_title.where(from_title <= MAX_ROOMS).astype("Int16"))
+    return out
+
+
+def clean_listings(df):
+    df = to_missing(df).drop_duplicates(subset="Link", keep="last").reset_index(drop=True)
+    out = pd.DataFrame(index=df.index)
+    for name in ["Title", "Address", "Description", "Contact", "Link"]:
+        out[name] = df[name].astype("string[pyarrow]")
+
+    out["Price"], out["price_period"], out["price_yearly"] = on_uniques(df["Price"], parse_price)
+    out["Street"], out["Area"], out["LGA"], out["City"] = on_uniques(df["Address"], parse_address)
+    for name, values in clean_rooms(df).items():
+        out[name] = values
+    out["Photos"] = on_uniques(df["Photos"], to_number).round().astype("Int16")
+    out["listing_type"] = listing_type(out["Link"], df["Title"])
+    out["property_type"] = on_uniques(df["Title"], property_type)
+    for name in ["price_period", "Area", "LGA", "City", "property_type"]:
+        out[name] = out[name].astype("category")
+    return out
+
+
+def to_number(values):
+    return pd.to_numeric(values, errors="coerce").astype("Float64")
+
+
+def listing_type(link, title):
+    # Links are unique, so use Arrow substring kernels rather than a regex per row
+    kinds = ["for-rent", "for-sale", "short-let"]
+    from_link = np.select([link.str.contains(f"/{kind}/", regex=False).fillna(False).to_numpy(bool) for kind in kinds],
+                          kinds, default="")
+    from_title = on_uniques(title, lambda t: "for-" + t.str.lower().str.extract(r"for (rent|sale)", expand=False))
+    return pd.Series(from_link, dtype="string").replace("", pd.NA).fillna(from_title).astype("category")
+
+
+def property_type(title):
+    # "4 bedroom detached duplex for sale" -> "detached duplex"
+    return (
+        title.str.lower()
+        .str.replace(r"^\d+\s*bedroom\s*", "", regex=True)
+        .str.replace(r"\s*for (rent|sale)$", "", regex=True)
+        .str.strip()
+    )
+
+
+def load_and_clean(csv_files):
+    frames = [pd.read_csv(csv_file, dtype=str, keep_default_na=False, encoding='utf-8') for csv_file in csv_files]
+    return clean_listings(pd.concat(frames, ignore_index=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean scraped listings and add parsed price/location features")
+    parser.add_argument("csv_files", nargs="+")
+    parser.add_argument("--out", default="properties_clean.parquet", help=".parquet or .csv output file")
+    args = parser.parse_args()
+    cleaned = load_and_clean(args.csv_files)
+    if args.out.endswith(".parquet"):
+        cleaned.to_parquet(args.out, index=False)
+    else:
+        cleaned.to_csv(args.out, index=False)
+    print(f"Cleaned {len(cleaned)} listings into {args.out}")
@@ -0,0 +1,368 @@
+from playwright.sync_api import sync_playwright
+from datetime import datetime
+import time
+import os
+import asyncio
+import argparse
+from storage import PropertyJournal
+from seen_index import SeenIndex, card_fingerprint, persist_record
+from readiness import goto_ready, SEARCH_READY_SELECTOR, DETAIL_READY_SELECTOR, FIELD_TIMEOUTS
+from timing import PhaseTimer, timings
+from metrics import metrics
+from extract import EXTRACT_JS, EXTRACT_ARGS, DESCRIPTION_XPATH, build_property_data
+from targets import parse_targets, DEFAULT_TARGETS
+from sites import load_sites, DEFAULT_SITE
+from async_scraper import scrape_targets_async
+from sharded import run_sharded
+from snapshots import open_store, save_snapshot
+from scheduler import AdaptiveRateLimiter, CrawlScheduler, ListingBudget, Throttled, backoff_delay
+from browser_pool import PagePool
+
+def scrape_targets(targets, headless=True, rate_per_host=1.0, max_listings=5000, block_resources=True, refresh=False):
+    # All targets run one after another in the same browser instance, and share
+    # one scheduler so a struggling host is slowed down across targets
+    scheduler = CrawlScheduler(AdaptiveRateLimiter(rate_per_host))
+    with sync_playwright() as p:
+        # Launch browser (--headed for debugging)
+        browser = p.chromium.launch(headless=headless)
+        try:
+            for target in targets:
+                print(f"Crawling target {target.name}")
+                try:
+                    scrape_all_properties(browser, target, scheduler, max_listings, block_resources, refresh)
+                except Exception as e:
+                    print(f"Target {target.name} failed: {e}")
+        finally:
+            # Close the browser
+            browser.close()
+
+def scrape_all_properties(browser, target, scheduler=None, max_listings=5000, block_resources=True, refresh=False):
+    # Crawl one target's search results in the shared browser, reusing a pool of pages
+    # that skip images, fonts and third-party requests. Records are journaled as they
+    # are scraped rather than kept in memory, and max_listings is enforced on a counter
+    # (existing rows + listings journaled by this crawl).
+    # refresh: walk every result page from page 1 without touching the resume
+    # checkpoint, fetch only listings whose card is new or changed price or title, and
+    # record price/availability history (see async_scraper.crawl_search_pages).
+    pass_started = datetime.now().isoformat(timespec='seconds')
+    pages = PagePool(browser, block=block_resources)
+    page = pages.new_page()
+    
+    search_url = target.search_url
+    print(f"Navigating to search page: {search_url} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # Wait until the listing cards are in the DOM rather than sleeping
+    timer = PhaseTimer(search_url, "search")
+    try:
+        goto_ready(page, search_url, SEARCH_READY_SELECTOR, timer)
+    except Exception as e:
+        print(f"Navigation failed: {e}")
+        pages.close()
+        return
+    timer.log()
+    print(f"Search page ready in {timer.summary()}")
+    
+    # New properties are appended to a journal; properties.csv is only rewritten on compaction
+    csv_file = target.csv_file
+    journal = PropertyJournal(csv_file)
+    print(f"Found {len(journal)} existing properties for {csv_file}")
+    
+    # Index of already-scraped links, so unchanged listings are not fetched again
+    seen = SeenIndex(target.seen_db)
+    seen.bootstrap_from_csv(csv_file)
+    snapshots = open_store(target.snapshot_dir)
+    
+    # Load last scraped page
+    last_page_file = target.last_page_file
+    start_page = 1
+    if not refresh and os.path.exists(last_page_file):
+        try:
+            with open(last_page_file, 'r') as f:
+                start_page = int(f.read().strip()) + 1
+            print(f"Resuming from page {start_page}")
+        except Exception as e:
+            print(f"Failed to read last page: {e}")
+            start_page = 1
+    
+    page_number = start_page
+    collected = 0 if refresh else len(journal)
+    budget = ListingBudget(max_listings - collected)
+    complete = False
+    scheduler = scheduler or CrawlScheduler()
+    
+    # Navigate to starting page
+    if page_number > 1:
+        timer = PhaseTimer(target.page_url(page_number), "search")
+        try:
+            goto_ready(page, timer.url, SEARCH_READY_SELECTOR, timer)
+            timer.log()
+        except Exception as e:
+            print(f"Failed to navigate to page {page_number}: {e}")
+            seen.close()
+            pages.close()
+            return
+    
+    while True:
+        if collected >= max_listings:
+            print(f"Reached max listings limit ({max_listings})")
+            break
+        
+        print(f"Scraping page {page_number}")
+        
+        # Extract detail links from current page
+        detail_links = []
+        try:
+            with metrics.time("search_links"):
+                cards = search_page_cards(page, target.base_url)
+            for url, card_text in cards:
+                detail_links.append((url, card_text, card_fingerprint(card_text)))
+            print(f"Found {len(detail_links)} listings on page {page_number}")
+        except Exception as e:
+            print(f"Failed to extract links on page {page_number}: {e}")
+        
+        # Skip listings whose search card has not changed since they were scraped
+        to_scrape = []
+        for detail_url, card_text, card_fp in detail_links:
+            status = seen.refresh_status(detail_url, card_text) if refresh else seen.should_scrape(detail_url, card_fp)
+            if status:
+                to_scrape.append((detail_url, card_text))
+                if refresh:
+                    print(f"Refreshing listing ({status}): {detail_url}")
+            else:
+                print(f"Skipping unchanged listing: {detail_url}")
+        
+        # Scrape the detail pages at the scheduler's pace; failed ones are retried after the rest.
+        # Each record is journaled as soon as it is scraped.
+        cards = dict(to_scrape)
+
+        def write_record(detail_url, property_data):
+            nonlocal collected
+            metrics.record_fields(property_data)
+            # Append to the journal only if the content changed; it is flushed in batches
+            try:
+                if persist_record(journal, seen, detail_url, cards[detail_url], property_data):
+                    collected += 1
+                else:
+                    # Not a new listing after all: its fetch does not count
+                    budget.give_back()
+            except Exception as e:
+                print(f"Failed to journal property: {e}")
+
+        # A listing is only started while the budget allows (max_listings)
+        budget.start_batch()
+        scheduler.run(list(cards), lambda url: scrape_detail_page(pages, url, snapshots), on_result=write_record,
+                      admit=budget.admit, on_give_up=lambda url: budget.give_back())
+        
+        # Flush the journal before checkpointing the page and the seen index
+        try:
+            with metrics.time("persist"):
+                journal.flush()
+                seen.commit()
+        except Exception as e:
+            print(f"Failed to flush journal: {e}")
+        print(f"Total properties collected so far: {collected}")
+        metrics.write()
+        
+        if budget.refused:
+            # Not checkpointed: the next run starts with this page again
+            print(f"Reached max listings limit; leaving the rest of page {page_number}")
+            break
+        
+        if scheduler.gave_up(target.search_url):
+            # The page is not checkpointed, so the next run starts with it again
+            print(f"Stopping {target.name}: the site keeps failing")
+            break
+        
+        # Save current page number
+        if not refresh:
+            try:
+                with open(last_page_file, 'w') as f:
+                    f.write(str(page_number))
+                print(f"Saved page {page_number} to {last_page_file}")
+            except Exception as e:
+                print(f"Failed to save page number: {e}")
+        
+        # Check for next page
+        next_page_elem = page.locator("a.pagination-next, a[rel='next']").first
+        if next_page_elem.count() > 0:
+            next_url = next_page_elem.get_attribute("href")
+            print(f"Next page URL: {next_url}")
+            if next_url:
+                for attempt in range(3):
+                    timer = PhaseTimer(f"{target.base_url}{next_url}", "search")
+                    try:
+                        goto_ready(page, timer.url, SEARCH_READY_SELECTOR, timer)
+                        timer.log()
+                        page_number += 1
+                        break
+                    except Exception as e:
+                        print(f"Next page navigation failed (attempt {attempt + 1}/3): {e}")
+                        time.sleep(max(backoff_delay(attempt), getattr(e, "retry_after", None) or 0))
+                else:
+                    print("Failed to navigate to next page after retries")
+                    break
+            else:
+                print("No next page URL found")
+                complete = True
+                break
+        else:
+            print("No next page button found")
+            complete = True
+            break
+    
+    if refresh and complete and collected < max_listings:
+        print(f"Refresh of {target.name} complete: {seen.mark_delisted(pass_started)} listings delisted")
+    
+    # Final save: merge the journal into properties.csv
+    if len(journal):
+        try:
+            with metrics.time("persist"):
+                journal.compact()
+            print(f"Final save: {len(journal)} properties to {csv_file}")
+        except Exception as e:
+            print(f"Final CSV save failed: {e}")
+    else:
+        print("No properties found")
+    
+    seen.close()
+    pages.close()
+
+def search_page_cards(page, base_url):
+    # (detail URL, card text) for each listing card on the loaded search page
+    cards = []
+    listings = page.locator(".wp-block-content").all()
+    for listing in listings:
+        link = listing.locator("a:has(h4.content-title)").get_attribute("href") if listing.locator("a:has(h4.content-title)").count() > 0 else None
+        if link:
+            cards.append((f"{base_url}{link}", listing.inner_text()))
+    return cards
+
+def scrape_detail_page(pages, url, snapshots=None):
+    # pages: a browser_pool.PagePool; the page goes back to it unless navigation failed
+    print(f"Scraping detail page: {url}")
+    page = pages.acquire()
+    timer = PhaseTimer(url)
+    try:
+        goto_ready(page, url, DETAIL_READY_SELECTOR, timer)
+    except Throttled:
+        # Raised so the scheduler can slow down for this host
+        timer.log()
+        pages.release(page)
+        raise
+    except Exception as e:
+        print(f"Detail page navigation failed: {e}")
+        timer.log()
+        pages.release(page, reuse=False)
+        return None
+    
+    # Give the description a moment to render, then read every field in one round-trip
+    with timer.phase("extract"):
+        try:
+            page.wait_for_selector(f"xpath={DESCRIPTION_XPATH}", timeout=FIELD_TIMEOUTS["description"])
+        except Exception as e:
+            print(f"Description XPath wait failed: {e}")
+        try:
+            raw = page.evaluate(EXTRACT_JS, EXTRACT_ARGS)
+        except Exception as e:
+            print(f"Page extraction failed: {e}")
+            raw = {}
+    
+    # Keep the rendered HTML so extraction fixes can be re-run without crawling
+    if snapshots is not None:
+        with timer.phase("snapshot"):
+            try:
+                save_snapshot(snapshots, url, page.content())
+            except Exception as e:
+                print(f"Snapshot failed: {e}")
+    
+    with timer.phase("parse"):
+        property_data = build_property_data(raw, url)
+    
+    # Hand the page back for the next listing
+    pages.release(page)
+    timer.log()
+    print(f"Detail page timings: {timer.summary()}")
+    
+    return property_data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl nigeriapropertycentre.com search results into per-target CSVs")
+    parser.add_argument("targets", nargs="*", help=f"search targets as <listing-type>/<place> slugs, <site>:<slug> for another site (see --sites) or full search URLs (default: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--state-dir", default="state", help="directory holding one state folder (CSV, last page, seen index) per target")
+    parser.add_argument("--headed", action="store_true", help="show the browser window, for debugging")
+    parser.add_argument("--load-resources", action="store_true", help="let browser pages load images, fonts and third-party scripts (blocked by default)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="crawl all targets concurrently and scrape detail pages with playwright.async_api")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of concurrent detail workers in async mode, shared fairly by all sites and targets")
+    parser.add_argument("--rate-per-host", type=float, default=1.0, help="max detail pages started per second per host; the crawl slows down below this when the site struggles or throttles")
+    parser.add_argument("--backend", choices=["browser", "http"], default="browser", help="http fetches pages with a pooled HTTP client and only uses the browser for pages that need JavaScript (implies --async)")
+    parser.add_argument("--shards", type=int, default=0, help="split each target's result pages across this many worker processes, each with its own browser or HTTP client")
+    parser.add_argument("--max-pages", type=int, default=None, help="in sharded mode, crawl at most this many result pages per target")
+    parser.add_argument("--refresh", action="store_true", help="re-walk every result page and fetch only new listings and those whose card shows a new price or title; records price/availability history (see seen_index.py)")
+    parser.add_argument("--max-listings", type=int, default=5000, help="stop a target once it holds this many properties (safety limit; not applied in sharded mode)")
+    parser.add_argument("--no-snapshots", action="store_true", help="do not save each detail page's HTML under state/<target>/snapshots/ (see snapshots.py to re-extract from them)")
+    parser.add_argument("--metrics", default=None, metavar="FILE", help="append crawl metrics snapshots (stage latencies, pages per minute, retries, field hit rates) to this JSON-lines file (default: <state-dir>/metrics.jsonl)")
+    parser.add_argument("--timings", default=None, metavar="FILE", help="append every page's phase timings to this JSON-lines file (default: <state-dir>/timings.jsonl)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="also serve the metrics in Prometheus text format on this port")
+    parser.add_argument("--parquet", default=None, metavar="DIR", help="after crawling, also export every target to a typed Parquet dataset partitioned by listing type and scrape date")
+    parser.add_argument("--sites", default=None, metavar="FILE", help="JSON file of selector-based site adapters to crawl besides nigeriapropertycentre.com, each with its own rate limit and concurrency cap (see sites.py); their targets are crawled in async mode")
+    parser.add_argument("--index", default=None, metavar="DIR", help="after crawling, bring this query index up to date with every target's listings (see query_index.py)")
+    args = parser.parse_args(argv)
+    if args.refresh and args.shards:
+        parser.error("--refresh walks the result pages in order and cannot be sharded")
+    if args.sites:
+        load_sites(args.sites)
+    
+    targets = parse_targets(args.targets, args.state_dir)
+    # Only the async crawl reads other sites' pages through their adapters
+    other_sites = sorted({target.site.name for target in targets} - {DEFAULT_SITE})
+    if other_sites and args.shards:
+        parser.error(f"sharded mode only crawls {DEFAULT_SITE}; not {', '.join(other_sites)}")
+    if other_sites:
+        args.use_async = True
+    for target in targets:
+        if args.no_snapshots:
+            target.snapshot_dir = None
+        target.prepare()
+    print(f"Targets: {', '.join(target.name for target in targets)}")
+    
+    metrics.configure(args.metrics or os.path.join(args.state_dir, "metrics.jsonl"))
+    timings.configure(args.timings or os.path.join(args.state_dir, "timings.jsonl"))
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    headless = not args.headed
+    block_resources = not args.load_resources
+    
+    try:
+        if args.shards:
+            for target in targets:
+                run_sharded(target, args.shards, args.backend, headless, max_pages=args.max_pages,
+                            rate_per_host=args.rate_per_host, metrics_file=metrics.metrics_file,
+                            block_resources=block_resources, timings_file=timings.path)
+        elif args.use_async or args.backend == "http":
+            asyncio.run(scrape_targets_async(targets, args.concurrency, args.rate_per_host, headless,
+                                             backend=args.backend, max_listings=args.max_listings,
+                                             block_resources=block_resources, refresh=args.refresh))
+        else:
+            scrape_targets(targets, headless, args.rate_per_host, args.max_listings, block_resources, args.refresh)
+    except Exception as e:
+        print(f"General error: {e}")
+    metrics.write()
+    timings.close()
+    
+    if args.parquet:
+        try:
+            # Imported here so plain CSV crawls do not need pyarrow installed
+            from parquet_store import export_csvs
+            export_csvs([(target.csv_file, target.listing_type) for target in targets], args.parquet)
+        except Exception as e:
+            print(f"Parquet export failed: {e}")
+
+    if args.index:
+        try:
+            from query_index import update
+            update(args.index, [target.csv_file for target in targets])
+        except Exception as e:
+            print(f"Index update failed: {e}")
+
+if __name__ == "__main__":
+    main()
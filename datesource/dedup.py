@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+import argparse
+import time
+
+# Near-duplicate detection for cleaned listings (see cleaning.py). Agents repost the
+# same property under different Links with near-identical text, so rows are clustered
+# by the similarity of their descriptions instead of compared pairwise:
+#
+# 1. Descriptions are normalized (lowercase, punctuation dropped) and cut into word
+#    k-shingles, hashed to 64-bit ints with NumPy over the whole column at once.
+# 2. Each row gets a MinHash signature (num_perm multiply-shift hash functions).
+# 3. Locality-sensitive hashing: the signature is split into bands; rows sharing a band
+#    bucket *and* their block (listing type + bedrooms) become candidate pairs. Within
+#    a bucket each row is only paired with the previous row and the bucket's first, so
+#    the candidates grow linearly with the rows even for boilerplate text.
+# 4. Candidates are kept when their estimated Jaccard similarity (share of equal
+#    signature values) reaches `threshold` and their yearly prices are within
+#    `price_tolerance` of each other (or either price is unknown).
+# 5. Connected components of the kept pairs are the clusters.
+#
+# Rows without a description are never clustered with anything.
+
+EMPTY = np.uint32(0xFFFFFFFF)
+
+
+def mix64(values):
+    # splitmix64 finalizer: spreads nearby ints (token ids) over the whole uint64 range
+    values = values.astype(np.uint64, copy=True)
+    with np.errstate(over="ignore"):
+        values ^= values >> np.uint64(30)
+        values *= np.uint64(0xBF58476D1CE4E5B9)
+        values ^= values >> np.uint64(27)
+        values *= np.uint64(0x94D049BB133111EB)
+        values ^= values >> np.uint64(31)
+    return values
+
+
+def normalize_text(text):
+    return (
+        text.astype("string").str.lower()
+        .str.replace(r"[^0-9a-z]+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def shingle_hashes(text, k=3):
+    # -> (row positions, shingle hashes), sorted by row. Rows shorter than k words
+    # use their single words as shingles.
+    tokens = normalize_text(text).reset_index(drop=True).str.split().explode()
+    tokens = tokens[tokens.notna() & (tokens != "")]
+    rows = tokens.index.to_numpy(np.int64)
+    if not len(rows):
+        return rows, np.zeros(0, np.uint64)
+    ids = mix64(pd.factorize(tokens.to_numpy(object))[0])
+
+    n = len(ids)
+    count = n - k + 1
+    if count > 0:
+        same_row = rows[k - 1:] == rows[:count]
+        hashes = ids[:count].copy()
+        with np.errstate(over="ignore"):
+            for j in range(1, k):
+                hashes = mix64(hashes * np.uint64(31) + ids[j:j + count])
+        gram_rows, hashes = rows[:count][same_row], hashes[same_row]
+    else:
+        gram_rows, hashes = rows[:0], ids[:0]
+
+    # Rows with fewer than k words have no k-gram
+    row_length = np.bincount(rows)
+    short = row_length[rows] < k
+    rows = np.concatenate([gram_rows, rows[short]])
+    hashes = np.concatenate([hashes, ids[short]])
+    order = np.argsort(rows, kind="stable")
+    return rows[order], hashes[order]
+
+
+def minhash(rows, hashes, n_rows, num_perm=128, seed=1, chunk=1 << 16):
+    # (n_rows, num_perm) uint32 signatures; rows without shingles are all EMPTY
+    # Multiply-shift hashing: the top 32 bits of a * h + b (mod 2**64), with a odd
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+    signatures = np.full((n_rows, num_perm), EMPTY, dtype=np.uint32)
+    if not len(rows):
+        return signatures
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    # Blocks of whole rows with about `chunk` shingles, so the temporaries stay in cache
+    block_starts = np.searchsorted(starts, np.arange(0, len(rows), chunk))
+    block_starts = np.unique(np.r_[block_starts, len(starts)])
+    with np.errstate(over="ignore"):
+        for first, last in zip(block_starts[:-1], block_starts[1:]):
+            low = starts[first]
+            high = starts[last] if last < len(starts) else len(rows)
+            block = hashes[low:high]
+            offsets = starts[first:last] - low
+            present = rows[starts[first:last]]
+            for i in range(num_perm):
+                values = ((a[i] * block + b[i]) >> np.uint64(32)).astype(np.uint32)
+                signatures[present, i] = np.minimum.reduceat(values, offsets)
+    return signatures
+
+
+def band_candidates(signatures, blocks, bands):
+    # Candidate (i, j) pairs, i > j, from rows that share a band bucket and a block
+    n_rows, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    has_text = signatures[:, 0] != EMPTY
+    positions = np.flatnonzero(has_text)
+    pairs = []
+    for band in range(bands):
+        columns = signatures[positions, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        key = mix64(blocks[positions].astype(np.uint64) + np.uint64(band))
+        with np.errstate(over="ignore"):
+            for c in range(columns.shape[1]):
+                key = mix64(key * np.uint64(1000003) + columns[:, c])
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        rows = positions[order]
+        same = key[1:] == key[:-1]
+        follows = np.flatnonzero(same) + 1
+        if not len(follows):
+            continue
+        run_start = np.maximum.accumulate(np.where(np.r_[True, ~same], np.arange(len(key)), 0))
+        pairs.append(np.stack([rows[follows], rows[follows - 1]], axis=1))
+        firsts = follows[run_start[follows] != follows - 1]
+        pairs.append(np.stack([rows[firsts], rows[run_start[firsts]]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), np.int64)
+    pairs = np.concatenate(pairs)
+    codes = np.unique(pairs.max(axis=1) * n_rows + pairs.min(axis=1))
+    return np.stack([codes // n_rows, codes % n_rows], axis=1)
+
+
+def verify(pairs, signatures, prices, threshold, price_tolerance, chunk=200000):
+    # Keep pairs whose signatures agree on >= threshold of their values and whose prices are close
+    keep = np.zeros(len(pairs), dtype=bool)
+    for start in range(0, len(pairs), chunk):
+        i, j = pairs[start:start + chunk, 0], pairs[start:start + chunk, 1]
+        similarity = (signatures[i] == signatures[j]).mean(axis=1)
+        price_i, price_j = prices[i], prices[j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            close = np.abs(np.log(price_i / price_j)) <= np.log1p(price_tolerance)
+        unknown = ~(price_i > 0) | ~(price_j > 0)
+        keep[start:start + chunk] = (similarity >= threshold) & (close | unknown)
+    return pairs[keep]
+
+
+def connected_components(n_rows, pairs):
+    # Label of every row = smallest row position in its component (union-find by
+    # min-label propagation with pointer jumping)
+    labels = np.arange(n_rows)
+    if not len(pairs):
+        return labels
+    i, j = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        updated = labels.copy()
+        np.minimum.at(updated, labels[i], low)
+        np.minimum.at(updated, labels[j], low)
+        updated = updated[updated]
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def find_duplicates(df, threshold=0.8, shingle_size=3, num_perm=128, bands=16, price_tolerance=0.15, seed=1):
+    # -> DataFrame (same index as df) with cluster_id (dense, 0..clusters-1) and cluster_size.
+    # df: cleaned listings with Description, Bedrooms, listing_type and price_yearly.
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    n_rows = len(df)
+    rows, hashes = shingle_hashes(df["Description"], shingle_size)
+    signatures = minhash(rows, hashes, n_rows, num_perm, seed)
+    blocks = pd.MultiIndex.from_arrays([
+        df["listing_type"].astype("string").fillna("").to_numpy(object),
+        df["Bedrooms"].astype("Float64").fillna(-1).to_numpy(float),
+    ]).factorize()[0]
+    candidates = band_candidates(signatures, blocks, bands)
+    prices = df["price_yearly"].astype("Float64").to_numpy(float, na_value=np.nan)
+    pairs = verify(candidates, signatures, prices, threshold, price_tolerance)
+    labels = connected_components(n_rows, pairs)
+    cluster_id = pd.factorize(labels)[0]
+    print(f"Near-duplicates: {len(candidates)} candidate pairs, {len(pairs)} kept, "
+          f"{n_rows - cluster_id.max() - 1 if n_rows else 0} duplicate rows in {n_rows}")
+    return pd.DataFrame({
+        "cluster_id": cluster_id,
+        "cluster_size": np.bincount(cluster_id)[cluster_id] if n_rows else cluster_id,
+    }, index=df.index)
+
+
+def drop_duplicates(df, clusters):
+    # One row per cluster: the one with the most fields filled in (the first on ties)
+    filled = df.notna().sum(axis=1).to_numpy()
+    order = np.lexsort((np.arange(len(df)), -filled, clusters["cluster_id"].to_numpy()))
+    keep = order[np.r_[True, np.diff(clusters["cluster_id"].to_numpy()[order]) != 0]]
+    return df.iloc[np.sort(keep)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate listings (MinHash/LSH over descriptions)")
+    parser.add_argument("inputs", nargs="+", help="cleaned .parquet file (cleaning.py --out), or raw properties CSVs")
+    parser.add_argument("--out", default="properties_dedup.parquet", help=".parquet or .csv output file")
+    parser.add_argument("--threshold", type=float, default=0.8, help="minimum estimated Jaccard similarity of description shingles")
+    parser.add_argument("--price-tolerance", type=float, default=0.15, help="maximum relative difference of yearly prices")
+    parser.add_argument("--drop", action="store_true", help="keep one listing per cluster instead of only labelling them")
+    args = parser.parse_args()
+
+    if len(args.inputs) == 1 and args.inputs[0].endswith(".parquet"):
+        listings = pd.read_parquet(args.inputs[0])
+    else:
+        from cleaning import load_and_clean
+        listings = load_and_clean(args.inputs)
+    started = time.perf_counter()
+    clusters = find_duplicates(listings, args.threshold, price_tolerance=args.price_tolerance)
+    print(f"Clustered {len(listings)} listings in {time.perf_counter() - started:.1f}s")
+    listings = listings.join(clusters)
+    if args.drop:
+        listings = drop_duplicates(listings, clusters)
+    if args.out.endswith(".parquet"):
+        listings.to_parquet(args.out, index=False)
+    else:
+        listings.to_csv(args.out, index=False)
+    print(f"Wrote {len(listings)} listings with cluster IDs to {args.out}")
@@ -0,0 +1,246 @@
+import scipy.sparse as sp
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import time
+import os
+from dedup import mix64, normalize_text
+
+# Text vectors for listings and a top-k "similar listings" search over them.
+#
+# Title and Description are cut into words and word bigrams, each hashed (stable
+# across runs) into one of n_features columns: no vocabulary to fit, so any batch
+# of listings can be vectorized on its own. A row holds sublinear term frequencies
+# (1 + log count) as a scipy sparse matrix.
+#
+# Those term-frequency rows are cached on disk by content hash (Title + Description),
+# so a listing is only tokenized again when its text changes:
+#   meta.json              n_features, ngram and the part files
+#   keys-000000.npy ...    content hashes of the rows of each part
+#   tf-000000.npz ...      their term-frequency rows (CSR)
+#
+# SimilarityIndex weights the rows by IDF over the indexed listings and L2-normalizes
+# them, so a dot product is the cosine similarity. Queries are scored in blocks: a
+# block of query rows times the index columns of their terms, one dense product per
+# block, sized so the block's scores stay within a fixed memory budget.
+#
+#   python embeddings.py state/*/properties.csv --cache vectors --text "3 bedroom duplex lekki pool"
+#   python embeddings.py properties_clean.parquet --cache vectors --all --out similar.parquet
+
+TEXT_COLUMNS = ["Title", "Description"]
+
+
+def listing_text(df):
+    # Title and Description of raw ("N/A" when missing) or cleaned listings
+    title, description = (df[name].astype("string").replace("N/A", "").fillna("") for name in TEXT_COLUMNS)
+    return title + " " + description
+
+
+def content_hashes(text):
+    return pd.util.hash_pandas_object(text.astype("string").fillna(""), index=False).to_numpy(np.uint64)
+
+
+def term_frequencies(text, n_features=1 << 18, ngram=2):
+    # (len(text), n_features) CSR of sublinear term frequencies of word 1..ngram-grams
+    tokens = normalize_text(text).reset_index(drop=True).str.split().explode()
+    tokens = tokens[tokens.notna() & (tokens != "")]
+    rows = tokens.index.to_numpy(np.int64)
+    if not len(rows):
+        return sp.csr_matrix((len(text), n_features), dtype=np.float32)
+    # Hash each distinct word once; pandas' hash is stable across runs and processes
+    codes, uniques = pd.factorize(tokens.to_numpy(object))
+    words = pd.util.hash_array(np.asarray(uniques, dtype=object))[codes]
+
+    all_rows, all_hashes = [rows], [words]
+    grams = words
+    with np.errstate(over="ignore"):
+        for n in range(2, ngram + 1):
+            count = len(words) - n + 1
+            if count <= 0:
+                break
+            grams = mix64(grams[:count] * np.uint64(31) + words[n - 1:n - 1 + count])
+            same_row = rows[n - 1:] == rows[:count]
+            all_rows.append(rows[:count][same_row])
+            all_hashes.append(grams[same_row])
+    rows = np.concatenate(all_rows)
+    features = (np.concatenate(all_hashes) % np.uint64(n_features)).astype(np.int64)
+
+    cells, counts = np.unique(rows * n_features + features, return_counts=True)
+    values = (1 + np.log(counts)).astype(np.float32)
+    return sp.csr_matrix((values, (cells // n_features, cells % n_features)), shape=(len(text), n_features))
+
+
+class VectorCache:
+    def __init__(self, cache_dir, n_features=1 << 18, ngram=2):
+        self.cache_dir = cache_dir
+        self.meta = {"n_features": n_features, "ngram": ngram, "parts": []}
+        self.keys = pd.Index(np.zeros(0, np.uint64))
+        self.tf = sp.csr_matrix((0, n_features), dtype=np.float32)
+        meta_file = os.path.join(cache_dir, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if (meta["n_features"], meta["ngram"]) == (n_features, ngram):
+                self.meta = meta
+            else:
+                print(f"Vector cache {cache_dir} was built with other settings; starting over")
+        if self.meta["parts"]:
+            self.keys = pd.Index(np.concatenate([np.load(self.path(f"keys-{part}.npy")) for part in self.meta["parts"]]))
+            self.tf = sp.vstack([sp.load_npz(self.path(f"tf-{part}.npz")) for part in self.meta["parts"]], format="csr")
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def vectors(self, text):
+        # Term-frequency rows for a Series of texts, vectorizing (and caching) only unseen ones
+        hashes = content_hashes(text)
+        positions = self.keys.get_indexer(hashes)
+        missing = positions < 0
+        if missing.any():
+            new_keys, first = np.unique(hashes[missing], return_index=True)
+            started = time.perf_counter()
+            tf = term_frequencies(text[missing].iloc[first], self.meta["n_features"], self.meta["ngram"])
+            print(f"Vectorized {len(new_keys)} listings in {time.perf_counter() - started:.1f}s "
+                  f"({len(self.keys)} cached)")
+            self.append(new_keys, tf)
+            positions = self.keys.get_indexer(hashes)
+        return self.tf[positions]
+
+    def append(self, keys, tf):
+        part = f"{len(self.meta['parts']):06d}"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(self.path(f"keys-{part}.npy"), keys)
+        sp.save_npz(self.path(f"tf-{part}.npz"), tf)
+        self.meta["parts"].append(part)
+        tmp = self.path("meta.json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self.path("meta.json"))
+        self.keys = self.keys.append(pd.Index(keys))
+        self.tf = sp.vstack([self.tf, tf], format="csr")
+
+
+def l2_normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sp.csr_matrix(sp.diags((1 / norms).astype(np.float32)) @ matrix)
+
+
+class SimilarityIndex:
+    def __init__(self, tf, links, n_features=1 << 18, ngram=2, max_df=0.5):
+        # tf: term-frequency rows (VectorCache.vectors); links: the listing of each row.
+        # Terms in more than max_df of the listings (boilerplate) are left out: they say
+        # little about similarity and would make every query touch every listing.
+        self.n_features = n_features
+        self.ngram = ngram
+        self.link_values = np.asarray(links, dtype=object)
+        self.links = pd.Index(self.link_values)
+        n_rows = tf.shape[0]
+        document_frequency = np.bincount(tf.indices, minlength=tf.shape[1])
+        self.idf = (np.log((1 + n_rows) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.idf[document_frequency > max_df * n_rows] = 0
+        self.matrix = self.weigh(tf)
+        # Column-major copy: a query only reads the columns of its own terms
+        self.columns = sp.csc_matrix(self.matrix)
+
+    @classmethod
+    def from_listings(cls, df, cache_dir=None, n_features=1 << 18, ngram=2, max_df=0.5):
+        text = listing_text(df).reset_index(drop=True)
+        if cache_dir:
+            tf = VectorCache(cache_dir, n_features, ngram).vectors(text)
+        else:
+            tf = term_frequencies(text, n_features, ngram)
+        return cls(tf, df["Link"].to_numpy(object), n_features, ngram, max_df)
+
+    def weigh(self, tf):
+        weighted = sp.csr_matrix(tf @ sp.diags(self.idf))
+        weighted.eliminate_zeros()
+        return l2_normalize(weighted)
+
+    def top_k(self, queries, k=10, exclude=None, block_cells=1 << 24):
+        # -> (rows, scores), each (queries, k): the k most similar indexed rows of every
+        # (weighted) query row, best first; row -1 where there are fewer than k.
+        # exclude: an index row per query to leave out (the query listing itself).
+        # Queries are scored in blocks of at most block_cells scores (64 MB) at a time.
+        n_rows = self.matrix.shape[0]
+        n_queries = queries.shape[0]
+        k = max(1, min(k, n_rows))
+        rows = np.full((n_queries, k), -1, dtype=np.int64)
+        scores = np.zeros((n_queries, k), dtype=np.float32)
+        chunk = max(1, block_cells // max(n_rows, 1))
+        for start in range(0, n_queries, chunk):
+            batch = sp.csr_matrix(queries[start:start + chunk])
+            terms = np.unique(batch.indices)
+            block = (self.columns[:, terms] @ batch[:, terms].T.toarray()).T
+            if exclude is not None:
+                block[np.arange(len(block)), exclude[start:start + chunk]] = 0
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, 1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            rows[start:start + chunk] = np.take_along_axis(top, order, 1)
+            scores[start:start + chunk] = np.take_along_axis(top_scores, order, 1)
+        return rows, scores
+
+    def results(self, query_links, rows, scores):
+        # Long table of the matches; rows sharing no term with the query (score 0) are left out
+        valid = (rows >= 0) & (scores > 0)
+        return pd.DataFrame({
+            "Link": np.repeat(np.asarray(query_links, dtype=object), rows.shape[1])[valid.ravel()],
+            "rank": np.tile(np.arange(1, rows.shape[1] + 1), rows.shape[0])[valid.ravel()],
+            "similar_link": self.link_values[rows[valid]],
+            "score": scores[valid].round(4),
+        })
+
+    def similar_to_text(self, text, k=10):
+        tf = term_frequencies(pd.Series([text]), self.n_features, self.ngram)
+        rows, scores = self.top_k(self.weigh(tf), k)
+        return self.results([None], rows, scores).drop(columns="Link")
+
+    def similar(self, links, k=10):
+        # Top k similar listings for each of `links` (listings already in the index)
+        positions = self.links.get_indexer(links)
+        if (positions < 0).any():
+            raise KeyError(f"not in the index: {list(np.asarray(links, dtype=object)[positions < 0][:5])}")
+        rows, scores = self.top_k(self.matrix[positions], k, exclude=positions)
+        return self.results(self.links[positions], rows, scores)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find similar listings by their title and description text")
+    parser.add_argument("inputs", nargs="+", help="cleaned .parquet file (cleaning.py --out), or raw properties CSVs")
+    parser.add_argument("--cache", default=None, metavar="DIR", help="cache term vectors here by content hash, so unchanged listings are not vectorized again")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--link", action="append", default=[], help="listing to find similar ones for (repeatable)")
+    parser.add_argument("--text", default=None, help="free text to find similar listings for")
+    parser.add_argument("--all", action="store_true", help="top k similar listings of every listing")
+    parser.add_argument("--out", default=None, help=".parquet or .csv output file (default: print)")
+    args = parser.parse_args()
+    if not (args.link or args.text or args.all):
+        parser.error("give --link, --text or --all")
+
+    if len(args.inputs) == 1 and args.inputs[0].endswith(".parquet"):
+        listings = pd.read_parquet(args.inputs[0], columns=["Link"] + TEXT_COLUMNS)
+    else:
+        from storage import iter_csv_chunks
+        listings = pd.concat([chunk for csv_file in args.inputs
+                              for chunk in iter_csv_chunks(csv_file, 50000, usecols=["Link"] + TEXT_COLUMNS)],
+                             ignore_index=True)
+    listings = listings.drop_duplicates(subset="Link", keep="last")
+    started = time.perf_counter()
+    index = SimilarityIndex.from_listings(listings, args.cache)
+    print(f"Indexed {len(listings)} listings in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    if args.text:
+        found = index.similar_to_text(args.text, args.k)
+    else:
+        found = index.similar(listings["Link"] if args.all else args.link, args.k)
+    print(f"Searched in {(time.perf_counter() - started) * 1000:.1f} ms")
+    if args.out and args.out.endswith(".parquet"):
+        found.to_parquet(args.out, index=False)
+    elif args.out:
+        found.to_csv(args.out, index=False)
+    else:
+        with pd.option_context("display.width", 200, "display.max_colwidth", 80):
+            print(found.to_string(index=False))
@@ -0,0 +1,109 @@
+from readiness import all_fields_filled
+from field_rules import parse_fallback_text, merge_fallback, parse_spec_row
+
+DESCRIPTION_XPATH = "/html/body/div[1]/div[2]/section/div/div/div/div[1]/div[2]/div[4]/div/div/div/div[1]/div"
+FALLBACK_XPATH = "/html/body/div[1]/div[2]/section/div/div/div/div[1]/div[2]"
+
+# Reads everything scrape_detail_page needs in a single page.evaluate round-trip.
+# Each value is the element's innerText (what Playwright's inner_text() returns),
+# or null when the element is missing.
+EXTRACT_JS = """
+([descriptionXpath, fallbackXpath]) => {
+    const text = (el) => (el ? el.innerText : null);
+    const first = (selector) => document.querySelector(selector);
+    const byXpath = (path) => document.evaluate(
+        path, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+    ).singleNodeValue;
+    return {
+        title: text(first("h1.content-title, h4.content-title")),
+        address: text(first("address")),
+        prices: Array.from(document.querySelectorAll("span.price"), (el) => el.innerText),
+        tel: text(first("a[href*='tel:']")),
+        marketed_by: text(first("span.marketed-by")),
+        image_count: text(first("span.image-count")),
+        spec_rows: Array.from(
+            document.querySelectorAll(".wp-block-table table tr, .specifications tr"),
+            (tr) => Array.from(tr.querySelectorAll("td"), (td) => td.innerText)
+        ),
+        description_xpath: text(byXpath(descriptionXpath)),
+        description_css: text(first("div[itemprop='description']")),
+        fallback_text: text(byXpath(fallbackXpath)),
+    };
+}
+"""
+EXTRACT_ARGS = [DESCRIPTION_XPATH, FALLBACK_XPATH]
+
+
+def empty_property_data(url):
+    return {
+        "Title": "N/A",
+        "Address": "N/A",
+        "Price": "N/A",
+        "Description": "N/A",
+        "Contact": "N/A",
+        "Photos": "N/A",
+        "Link": url,
+        "Bedrooms": "N/A",
+        "Bathrooms": "N/A",
+        "Toilets": "N/A",
+        "Parking Spaces": "N/A"
+    }
+
+
+def build_property_data(raw, url):
+    # Fills property_data from the EXTRACT_JS result using the same rules as the
+    # per-locator extraction it replaces, so the same HTML gives the same output
+    property_data = empty_property_data(url)
+
+    # CSS selector fields
+    try:
+        if raw.get("title") is not None:
+            property_data["Title"] = raw["title"].strip()
+
+        if raw.get("address") is not None:
+            property_data["Address"] = raw["address"].strip()
+
+        for text in raw.get("prices") or []:
+            text = text.strip()
+            if any(char.isdigit() for char in text):
+                property_data["Price"] = text.replace("₦", "").replace("$", "").replace(",", "").strip()
+                break
+
+        if raw.get("tel") is not None:
+            property_data["Contact"] = raw["tel"].strip().replace("Call", "").replace("Show Phone", "").strip()
+        elif raw.get("marketed_by") is not None:
+            property_data["Contact"] = raw["marketed_by"].strip()
+
+        photos_text = raw["image_count"].strip() if raw.get("image_count") is not None else ""
+        if photos_text and "of" in photos_text:
+            property_data["Photos"] = photos_text.split("of")[-1].strip()
+
+        for cells in raw.get("spec_rows") or []:
+            if len(cells) < 2:
+                raise ValueError(f"specifications row has {len(cells)} cells")
+            property_data.update(parse_spec_row(cells[0], cells[1]))
+
+    except Exception as e:
+        print(f"CSS selector extraction failed: {e}")
+
+    # Description from the XPath, else the itemprop div
+    if raw.get("description_xpath") is not None:
+        text_content = raw["description_xpath"].strip()
+        print(f"Description XPath Text: {text_content[:100]}...")
+        property_data["Description"] = text_content
+    else:
+        print("Description XPath failed: element not found")
+        if raw.get("description_css") is not None:
+            property_data["Description"] = raw["description_css"].strip()
+
+    # Fallback XPath text for other fields, unless every field is already filled
+    if all_fields_filled(property_data):
+        print("All fields filled, skipping fallback XPath")
+    elif raw.get("fallback_text") is None:
+        print("Fallback XPath failed: element not found")
+    else:
+        text_content = raw["fallback_text"].strip()
+        print(f"Fallback XPath Text: {text_content[:100]}...")
+        merge_fallback(property_data, parse_fallback_text(text_content))
+
+    return property_data
@@ -0,0 +1,106 @@
+import re
+
+# Declarative rules for the fields build_property_data reads out of free text.
+#
+# Fallback text (the innerText of the page's main column) is matched line by line.
+# Instead of a Python loop testing every condition on every line, each rule searches
+# the whole text for its compiled needle and only the lines it lands on are checked
+# further, so most of a page is never touched by Python code.
+
+DIGITS = re.compile(r"\d+")
+
+
+def first_number(text):
+    match = DIGITS.search(text)
+    return match.group() if match else "N/A"
+
+
+def has_digit(line):
+    # str.isdigit, like the original loop: unlike \d it also takes superscripts ("500m²")
+    return any(char.isdigit() for char in line)
+
+
+def contact_value(line):
+    return line.replace("Call", "").replace("Show Phone", "").strip()
+
+
+def price_value(line):
+    return line.replace("₦", "").replace(",", "").strip()
+
+
+def photos_value(line):
+    return line.split("of")[-1].strip()
+
+
+# (field, needle, other condition on the line or None, value function, mode).
+# "fill" rules only fill a field that is still N/A, and keep going while the value they
+# filled in says N/A itself: the first matching line whose value does not, else the last.
+# "overwrite" rules take the last matching line and replace what the specifications gave.
+FALLBACK_RULES = [
+    ("Title", re.compile("bedroom", re.IGNORECASE), None, str, "fill"),
+    ("Address", re.compile("Lagos|Lekki|Ikoyi"), None, str, "fill"),
+    ("Price", re.compile("₦"), None, price_value, "fill"),
+    ("Contact", re.compile("Call"), has_digit, contact_value, "fill"),
+    ("Photos", re.compile("of"), has_digit, photos_value, "fill"),
+    ("Bedrooms", re.compile("Bedrooms"), has_digit, first_number, "overwrite"),
+    ("Bathrooms", re.compile("Bathrooms"), has_digit, first_number, "overwrite"),
+    ("Toilets", re.compile("Toilets"), has_digit, first_number, "overwrite"),
+    ("Parking Spaces", re.compile("Parking Spaces"), has_digit, first_number, "overwrite"),
+]
+FILL_FIELDS = {field for field, _, _, _, mode in FALLBACK_RULES if mode == "fill"}
+
+# Specifications table: the first keyword found in the (lowercased) label picks the field
+SPEC_RULES = [
+    ("bedroom", "Bedrooms"),
+    ("bathroom", "Bathrooms"),
+    ("toilet", "Toilets"),
+    ("parking", "Parking Spaces"),
+]
+
+
+def matching_lines(text, needle, condition=None):
+    # Stripped lines of text that contain needle (and match condition), in order
+    pos = 0
+    while True:
+        match = needle.search(text, pos)
+        if match is None:
+            return
+        start = text.rfind("\n", 0, match.start()) + 1
+        end = text.find("\n", match.end())
+        if end < 0:
+            end = len(text)
+        line = text[start:end].strip()
+        if condition is None or condition(line):
+            yield line
+        pos = end + 1
+
+
+def parse_fallback_text(text):
+    # Pure text -> {field: value} for every field some line of the text gives
+    found = {}
+    for field, needle, condition, value, mode in FALLBACK_RULES:
+        result = None
+        for line in matching_lines(text, needle, condition):
+            result = value(line)
+            if mode == "fill" and "N/A" not in result:
+                break
+        if result is not None:
+            found[field] = result
+    return found
+
+
+def merge_fallback(property_data, found):
+    # Fill rules only replace N/A; overwrite rules always win
+    for field, value in found.items():
+        if field not in FILL_FIELDS or "N/A" in property_data[field]:
+            property_data[field] = value
+    return property_data
+
+
+def parse_spec_row(label, value):
+    # One specifications row ("Bedrooms", "4") -> {"Bedrooms": "4"}, or {} for other rows
+    label = label.strip().lower()
+    for keyword, field in SPEC_RULES:
+        if keyword in label:
+            return {field: first_number(value)}
+    return {}
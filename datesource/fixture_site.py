@@ -0,0 +1,212 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import threading
+import argparse
+import random
+import math
+import time
+import os
+
+# Local stand-in for the listing site, for running the crawler without the network.
+# Search pages (/<listing-type>/<place>?page=N) list cards linking to detail pages
+# (/<listing-type>/listing/<id>). Detail pages are generated with the same markup the
+# extractors read, or replayed from a snapshot store of recorded pages (snapshots.py).
+# The server can simulate a site under load: a request budget over which it answers 429
+# with Retry-After, random 503s and 500s, and added latency. --day N simulates the market
+# N days later, with some listings repriced and some taken down, for refresh crawls.
+#
+#   python fixture_site.py --port 8765 --rate 2
+#   python crawler.py http://127.0.0.1:8765/for-rent/lagos --backend http --state-dir /tmp/state
+
+KINDS = ["Flat / Apartment", "Detached Duplex", "Semi Detached Duplex", "Terraced Duplex", "Mini Flat"]
+AREAS = [("Lekki Phase 1", "Lekki"), ("Cooper Road", "Ikoyi"), ("Allen Avenue", "Ikeja"), ("Herbert Macaulay Way", "Yaba")]
+
+
+class TokenBucket:
+    # Allows `rate` requests per second with bursts of up to `burst`
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        # -> 0 if the request may proceed, else seconds until it would
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+def market_day(listing_id, day):
+    # (listed, price factor) of a listing on a simulated day: after day 0, about 10% of
+    # listings are repriced and 3% are off the site on any given day
+    if not day:
+        return True, 1.0
+    rng = random.Random(f"{listing_id}-{day}")
+    factor = rng.choice([0.9, 1.1, 1.25]) if rng.random() < 0.1 else 1.0
+    return rng.random() >= 0.03, factor
+
+
+def listing_price(listing_id, day=0):
+    return int(random.Random(listing_id).randint(5, 300) * 100000 * market_day(listing_id, day)[1])
+
+
+def listing_html(listing_type, listing_id, day=0):
+    rng = random.Random(listing_id)
+    bedrooms = rng.randint(1, 6)
+    street, area = rng.choice(AREAS)
+    kind = rng.choice(KINDS)
+    rng.randint(5, 300)
+    price = listing_price(listing_id, day)
+    description = " ".join(rng.choices(["Newly built", "serviced", "with", "24 hours power", "fitted kitchen",
+                                        "swimming pool", "in a secure estate", "close to the expressway"], k=40))
+    return f"""<html><head><title>{bedrooms} bedroom {kind}</title></head><body>
+<div class="container"><h4 class="content-title">{bedrooms} Bedroom {kind} for {listing_type.replace('for-', '')}</h4>
+<address>{street}, {area}, Lagos</address>
+<span class="price">&#8358;</span><span class="price">{price:,}</span>
+<span class="image-count">1 of {rng.randint(3, 40)}</span>
+<a href="tel:0803{listing_id:07d}">Call 0803{listing_id:07d}</a>
+<table class="specifications">
+<tr><td>Bedrooms</td><td>{bedrooms}</td></tr>
+<tr><td>Bathrooms</td><td>{rng.randint(1, bedrooms + 1)}</td></tr>
+<tr><td>Toilets</td><td>{rng.randint(1, bedrooms + 2)}</td></tr>
+<tr><td>Parking Spaces</td><td>{rng.randint(0, 6)}</td></tr>
+</table>
+<div itemprop="description"><p>{description}.</p></div>
+</div></body></html>"""
+
+
+def search_html(path, page_number, pages, per_page, listing_type, day=0):
+    cards = []
+    for i in range(per_page):
+        listing_id = (page_number - 1) * per_page + i + 1
+        if not market_day(listing_id, day)[0]:
+            continue
+        rng = random.Random(listing_id)
+        cards.append(f'<div class="wp-block-content"><a href="/{listing_type}/listing/{listing_id}">'
+                     f'<h4 class="content-title">{rng.randint(1, 6)} bedroom listing {listing_id}</h4></a>'
+                     f'<span class="price">{listing_price(listing_id, day):,}</span></div>')
+    pagination = [f'<a href="{path}?page={n}">{n}</a>' for n in range(1, pages + 1)]
+    if page_number < pages:
+        pagination.append(f'<a class="pagination-next" href="{path}?page={page_number + 1}">Next</a>')
+    return f"<html><body>{''.join(cards)}<div class=\"pagination\">{''.join(pagination)}</div></body></html>"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        site = self.server.site
+        with site.lock:
+            site.stats["requests"] += 1
+        wait = site.bucket.take() if site.bucket else 0.0
+        if wait:
+            self.reply(429, "Too Many Requests", {"Retry-After": str(math.ceil(wait))})
+            return
+        roll = site.rng.random()
+        if roll < site.unavailable:
+            self.reply(503, "Service Unavailable", {"Retry-After": "1"})
+            return
+        if roll < site.unavailable + site.errors:
+            self.reply(500, "Internal Server Error")
+            return
+        if site.latency:
+            time.sleep(site.rng.uniform(0.5, 1.5) * site.latency)
+
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        listing_type = parts[0] if parts and parts[0] else "for-rent"
+        if len(parts) == 3 and parts[1] == "listing" and parts[2].isdigit():
+            self.reply(200, site.detail_html(listing_type, int(parts[2])))
+        else:
+            page_number = int(parse_qs(url.query).get("page", ["1"])[0])
+            self.reply(200, search_html(url.path, page_number, site.pages, site.per_page, listing_type, site.day))
+
+    def reply(self, status, body, headers=None):
+        with self.server.site.lock:
+            self.server.site.stats[status] = self.server.site.stats.get(status, 0) + 1
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureSite:
+    def __init__(self, pages=5, per_page=20, rate=None, burst=5, unavailable=0.0, errors=0.0, latency=0.0, seed=0,
+                 recorded=None, day=0):
+        self.per_page = per_page
+        self.day = day
+        self.recorded = []
+        if recorded:
+            # Replay recorded detail pages: listing i is the i-th snapshot, and there are
+            # as many result pages as it takes to list them all
+            from snapshots import SnapshotStore
+            self.store = SnapshotStore(recorded)
+            self.recorded = self.store.paths()
+            pages = max(1, -(-len(self.recorded) // per_page))
+        self.pages = pages
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.unavailable = unavailable
+        self.errors = errors
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0}
+        self.server = None
+
+    def detail_html(self, listing_type, listing_id):
+        if self.recorded:
+            return self.store.load_file(self.recorded[(listing_id - 1) % len(self.recorded)])[1]
+        return listing_html(listing_type, listing_id, self.day)
+
+    def listing_urls(self, base_url, listing_type="for-rent"):
+        return [f"{base_url}/{listing_type}/listing/{i}" for i in range(1, self.pages * self.per_page + 1)]
+
+    def start(self, port=0):
+        # Serves in a background thread; returns the base URL
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), FixtureHandler)
+        self.server.daemon_threads = True
+        self.server.site = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local fixture copy of the listing site")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pages", type=int, default=5, help="result pages per search")
+    parser.add_argument("--per-page", type=int, default=20, help="listings per result page")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second before answering 429 (default: unlimited)")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--unavailable", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds added to every response")
+    parser.add_argument("--recorded", default=None, metavar="DIR", help="serve detail pages recorded in this snapshot store (e.g. state/for-rent-lagos/snapshots)")
+    parser.add_argument("--day", type=int, default=0, help="simulate the market this many days on: some listings repriced or taken down")
+    args = parser.parse_args()
+    if args.recorded and not os.path.isdir(args.recorded):
+        parser.error(f"no snapshot store at {args.recorded}")
+    site = FixtureSite(args.pages, args.per_page, args.rate, args.burst, args.unavailable, args.errors, args.latency,
+                       recorded=args.recorded, day=args.day)
+    print(f"Serving fixture site at {site.start(args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        site.stop()
@@ -0,0 +1,221 @@
+from urllib.parse import urljoin
+from lxml import html as lxml_html
+import httpx
+import re
+import sys
+from extract import DESCRIPTION_XPATH, FALLBACK_XPATH, build_property_data
+from snapshots import save_snapshot
+from scheduler import Throttled, check_status
+from timing import PhaseTimer
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# Elements that start and end on their own line in innerText; paragraphs are set off by
+# a blank line. Table rows and cells are handled on their own (newline / tab separated).
+BLOCK_TAGS = {"div", "section", "article", "header", "footer", "aside", "nav", "main", "ul", "ol", "li", "table",
+              "address", "form", "dl", "dt", "dd", "figure", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6",
+              "blockquote", "pre", "hr"}
+PARAGRAPH_TAGS = {"p"}
+SKIP_TAGS = {"script", "style", "noscript", "template", "head"}
+# Collapsible whitespace in CSS: ASCII only, so &nbsp; is kept as in the browser
+WHITESPACE = re.compile(r"[ \t\n\r\f]+")
+
+CARD_LINK_XPATH = ".//a[.//h4[contains(concat(' ', normalize-space(@class), ' '), ' content-title ')]]"
+
+
+def make_client(concurrency=8, http2=True):
+    # One pooled keep-alive client shared by every request in the run
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        return httpx.AsyncClient(http2=http2, limits=limits, headers=HEADERS, timeout=30.0, follow_redirects=True)
+    except ImportError:
+        # http2=True needs the h2 package
+        return httpx.AsyncClient(limits=limits, headers=HEADERS, timeout=30.0, follow_redirects=True)
+
+
+def make_sync_client():
+    # Blocking client for worker processes that fetch one page at a time
+    return httpx.Client(headers=HEADERS, timeout=30.0, follow_redirects=True)
+
+
+def inner_text(element):
+    # The browser's innerText for static HTML, following the HTML spec's algorithm without
+    # CSS: text is whitespace-collapsed, <br> breaks the line, cells are tab separated and
+    # rows newline separated. Blocks ask for one line break around them and paragraphs
+    # for two; adjacent requests merge into the largest, and none are kept at the ends.
+    items = []
+
+    def walk(el):
+        tag = el.tag if isinstance(el.tag, str) else ""
+        if tag in SKIP_TAGS:
+            return
+        breaks = 2 if tag in PARAGRAPH_TAGS else 1 if tag in BLOCK_TAGS else 0
+        if breaks:
+            items.append(breaks)
+        if tag == "br":
+            items.append("\n")
+        if el.text and tag:
+            items.append(WHITESPACE.sub(" ", el.text))
+        for child in el:
+            walk(child)
+            if child.tail:
+                items.append(WHITESPACE.sub(" ", child.tail))
+        if tag in ("td", "th") and el.getnext() is not None:
+            items.append("\t")
+        elif tag == "tr" and el.getnext() is not None:
+            items.append("\n")
+        if breaks:
+            items.append(breaks)
+
+    walk(element)
+    parts = []
+    pending = 0
+    for item in items:
+        if isinstance(item, int):
+            pending = max(pending, item)
+        elif pending or not parts:
+            # Collapsed whitespace at the start of a line is dropped
+            if item.strip(" "):
+                if parts:
+                    parts.append("\n" * pending)
+                parts.append(item.lstrip(" "))
+                pending = 0
+        else:
+            parts.append(item)
+    text = re.sub(r" *\t *", "\t", re.sub(r" {2,}", " ", "".join(parts)))
+    return "\n".join(line.strip(" ") for line in text.split("\n"))
+
+
+def first(tree, selector):
+    found = tree.cssselect(selector)
+    return found[0] if found else None
+
+
+def text_or_none(element):
+    return inner_text(element) if element is not None else None
+
+
+def by_xpath(tree, path):
+    try:
+        found = tree.xpath(path)
+    except Exception:
+        return None
+    return found[0] if found else None
+
+
+def parse_detail_html(page_html):
+    # Same shape as extract.EXTRACT_JS, so build_property_data can fill property_data
+    tree = lxml_html.fromstring(page_html)
+    return {
+        "title": text_or_none(first(tree, "h1.content-title, h4.content-title")),
+        "address": text_or_none(first(tree, "address")),
+        "prices": [inner_text(el) for el in tree.cssselect("span.price")],
+        "tel": text_or_none(first(tree, "a[href*='tel:']")),
+        "marketed_by": text_or_none(first(tree, "span.marketed-by")),
+        "image_count": text_or_none(first(tree, "span.image-count")),
+        "spec_rows": [[inner_text(td) for td in tr.cssselect("td")]
+                      for tr in tree.cssselect(".wp-block-table table tr, .specifications tr")],
+        "description_xpath": text_or_none(by_xpath(tree, DESCRIPTION_XPATH)),
+        "description_css": text_or_none(first(tree, "div[itemprop='description']")),
+        "fallback_text": text_or_none(by_xpath(tree, FALLBACK_XPATH)),
+    }
+
+
+def extract_from_html(page_html, url):
+    return build_property_data(parse_detail_html(page_html), url)
+
+
+def needs_browser(property_data):
+    # Static HTML without a title or a price means the page is rendered by JavaScript
+    return property_data["Title"] == "N/A" and property_data["Price"] == "N/A"
+
+
+def parse_search_html(page_html, base_url):
+    # Returns ([(detail_url, card_text)], next_page_url or None)
+    tree = lxml_html.fromstring(page_html)
+    cards = []
+    for card in tree.cssselect(".wp-block-content"):
+        links = card.xpath(CARD_LINK_XPATH)
+        href = links[0].get("href") if links else None
+        if href:
+            cards.append((urljoin(base_url, href), inner_text(card)))
+    next_elem = first(tree, "a.pagination-next, a[rel='next']")
+    next_href = next_elem.get("href") if next_elem is not None else None
+    return cards, (urljoin(base_url, next_href) if next_href else None)
+
+
+async def fetch_html(client, url):
+    response = await client.get(url)
+    check_status(url, response.status_code, response.headers)
+    response.raise_for_status()
+    return response.text
+
+
+def fetch_html_sync(client, url):
+    response = client.get(url)
+    check_status(url, response.status_code, response.headers)
+    response.raise_for_status()
+    return response.text
+
+
+async def scrape_detail_page_http(client, url, snapshots=None, site=None):
+    # Returns property_data, or None if the request failed. site: the sites.py adapter
+    # that extracts it (default: this module's extraction, for nigeriapropertycentre.com)
+    timer = PhaseTimer(url)
+    try:
+        with timer.phase("navigate"):
+            page_html = await fetch_html(client, url)
+    except Throttled:
+        # Raised so the scheduler can slow down for this host
+        timer.log()
+        raise
+    except Exception as e:
+        print(f"HTTP fetch failed for {url}: {e}")
+        timer.log()
+        return None
+    with timer.phase("parse"):
+        property_data = site.extract_html(page_html, url) if site else extract_from_html(page_html, url)
+    if not needs_browser(property_data):
+        # Pages that need JavaScript are snapshotted by the browser fallback instead
+        with timer.phase("snapshot"):
+            save_snapshot(snapshots, url, page_html)
+    timer.log()
+    return property_data
+
+
+class HttpSearchPages:
+    # Search-result pages fetched over HTTP, with the same interface as the browser version
+    def __init__(self, client, site=None):
+        self.client = client
+        self.site = site
+        self.url = None
+        self.cards_found = []
+        self.next_url = None
+
+    async def load(self, url, timer=None):
+        if timer:
+            with timer.phase("navigate"):
+                page_html = await fetch_html(self.client, url)
+        else:
+            page_html = await fetch_html(self.client, url)
+        self.url = url
+        parse = self.site.parse_search_html if self.site else parse_search_html
+        self.cards_found, self.next_url = parse(page_html, url)
+
+    async def cards(self):
+        return self.cards_found
+
+    async def next_page_url(self):
+        return self.next_url
+
+
+if __name__ == "__main__":
+    # Offline check: python http_fetch.py saved_detail_page.html [url]
+    with open(sys.argv[1], encoding='utf-8') as f:
+        saved_html = f.read()
+    for key, value in extract_from_html(saved_html, sys.argv[2] if len(sys.argv) > 2 else sys.argv[1]).items():
+        print(f"{key}: {value[:200] if isinstance(value, str) else value}")
@@ -0,0 +1,208 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
+from datetime import datetime
+import threading
+import json
+import time
+import os
+
+# Crawl metrics: per-stage latency histograms, counters (pages, retries, throttling,
+# failures) and per-field extraction hit rates. One process-wide registry is fed by
+# PhaseTimer.log(), the scheduler and the crawl loops. Every finished result page
+# appends a cumulative snapshot to a JSON-lines file, and serve() exposes the same
+# numbers in the Prometheus text format.
+#
+# Stages:
+#   search_navigate, search_ready   loading a result page
+#   search_links                    reading the listing cards off it
+#   detail_navigate, detail_ready   loading a detail page (the HTTP fetch, for the http backend)
+#   detail_extract, detail_parse    reading the fields and building property_data
+#   detail_snapshot                 saving the page's HTML
+#   persist                         journal flush + seen index commit, and compaction
+
+# Seconds; the last bucket is +Inf
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# property_data fields whose hit rate is tracked (Link is always set)
+FIELDS = ["Title", "Address", "Price", "Description", "Contact", "Photos",
+          "Bedrooms", "Bathrooms", "Toilets", "Parking Spaces"]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        # Estimated from the buckets by linear interpolation, like Prometheus' histogram_quantile
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "mean": round(self.sum / self.count, 4) if self.count else None,
+            "p50": round(self.quantile(0.5), 4) if self.count else None,
+            "p95": round(self.quantile(0.95), 4) if self.count else None,
+            "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.counts)),
+        }
+
+
+class CrawlMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics_file = None
+        self.labels = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.monotonic()
+            self.stages = {}
+            self.counters = {}
+            self.records = 0
+            self.filled = dict.fromkeys(FIELDS, 0)
+
+    def configure(self, metrics_file=None, **labels):
+        # labels (e.g. shard=2) are added to every JSON-lines snapshot
+        self.metrics_file = metrics_file
+        self.labels = labels
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_fields(self, property_data):
+        # Count which fields were extracted (anything but "N/A") for one scraped listing
+        with self.lock:
+            self.records += 1
+            for field in FIELDS:
+                if property_data.get(field, "N/A") != "N/A":
+                    self.filled[field] += 1
+
+    def snapshot(self):
+        with self.lock:
+            minutes = (time.monotonic() - self.started) / 60
+            # A detail page counts once it was parsed, not per attempt
+            detail_pages = self.stages["detail_parse"].count if "detail_parse" in self.stages else 0
+            search_pages = self.stages["search_navigate"].count if "search_navigate" in self.stages else 0
+            return {
+                "time": datetime.now().isoformat(timespec='seconds'),
+                **self.labels,
+                "elapsed_minutes": round(minutes, 3),
+                "detail_pages_per_minute": round(detail_pages / minutes, 2) if minutes else None,
+                "search_pages_per_minute": round(search_pages / minutes, 2) if minutes else None,
+                "counters": dict(self.counters),
+                "records": self.records,
+                "field_hit_rates": {field: round(count / self.records, 4) if self.records else None
+                                    for field, count in self.filled.items()},
+                "stages": {stage: histogram.summary() for stage, histogram in self.stages.items()},
+            }
+
+    def write(self):
+        # Append a cumulative snapshot to the metrics file, if one is configured
+        if not self.metrics_file:
+            return
+        try:
+            directory = os.path.dirname(self.metrics_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.snapshot()) + "\n")
+        except Exception as e:
+            print(f"Failed to write metrics: {e}")
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        with self.lock:
+            stages = {stage: (list(h.counts), h.count, h.sum) for stage, h in self.stages.items()}
+        lines = [
+            "# HELP crawl_stage_seconds Latency of each crawl stage",
+            "# TYPE crawl_stage_seconds histogram",
+        ]
+        for stage, (counts, count, total) in stages.items():
+            cumulative = 0
+            for bound, bucket_count in zip([str(b) for b in BUCKETS] + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'crawl_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'crawl_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'crawl_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += ["# HELP crawl_events_total Crawl events (retries, throttled responses, failures, ...)",
+                  "# TYPE crawl_events_total counter"]
+        lines += [f'crawl_events_total{{event="{name}"}} {value}' for name, value in snapshot["counters"].items()]
+        lines += ["# HELP crawl_detail_pages_per_minute Detail pages scraped per minute since the crawl started",
+                  "# TYPE crawl_detail_pages_per_minute gauge",
+                  f"crawl_detail_pages_per_minute {snapshot['detail_pages_per_minute'] or 0}",
+                  "# HELP crawl_records_total Listings scraped",
+                  "# TYPE crawl_records_total counter",
+                  f"crawl_records_total {snapshot['records']}",
+                  "# HELP crawl_field_hit_rate Share of scraped listings where the field was not N/A",
+                  "# TYPE crawl_field_hit_rate gauge"]
+        lines += [f'crawl_field_hit_rate{{field="{field}"}} {rate}'
+                  for field, rate in snapshot["field_hit_rates"].items() if rate is not None]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        # Prometheus text endpoint at http://<host>:<port>/metrics, served from a daemon thread
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving Prometheus metrics on http://localhost:{server.server_address[1]}/metrics")
+        return server
+
+
+# The process-wide registry
+metrics = CrawlMetrics()
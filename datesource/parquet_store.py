@@ -0,0 +1,104 @@
+from datetime import date
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pandas as pd
+import argparse
+from storage import iter_csv_chunks
+
+# Typed schema for the scraped listings. Everything in properties.csv is a string
+# with "N/A" sentinels; here missing values are real nulls.
+ROOM_COLUMNS = ["Bedrooms", "Bathrooms", "Toilets", "Parking Spaces"]
+TEXT_COLUMNS = ["Title", "Address", "Description", "Contact", "Link"]
+PARTITION_COLUMNS = ["listing_type", "scrape_date"]
+
+ARROW_SCHEMA = pa.schema(
+    [(name, pa.string()) for name in TEXT_COLUMNS]
+    + [("Price", pa.int64()), ("Photos", pa.int16())]
+    + [(name, pa.int16()) for name in ROOM_COLUMNS]
+    + [("Location", pa.dictionary(pa.int32(), pa.string()))]
+    + [("listing_type", pa.string()), ("scrape_date", pa.string())]
+)
+
+MISSING = ["N/A", ""]
+
+
+def to_int(values, dtype):
+    # Numbers -> a nullable integer column. Values the type cannot hold (a price typed
+    # into Bedrooms, "1.5e20", "inf") become nulls rather than failing the export.
+    numbers = pd.to_numeric(values, errors="coerce").round()
+    low = np.iinfo(dtype.lower()).min
+    return numbers.where((numbers >= low) & (numbers < -float(low))).astype(dtype)
+
+
+def normalize(df, listing_type=None, scrape_date=None):
+    # String CSV columns -> typed columns, with "N/A"/"" as nulls
+    df = df.replace(MISSING, None)
+    out = pd.DataFrame(index=df.index)
+    for name in TEXT_COLUMNS:
+        out[name] = df[name].astype("string")
+    out["Price"] = to_int(df["Price"], "Int64")
+    out["Photos"] = to_int(df["Photos"], "Int16")
+    for name in ROOM_COLUMNS:
+        # Older rows went through a float column and read "4.0"
+        out[name] = to_int(df[name], "Int16")
+    # Location: the part of the address just before the city ("Cooper Road, Ikoyi, Lagos" -> "Ikoyi")
+    parts = out["Address"].str.split(",")
+    out["Location"] = parts.str[-2].str.strip().where(parts.str.len() >= 2, parts.str[0].str.strip()).astype("category")
+    if listing_type is None:
+        out["listing_type"] = df["Link"].str.extract(r"/(for-rent|for-sale|short-let)/", expand=False).fillna("unknown")
+    else:
+        out["listing_type"] = listing_type
+    out["scrape_date"] = str(scrape_date or date.today().isoformat())
+    return out
+
+
+def to_table(df):
+    return pa.Table.from_pandas(df, schema=ARROW_SCHEMA, preserve_index=False)
+
+
+def write_partitioned(batches, root):
+    # Hive-partitioned dataset: root/listing_type=for-rent/scrape_date=2026-10-17/part-0.parquet.
+    # Rewriting a partition replaces it, so re-exporting a day is idempotent.
+    ds.write_dataset(
+        batches,
+        root,
+        schema=ARROW_SCHEMA,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITION_COLUMNS]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+    )
+
+
+def export_csvs(sources, root, scrape_date=None, chunksize=50000):
+    # sources: [(csv_file, listing_type or None)]. All sources go through one write,
+    # so partitions they share are replaced together rather than one by one.
+    # The CSVs are streamed in chunks, so memory stays bounded by chunksize.
+    count = 0
+
+    def batches():
+        nonlocal count
+        for csv_file, listing_type in sources:
+            for chunk in iter_csv_chunks(csv_file, chunksize):
+                count += len(chunk)
+                yield from to_table(normalize(chunk, listing_type, scrape_date)).to_batches()
+
+    write_partitioned(batches(), root)
+    print(f"Exported {count} properties from {len(sources)} CSV files to {root}")
+    return count
+
+
+def read_listings(root, columns=None, filters=None):
+    # Column-pruned, partition-filtered read, e.g.
+    # read_listings("parquet", ["Price", "Bedrooms"], [("listing_type", "=", "for-rent")])
+    return pd.read_parquet(root, columns=columns, filters=filters, partitioning="hive", dtype_backend="numpy_nullable")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export scraped listings to a typed, partitioned Parquet dataset")
+    parser.add_argument("csv_files", nargs="+")
+    parser.add_argument("--out", default="parquet", help="dataset root directory")
+    parser.add_argument("--listing-type", default=None, help="partition value; default: taken from each Link")
+    parser.add_argument("--scrape-date", default=None, help="partition value; default: today")
+    args = parser.parse_args()
+    export_csvs([(csv_file, args.listing_type) for csv_file in args.csv_files], args.out, args.scrape_date)
@@ -0,0 +1,261 @@
+from datetime import datetime
+import hashlib
+import argparse
+import pickle
+import numpy as np
+import pandas as pd
+import json
+import time
+import os
+from storage import FIELDNAMES, iter_csv_chunks, iter_journal_chunks
+from cleaning import clean_listings, ROOM_COLUMNS
+
+# Estimated yearly price of a listing from its rooms, location and type, to spot
+# listings priced above or below the market.
+#
+# Features: Bedrooms, Bathrooms, Toilets, Parking Spaces, and as categories the
+# listing type (rent/sale/short-let), property type, and Area and LGA parsed from
+# Address (cleaning.py). Each category keeps its max_categories most common values;
+# rarer and unseen values count as missing. The model is scikit-learn's histogram
+# gradient boosting on log price, which handles missing values and categories itself
+# and trains on a CPU in seconds.
+#
+# Training reads the raw CSVs (and journals) once per change: the cleaned feature
+# table is cached under --cache-dir, keyed by the size and mtime of every input, so
+# retraining with other settings does not parse the CSVs again.
+#
+# Scoring cleans and encodes a whole batch at once. `score --follow` keeps scoring the
+# records the crawler appends to each target's journal while it runs.
+#
+#   python price_model.py train state/*/properties.csv --model price_model.pkl
+#   python price_model.py score state/*/properties.csv --model price_model.pkl --out estimates.csv
+#   python price_model.py score state/*/properties.csv --model price_model.pkl --out estimates.csv --follow
+
+CATEGORY_COLUMNS = ["listing_type", "property_type", "Area", "LGA"]
+FEATURE_COLUMNS = ROOM_COLUMNS + CATEGORY_COLUMNS
+# Prices outside this range (naira) are typos or placeholders, not market prices
+MIN_PRICE, MAX_PRICE = 1e4, 1e11
+
+
+def feature_table(cleaned):
+    # The model's input columns of cleaned listings, plus Link, Title and the target
+    table = cleaned[["Link", "Title"] + FEATURE_COLUMNS + ["price_yearly"]].copy()
+    for name in CATEGORY_COLUMNS:
+        table[name] = table[name].astype("string")
+    return table
+
+
+def journal_identity(csv_file):
+    # Changes when compaction rewrites the CSV (and removes the journal), or the journal
+    # is recreated; appending to the journal leaves it unchanged
+    csv_stat = os.stat(csv_file) if os.path.exists(csv_file) else None
+    journal_file = f"{csv_file}.journal"
+    return (csv_stat.st_size if csv_stat else None, csv_stat.st_mtime_ns if csv_stat else None,
+            os.stat(journal_file).st_ino if os.path.exists(journal_file) else None)
+
+
+def read_sources(inputs):
+    # -> (cleaned listings, {csv file: (journal_identity, bytes of its journal read)}) of
+    # properties CSVs (with their journals), or of a cleaned .parquet file
+    if len(inputs) == 1 and inputs[0].endswith(".parquet"):
+        return pd.read_parquet(inputs[0]), {}
+    frames = []
+    journal_read = {}
+    for csv_file in inputs:
+        # Taken before reading, so a compaction during the read restarts follow() rather than skipping records
+        identity = journal_identity(csv_file)
+        frames += list(iter_csv_chunks(csv_file, 50000))
+        offset = 0
+        for chunk, offset in iter_journal_chunks(f"{csv_file}.journal"):
+            frames.append(chunk)
+        journal_read[csv_file] = (identity, offset)
+    raw = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FIELDNAMES)
+    return clean_listings(raw), journal_read
+
+
+def cached_features(inputs, cache_dir):
+    # Feature table of the inputs, from the cache if no input changed since it was written
+    state = []
+    for path in inputs + [f"{path}.journal" for path in inputs]:
+        stat = os.stat(path) if os.path.exists(path) else None
+        state.append([os.path.abspath(path), stat.st_size if stat else None, stat.st_mtime_ns if stat else None])
+    key = hashlib.sha1(json.dumps([state, FEATURE_COLUMNS]).encode()).hexdigest()[:16]
+    cache_file = os.path.join(cache_dir, f"features-{key}.parquet")
+    if os.path.exists(cache_file):
+        print(f"Using cached features {cache_file}")
+        return pd.read_parquet(cache_file)
+    started = time.perf_counter()
+    table = feature_table(read_sources(inputs)[0])
+    print(f"Parsed {len(table)} listings in {time.perf_counter() - started:.1f}s")
+    os.makedirs(cache_dir, exist_ok=True)
+    table.to_parquet(f"{cache_file}.tmp", index=False)
+    os.replace(f"{cache_file}.tmp", cache_file)
+    return table
+
+
+class PriceModel:
+    def __init__(self, model, categories, trained=None, metrics=None):
+        self.model = model
+        # column -> the category values the model knows, in code order
+        self.categories = categories
+        self.trained = trained
+        self.metrics = metrics or {}
+
+    @classmethod
+    def train(cls, table, max_categories=250, max_iter=300, learning_rate=0.1, holdout=0.1, seed=0):
+        # table: feature_table() of the training listings
+        from sklearn.ensemble import HistGradientBoostingRegressor
+
+        prices = table["price_yearly"].astype("Float64").to_numpy(float, na_value=np.nan)
+        usable = (prices >= MIN_PRICE) & (prices <= MAX_PRICE) & table["listing_type"].notna().to_numpy()
+        table, target = table[usable].reset_index(drop=True), np.log(prices[usable])
+        if len(table) < 50:
+            raise ValueError(f"only {len(table)} priced listings to train on")
+        # HistGradientBoosting takes at most 255 categories (codes) per feature
+        max_categories = min(max_categories, 254)
+        categories = {name: table[name].value_counts().index[:max_categories].tolist() for name in CATEGORY_COLUMNS}
+        price_model = cls(None, categories)
+        features = price_model.features(table)
+
+        held_out = np.random.default_rng(seed).random(len(table)) < holdout
+        model = HistGradientBoostingRegressor(
+            max_iter=max_iter, learning_rate=learning_rate, random_state=seed,
+            categorical_features=[FEATURE_COLUMNS.index(name) for name in CATEGORY_COLUMNS],
+        )
+        started = time.perf_counter()
+        model.fit(features[~held_out], target[~held_out])
+        if held_out.any():
+            error = np.exp(model.predict(features[held_out]) - target[held_out]) - 1
+            price_model.metrics = {
+                "holdout_listings": int(held_out.sum()),
+                "median_abs_pct_error": round(float(np.median(np.abs(error))) * 100, 1),
+                "within_25_pct": round(float(np.mean(np.abs(error) <= 0.25)) * 100, 1),
+            }
+        price_model.metrics.update(train_listings=int((~held_out).sum()),
+                                   train_seconds=round(time.perf_counter() - started, 1))
+        price_model.model = model
+        price_model.trained = datetime.now().isoformat(timespec='seconds')
+        return price_model
+
+    def features(self, table):
+        # (rows, features) float32 matrix: room counts, then category codes (NaN = missing)
+        columns = [table[name].astype("Float64").to_numpy(np.float32, na_value=np.nan) for name in ROOM_COLUMNS]
+        for name in CATEGORY_COLUMNS:
+            codes = pd.Categorical(table[name].astype("string"), categories=self.categories[name]).codes
+            columns.append(np.where(codes < 0, np.nan, codes).astype(np.float32))
+        return np.column_stack(columns)
+
+    def predict(self, listings):
+        # Estimated yearly price (naira) of every row of raw or cleaned listings.
+        # Raw rows are cleaned first, which also drops repeated Links.
+        if "price_yearly" not in listings.columns:
+            listings = clean_listings(listings.reindex(columns=FIELDNAMES).fillna("N/A"))
+        return np.exp(self.model.predict(self.features(listings)))
+
+    def score(self, listings):
+        # Link, Title, listing_type, price_yearly, estimate and ratio of raw or cleaned
+        # listings; ratio > 1 means priced above the estimate
+        if "price_yearly" not in listings.columns:
+            listings = clean_listings(listings.reindex(columns=FIELDNAMES).fillna("N/A"))
+        estimate = self.predict(listings)
+        price = listings["price_yearly"].astype("Float64").to_numpy(float, na_value=np.nan)
+        return pd.DataFrame({
+            "Link": listings["Link"].to_numpy(object),
+            "Title": listings["Title"].to_numpy(object),
+            "listing_type": listings["listing_type"].astype("string").to_numpy(object),
+            "price_yearly": price,
+            "estimate": estimate.round(-3),
+            "ratio": (price / estimate).round(3),
+        })
+
+    def save(self, path):
+        import sklearn
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump({"model": self.model, "categories": self.categories, "trained": self.trained,
+                         "metrics": self.metrics, "sklearn": sklearn.__version__}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        import sklearn
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        if saved["sklearn"] != sklearn.__version__:
+            print(f"Warning: {path} was trained with scikit-learn {saved['sklearn']}, running {sklearn.__version__}")
+        return cls(saved["model"], saved["categories"], saved["trained"], saved["metrics"])
+
+
+def write_scores(scores, out):
+    if out is None:
+        with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+            print(scores.to_string(index=False))
+    else:
+        scores.to_csv(out, mode='a', header=not os.path.exists(out) or not os.path.getsize(out), index=False)
+
+
+def follow(price_model, offsets, out, interval=5.0, batch_size=5000):
+    # Score records as they are appended to the targets' journals, until interrupted.
+    # offsets: {csv file: (journal_identity, bytes of its journal already scored)} (read_sources).
+    # Compaction folds a journal into its CSV and removes it; once the CSV or the journal
+    # is replaced, reading restarts at the start of the current journal. Unreadable lines
+    # are skipped rather than ending the follow.
+    print(f"Following {len(offsets)} journals; Ctrl-C to stop")
+    try:
+        while True:
+            for csv_file, (identity, offset) in offsets.items():
+                journal_file = f"{csv_file}.journal"
+                current = journal_identity(csv_file)
+                size = os.path.getsize(journal_file) if os.path.exists(journal_file) else 0
+                if current != identity or size < offset:
+                    offset = 0
+                for chunk, offset in iter_journal_chunks(journal_file, offset, batch_size, skip_bad=True):
+                    started = time.perf_counter()
+                    scores = price_model.score(chunk)
+                    write_scores(scores, out)
+                    print(f"Scored {len(scores)} new listings from {journal_file} "
+                          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+                offsets[csv_file] = (current, offset)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a listing price model, or score listings with it")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="train on properties CSVs or a cleaned .parquet file")
+    train.add_argument("inputs", nargs="+")
+    train.add_argument("--model", default="price_model.pkl", help="where to save the model")
+    train.add_argument("--cache-dir", default="features", help="cache of parsed feature tables")
+    train.add_argument("--max-iter", type=int, default=300, help="boosting iterations")
+    train.add_argument("--learning-rate", type=float, default=0.1)
+    train.add_argument("--max-categories", type=int, default=250, help="most common areas/LGAs/property types kept per column")
+    score = commands.add_parser("score", help="estimate the price of listings and compare it to the asking price")
+    score.add_argument("inputs", nargs="+")
+    score.add_argument("--model", default="price_model.pkl")
+    score.add_argument("--out", default=None, help="append the scores to this CSV (default: print)")
+    score.add_argument("--follow", action="store_true", help="then keep scoring new records from the CSVs' journals as a crawl appends them")
+    score.add_argument("--interval", type=float, default=5.0, help="seconds between journal checks with --follow")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        if len(args.inputs) == 1 and args.inputs[0].endswith(".parquet"):
+            table = feature_table(pd.read_parquet(args.inputs[0]))
+        else:
+            table = cached_features(args.inputs, args.cache_dir)
+        price_model = PriceModel.train(table, args.max_categories, args.max_iter, args.learning_rate)
+        price_model.save(args.model)
+        print(f"Saved {args.model}: {price_model.metrics}")
+    else:
+        price_model = PriceModel.load(args.model)
+        listings, journal_read = read_sources(args.inputs)
+        started = time.perf_counter()
+        scores = price_model.score(listings)
+        elapsed = time.perf_counter() - started
+        write_scores(scores, args.out)
+        print(f"Scored {len(scores)} listings in {elapsed:.2f}s")
+        if args.follow:
+            if args.inputs[0].endswith(".parquet"):
+                parser.error("--follow reads the journals of properties CSVs")
+            follow(price_model, journal_read, args.out, args.interval)
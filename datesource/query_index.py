@@ -0,0 +1,391 @@
+from datetime import datetime
+from itertools import chain
+import pyarrow.parquet as pq
+import pyarrow as pa
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import time
+import sys
+import os
+from storage import FIELDNAMES, iter_csv_chunks, iter_journal_chunks
+from cleaning import clean_listings
+
+# Filter-and-sort queries over the cleaned listings (area, bedrooms, price range,
+# listing type) without scanning the dataset. An index directory holds:
+#   meta.json                 row count, row parts, and the state of every source (CSV and
+#                             journal size/mtime, how much of the journal is indexed)
+#   part-000000.parquet ...   cleaned display columns (no Description), row ids in order
+#   links.parquet             Link -> row id, content hash and source of every live row
+#   deleted.npy               tombstones: rows replaced by a newer version or gone
+#   price.npz                 row ids sorted by yearly price, the sorted prices, and the unpriced rows
+#   <name>.postings.npz       inverted indexes as token -> sorted row ids, in CSR form:
+#                             area (words of Address and the LGA), bedrooms (0..9, "10+"),
+#                             listing_type
+#
+# update() is incremental: unchanged sources are skipped, sources whose journal grew
+# have just the new journal lines read, and of the rows read only those whose content
+# hash changed are cleaned and appended, as a new part. New row ids are always larger than existing ones, so postings stay
+# sorted by appending; new prices are merged into the sorted price array. Replaced rows
+# are tombstoned, and the index is rebuilt from scratch once tombstones pass
+# compact_ratio of the rows.
+#
+#   python query_index.py update state/*/properties.csv --index index
+#   python query_index.py query --index index --area "lekki phase 1" --bedrooms 3 --max-price 5000000
+#   python query_index.py check --index index
+
+DISPLAY_COLUMNS = ["Link", "Title", "Address", "Area", "LGA", "listing_type", "property_type",
+                   "Bedrooms", "Bathrooms", "Toilets", "Parking Spaces",
+                   "Price", "price_period", "price_yearly", "Photos", "Contact"]
+POSTINGS = ["area", "bedrooms", "listing_type"]
+MAX_BEDROOM_BUCKET = 10
+# Bumped when the postings change meaning; older indexes are rebuilt by update()
+# (2: listings with unknown bedrooms are in no bedrooms bucket)
+INDEX_FORMAT = 2
+
+
+def tokenize(text):
+    # Series of strings -> exploded Series of lowercase word tokens, indexed like text
+    tokens = text.astype("string").str.lower().str.replace(r"[^0-9a-z]+", " ", regex=True).str.split().explode()
+    return tokens[tokens.notna() & (tokens != "")]
+
+
+def group_postings(tokens, first_row):
+    # Series of tokens indexed by position within a part -> {token: sorted row ids}
+    if not len(tokens):
+        return {}
+    codes, uniques = pd.factorize(tokens.to_numpy(object))
+    rows = tokens.index.to_numpy(np.int64) + first_row
+    order = np.lexsort((rows, codes))
+    codes, rows = codes[order], rows[order]
+    bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+    return {uniques[codes[start]]: np.unique(rows[start:end]) for start, end in zip(bounds[:-1], bounds[1:])}
+
+
+def bedroom_bucket(bedrooms):
+    # "0".."9", "10+", or NA when the bedroom count is unknown
+    bedrooms = bedrooms.astype("Float64")
+    below = bedrooms.isna() | (bedrooms < MAX_BEDROOM_BUCKET)
+    return bedrooms.astype("Int64").astype("string").where(below, f"{MAX_BEDROOM_BUCKET}+")
+
+
+def part_tokens(cleaned):
+    # Tokens of every postings index for a cleaned part
+    area_text = cleaned["Address"].astype("string").fillna("") + " " + cleaned["LGA"].astype("string").fillna("")
+    return {
+        "area": tokenize(area_text),
+        "bedrooms": bedroom_bucket(cleaned["Bedrooms"]).dropna(),
+        "listing_type": cleaned["listing_type"].astype("string").dropna(),
+    }
+
+
+def file_state(path):
+    stat = os.stat(path) if os.path.exists(path) else None
+    return [stat.st_size, stat.st_mtime_ns] if stat else None
+
+
+class ListingIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.meta = {"format": INDEX_FORMAT, "rows": 0, "parts": [], "sources": {}}
+        self.rows = pd.DataFrame(columns=DISPLAY_COLUMNS)
+        self.links = pd.DataFrame({"row_id": pd.Series(dtype=np.int64), "content_hash": pd.Series(dtype=np.uint64),
+                                   "source": pd.Series(dtype=object)}, index=pd.Index([], name="Link", dtype=object))
+        self.deleted = np.zeros(0, dtype=bool)
+        self.price_order = np.zeros(0, dtype=np.int64)
+        self.price_sorted = np.zeros(0, dtype=float)
+        self.unpriced = np.zeros(0, dtype=np.int64)
+        self.postings = {name: {} for name in POSTINGS}
+        self.price_rank = None
+
+    def path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    @classmethod
+    def open(cls, index_dir):
+        index = cls(index_dir)
+        if not os.path.exists(index.path("meta.json")):
+            return index
+        with open(index.path("meta.json")) as f:
+            index.meta = json.load(f)
+        if index.meta["parts"]:
+            # One contiguous Arrow array per column: taking rows from a chunked one is ~50x slower
+            parts = [pq.read_table(index.path(part)) for part in index.meta["parts"]]
+            index.rows = pa.concat_tables(parts).combine_chunks().to_pandas()
+        index.links = pd.read_parquet(index.path("links.parquet"))
+        index.deleted = np.load(index.path("deleted.npy"))
+        with np.load(index.path("price.npz")) as price:
+            index.price_order, index.price_sorted, index.unpriced = price["order"], price["sorted"], price["unpriced"]
+        for name in POSTINGS:
+            with np.load(index.path(f"{name}.postings.npz"), allow_pickle=False) as csr:
+                tokens, offsets, ids = csr["tokens"], csr["offsets"], csr["ids"]
+                index.postings[name] = {token: ids[offsets[i]:offsets[i + 1]] for i, token in enumerate(tokens.tolist())}
+        return index
+
+    def save(self):
+        # Parts are written once by append(); everything else is rewritten, each file atomically
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        def replace(name, write):
+            tmp = self.path(f"tmp-{name}")
+            write(tmp)
+            os.replace(tmp, self.path(name))
+
+        replace("links.parquet", lambda tmp: self.links.to_parquet(tmp))
+        replace("deleted.npy", lambda tmp: np.save(tmp, self.deleted))
+        replace("price.npz", lambda tmp: np.savez(tmp, order=self.price_order, sorted=self.price_sorted,
+                                                  unpriced=self.unpriced))
+        for name in POSTINGS:
+            tokens = sorted(self.postings[name])
+            lists = [self.postings[name][token] for token in tokens]
+            offsets = np.r_[0, np.cumsum([len(ids) for ids in lists], dtype=np.int64)]
+            ids = np.concatenate(lists) if lists else np.zeros(0, np.int64)
+            replace(f"{name}.postings.npz", lambda tmp: np.savez(tmp, tokens=np.array(tokens, dtype=str),
+                                                                 offsets=offsets, ids=ids))
+        self.meta["updated"] = datetime.now().isoformat(timespec='seconds')
+
+        def write_meta(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(self.meta, f, indent=2)
+        replace("meta.json", write_meta)
+
+    def append(self, raw, source):
+        # Index new or changed raw CSV rows (one chunk). Returns how many were appended.
+        raw = raw.drop_duplicates(subset="Link", keep="last").reset_index(drop=True)
+        hashes = pd.util.hash_pandas_object(raw[FIELDNAMES], index=False).to_numpy()
+        known_row = self.links["row_id"].reindex(raw["Link"], fill_value=-1).to_numpy(np.int64)
+        known_hash = self.links["content_hash"].reindex(raw["Link"], fill_value=0).to_numpy(np.uint64)
+        changed = (known_row < 0) | (known_hash != hashes)
+        if not changed.any():
+            return 0
+        raw, hashes = raw[changed].reset_index(drop=True), hashes[changed]
+        replaced = known_row[changed & (known_row >= 0)]
+
+        first_row = self.meta["rows"]
+        cleaned = clean_listings(raw)
+        part = cleaned[DISPLAY_COLUMNS].copy()
+        for name in part.columns:
+            if isinstance(part[name].dtype, pd.CategoricalDtype):
+                part[name] = part[name].astype("string")
+        part_name = f"part-{len(self.meta['parts']):06d}.parquet"
+        os.makedirs(self.index_dir, exist_ok=True)
+        part.to_parquet(self.path(part_name), index=False)
+        self.meta["parts"].append(part_name)
+        self.meta["rows"] = first_row + len(part)
+        self.rows = pd.concat([self.rows, part], ignore_index=True) if len(self.rows) else part
+
+        ids = np.arange(first_row, first_row + len(part), dtype=np.int64)
+        self.deleted = np.r_[self.deleted, np.zeros(len(part), dtype=bool)]
+        self.deleted[replaced] = True
+        new_links = pd.DataFrame({"row_id": ids, "content_hash": hashes, "source": source},
+                                 index=pd.Index(part["Link"].to_numpy(object), name="Link"))
+        self.links = pd.concat([self.links.drop(new_links.index, errors="ignore"), new_links])
+
+        # Merge the new prices into the sorted price array
+        prices = part["price_yearly"].astype("Float64").to_numpy(float, na_value=np.nan)
+        priced = ~np.isnan(prices)
+        order = np.argsort(prices[priced], kind="stable")
+        new_sorted, new_order = prices[priced][order], ids[priced][order]
+        positions = np.searchsorted(self.price_sorted, new_sorted, side="right")
+        self.price_sorted = np.insert(self.price_sorted, positions, new_sorted)
+        self.price_order = np.insert(self.price_order, positions, new_order)
+        self.unpriced = np.r_[self.unpriced, ids[~priced]]
+        self.price_rank = None
+
+        for name, tokens in part_tokens(cleaned).items():
+            postings = self.postings[name]
+            for token, rows in group_postings(tokens, first_row).items():
+                postings[token] = np.r_[postings[token], rows] if token in postings else rows
+        return len(part)
+
+    def remove(self, links):
+        # Tombstone rows whose Link is no longer in its source
+        if len(links):
+            self.deleted[self.links.loc[links, "row_id"].to_numpy(np.int64)] = True
+            self.links = self.links.drop(links)
+
+    def live_rows(self):
+        return int((~self.deleted).sum())
+
+    def rank(self):
+        # Position of every row in price order (unpriced rows last), built on first use
+        if self.price_rank is None:
+            rank = np.full(self.meta["rows"], len(self.price_order), dtype=np.int64)
+            rank[self.price_order] = np.arange(len(self.price_order))
+            self.price_rank = rank
+        return self.price_rank
+
+    def check(self):
+        # Consistency problems of the bedrooms postings (empty list: none): every row in a
+        # bucket must have a known bedroom count that belongs to that bucket
+        problems = []
+        known = self.rows["Bedrooms"].astype("Float64")
+        for bucket, ids in self.postings["bedrooms"].items():
+            ids = ids[~self.deleted[ids]]
+            counts = known.iloc[ids]
+            unknown = int(counts.isna().sum())
+            if unknown:
+                problems.append(f"bedrooms {bucket}: {unknown} rows with unknown bedrooms")
+            expected = bedroom_bucket(counts.dropna())
+            wrong = int((expected != bucket).sum())
+            if wrong:
+                problems.append(f"bedrooms {bucket}: {wrong} rows of another bucket")
+        return problems
+
+    def query(self, area=None, bedrooms=None, min_bedrooms=None, max_bedrooms=None, min_price=None, max_price=None,
+              listing_type=None, descending=False, limit=20, offset=0):
+        # Listings matching every given filter, sorted by yearly price (unpriced last,
+        # and left out when a price bound is given). df.attrs["total"] is the match count.
+        # area: words that must all appear in the address or LGA, e.g. "lekki phase 1"
+        # bedrooms: exact count; min_/max_bedrooms: a range (10 stands for 10+)
+        candidates = []
+        if area:
+            words = tokenize(pd.Series([area])).tolist()
+            candidates += [self.postings["area"].get(word, np.zeros(0, np.int64)) for word in words]
+        if bedrooms is not None:
+            min_bedrooms = max_bedrooms = bedrooms
+        if min_bedrooms is not None or max_bedrooms is not None:
+            low = min(int(min_bedrooms or 0), MAX_BEDROOM_BUCKET)
+            high = min(int(max_bedrooms if max_bedrooms is not None else MAX_BEDROOM_BUCKET), MAX_BEDROOM_BUCKET)
+            buckets = [str(n) if n < MAX_BEDROOM_BUCKET else f"{MAX_BEDROOM_BUCKET}+" for n in range(low, high + 1)]
+            ids = [self.postings["bedrooms"][bucket] for bucket in buckets if bucket in self.postings["bedrooms"]]
+            candidates.append(np.concatenate(ids) if ids else np.zeros(0, np.int64))
+        if listing_type:
+            candidates.append(self.postings["listing_type"].get(listing_type, np.zeros(0, np.int64)))
+
+        low = np.searchsorted(self.price_sorted, min_price, side="left") if min_price is not None else 0
+        high = np.searchsorted(self.price_sorted, max_price, side="right") if max_price is not None else len(self.price_sorted)
+        priced_only = min_price is not None or max_price is not None
+        if candidates:
+            # Intersect the postings, smallest first, through a membership mask (linear, no sorting)
+            candidates = sorted(candidates, key=len)
+            matches = candidates[0][~self.deleted[candidates[0]]]
+            for ids in candidates[1:]:
+                member = np.zeros(len(self.deleted), dtype=bool)
+                member[ids] = True
+                matches = matches[member[matches]]
+            ranks = self.rank()[matches]
+            if priced_only:
+                keep = (ranks >= low) & (ranks < high)
+                matches, ranks = matches[keep], ranks[keep]
+            # Unique sort keys: price rank (reversed for descending), then unpriced rows in row order
+            priced = len(self.price_order)
+            keys = np.where(ranks < priced, priced - 1 - ranks if descending else ranks, priced + matches)
+            wanted = offset + limit
+            if wanted < len(keys):
+                # Only the requested page needs ordering
+                top = np.argpartition(keys, wanted - 1)[:wanted]
+                order = top[np.argsort(keys[top])]
+            else:
+                order = np.argsort(keys)
+            total, page = len(matches), matches[order][offset:offset + limit]
+        else:
+            matches = self.price_order[low:high]
+            if descending:
+                matches = matches[::-1]
+            if not priced_only:
+                matches = np.r_[matches, self.unpriced]
+            matches = matches[~self.deleted[matches]]
+            total, page = len(matches), matches[offset:offset + limit]
+        result = self.rows.iloc[page]
+        result.attrs["total"] = total
+        return result
+
+
+def update(index_dir, csv_files, chunksize=50000, compact_ratio=0.25, rebuild=False):
+    # Bring the index up to date with the given CSVs (and their journals)
+    index = ListingIndex(index_dir) if rebuild else ListingIndex.open(index_dir)
+    if index.meta.get("format", 1) != INDEX_FORMAT:
+        print(f"{index_dir} was built by an older version; rebuilding it")
+        for name in index.meta["parts"]:
+            os.remove(index.path(name))
+        return update(index_dir, csv_files, chunksize, compact_ratio, rebuild=True)
+    started = time.perf_counter()
+    saved_sources = json.loads(json.dumps(index.meta["sources"]))
+    appended = 0
+    for csv_file in csv_files:
+        # The crawler appends to the journal, and compaction rewrites the CSV and removes
+        # the journal. While the CSV is unchanged only the journal's new lines are read;
+        # otherwise the source is rescanned and Links no longer in it are dropped.
+        source = os.path.abspath(csv_file)
+        journal_file = f"{csv_file}.journal"
+        known = index.meta["sources"].get(source)
+        state = {"csv": file_state(csv_file), "journal": file_state(journal_file), "journal_read": 0}
+        journal_size = (state["journal"] or [0])[0]
+        if known and known["csv"] == state["csv"] and journal_size >= known["journal_read"]:
+            if journal_size == known["journal_read"]:
+                continue
+            state["journal_read"] = known["journal_read"]
+            for chunk, state["journal_read"] in iter_journal_chunks(journal_file, known["journal_read"], chunksize):
+                appended += index.append(chunk[chunk["Link"] != "N/A"], source)
+            index.meta["sources"][source] = state
+            continue
+
+        seen = []
+        chunks = ((chunk, 0) for chunk in iter_csv_chunks(csv_file, chunksize))
+        for chunk, journal_read in chain(chunks, iter_journal_chunks(journal_file, 0, chunksize)):
+            chunk = chunk[chunk["Link"] != "N/A"]
+            seen.append(chunk["Link"].to_numpy(object))
+            appended += index.append(chunk, source)
+            state["journal_read"] = max(state["journal_read"], journal_read)
+        seen = pd.Index(np.concatenate(seen)) if seen else pd.Index([])
+        mine = index.links.index[index.links["source"] == source]
+        index.remove(mine.difference(seen))
+        index.meta["sources"][source] = state
+
+    if len(index.deleted) and index.deleted.mean() > compact_ratio:
+        print(f"{index.deleted.sum()} of {len(index.deleted)} index rows are stale; rebuilding {index_dir}")
+        for name in index.meta["parts"]:
+            os.remove(index.path(name))
+        return update(index_dir, csv_files, chunksize, compact_ratio, rebuild=True)
+    if rebuild or appended or index.meta["sources"] != saved_sources or not os.path.exists(index.path("meta.json")):
+        index.save()
+    print(f"Indexed {appended} new or changed listings in {time.perf_counter() - started:.1f}s; "
+          f"{index.live_rows()} listings in {index_dir}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the listing index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("update", help="index new and changed listings from properties CSVs")
+    build.add_argument("csv_files", nargs="+")
+    build.add_argument("--index", default="index", help="index directory")
+    build.add_argument("--rebuild", action="store_true", help="rebuild from scratch")
+    search = commands.add_parser("query", help="filter and sort listings")
+    search.add_argument("--index", default="index")
+    search.add_argument("--area", default=None, help="words of the address or LGA, e.g. \"lekki phase 1\"")
+    search.add_argument("--bedrooms", type=int, default=None)
+    search.add_argument("--min-bedrooms", type=int, default=None)
+    search.add_argument("--max-bedrooms", type=int, default=None)
+    search.add_argument("--min-price", type=float, default=None, help="yearly price in naira")
+    search.add_argument("--max-price", type=float, default=None)
+    search.add_argument("--listing-type", default=None, help="for-rent, for-sale or short-let")
+    search.add_argument("--descending", action="store_true", help="most expensive first")
+    search.add_argument("--limit", type=int, default=20)
+    verify = commands.add_parser("check", help="check that the bedrooms postings agree with the indexed rows")
+    verify.add_argument("--index", default="index")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        if args.rebuild and os.path.isdir(args.index):
+            for name in os.listdir(args.index):
+                if name.startswith("part-"):
+                    os.remove(os.path.join(args.index, name))
+        update(args.index, args.csv_files, rebuild=args.rebuild)
+    elif args.command == "check":
+        problems = ListingIndex.open(args.index).check()
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} problems in {args.index}")
+        sys.exit(1 if problems else 0)
+    else:
+        index = ListingIndex.open(args.index)
+        started = time.perf_counter()
+        result = index.query(args.area, args.bedrooms, args.min_bedrooms, args.max_bedrooms, args.min_price,
+                             args.max_price, args.listing_type, args.descending, args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        with pd.option_context("display.width", 200, "display.max_columns", 8):
+            print(result[["Title", "Address", "Bedrooms", "price_yearly", "Link"]])
+        print(f"{result.attrs['total']} matches in {elapsed:.1f} ms")
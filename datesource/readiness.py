@@ -0,0 +1,57 @@
+from contextlib import nullcontext
+from scheduler import check_status
+
+# A search results page is ready once its listing cards are in the DOM
+SEARCH_READY_SELECTOR = ".wp-block-content"
+# A detail page is ready once any of the fields we extract is in the DOM
+DETAIL_READY_SELECTOR = "h1.content-title, h4.content-title, span.price, address, .specifications, div[itemprop='description']"
+
+NAVIGATION_TIMEOUT = 90000
+READY_TIMEOUT = 15000
+# Short cap on waiting for network idle after scrolling; busy ad/tracker traffic
+# can keep the network from ever going idle
+NETWORK_IDLE_TIMEOUT = 3000
+
+# Per-field waits in scrape_detail_page, once the page is already ready
+FIELD_TIMEOUTS = {
+    "description": 3000,
+}
+
+
+def timed(timer, name):
+    return timer.phase(name) if timer else nullcontext()
+
+
+def goto_ready(page, url, ready_selector, timer=None):
+    # Navigate, then wait for the first selector we need instead of fixed sleeps.
+    # Raises if navigation fails or the page never shows the ready selector, and
+    # scheduler.Throttled if the server answers 429/503.
+    with timed(timer, "navigate"):
+        response = page.goto(url, wait_until="domcontentloaded", timeout=NAVIGATION_TIMEOUT)
+    if response is not None:
+        check_status(url, response.status, response.headers)
+    with timed(timer, "ready"):
+        page.wait_for_selector(ready_selector, state="attached", timeout=READY_TIMEOUT)
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            page.wait_for_load_state("networkidle", timeout=NETWORK_IDLE_TIMEOUT)
+        except Exception:
+            pass
+
+
+async def goto_ready_async(page, url, ready_selector, timer=None):
+    with timed(timer, "navigate"):
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=NAVIGATION_TIMEOUT)
+    if response is not None:
+        check_status(url, response.status, response.headers)
+    with timed(timer, "ready"):
+        await page.wait_for_selector(ready_selector, state="attached", timeout=READY_TIMEOUT)
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.wait_for_load_state("networkidle", timeout=NETWORK_IDLE_TIMEOUT)
+        except Exception:
+            pass
+
+
+def all_fields_filled(property_data):
+    return all(value != "N/A" for value in property_data.values())
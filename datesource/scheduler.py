@@ -0,0 +1,434 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from collections import deque
+from urllib.parse import urlparse
+import asyncio
+import random
+import time
+from metrics import metrics
+
+# Politeness and retries for detail page fetches.
+#
+# AdaptiveRateLimiter spaces out request starts per host. It starts at the configured
+# rate, which is also the ceiling, and adapts to the host:
+# - it slows down on responses much slower than usual, on errors, and most of all on
+#   HTTP 429/503, where it also honours Retry-After
+# - it speeds back up while responses are fast and successful
+# After sustained failures a per-host circuit breaker stops all requests to the host for
+# a cooldown (doubling on every trip). The first request after the cooldown is spaced
+# out like a half-open probe. After too many trips in a row the host is given up on.
+#
+# CrawlScheduler runs a batch of URLs (the listings of one result page) through the
+# limiter. A failed URL is requeued at the end of the batch after an exponential,
+# jittered backoff, instead of being retried in place, so the rest of the batch keeps
+# going. The clock, sleep and random source can be swapped out, so the policy can be
+# exercised without a network (or against fixture_site.py's throttling stub).
+#
+# ListingBudget caps the detail fetches a crawl starts (max_listings); the scheduler asks
+# it before each attempt, and the retries of a URL it admitted always go ahead.
+#
+# FairSlots is the global concurrency budget of a multi-site crawl: a fixed number of
+# in-flight fetches shared by every site, each site optionally capped lower. Freed slots
+# go round-robin to the sites with waiting fetches, so a site with thousands of queued
+# listings cannot starve one with a few (fair queuing); within a site, first come first
+# served.
+
+THROTTLE_STATUSES = {429, 503}
+
+
+class Throttled(Exception):
+    # The server asked us to slow down (HTTP 429 or 503)
+    def __init__(self, url, status, retry_after=None):
+        message = f"HTTP {status} for {url}"
+        if retry_after is not None:
+            message += f" (Retry-After {retry_after:.0f}s)"
+        super().__init__(message)
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Exception):
+    # A host kept failing through every cooldown; stop crawling it
+    pass
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def check_status(url, status, headers):
+    # Raises Throttled for 429/503 responses. headers: any mapping with lowercase keys
+    # (Playwright) or case-insensitive lookup (httpx).
+    if status in THROTTLE_STATUSES:
+        raise Throttled(url, status, parse_retry_after((headers or {}).get("retry-after")))
+
+
+def backoff_delay(attempt, base=2.0, cap=120.0, rng=random):
+    # Exponential backoff with "equal jitter": half of the delay is fixed, half random,
+    # so retries from concurrent workers spread out but never come back immediately
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class HostState:
+    def __init__(self, interval, window):
+        self.interval = interval
+        self.next_slot = 0.0
+        self.latency = None
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.trips = 0
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate_per_host=1.0, min_rate=0.02, slow_factor=3.0, slow_latency=2.0, window=20, failure_rate=0.5,
+                 max_consecutive_failures=5, cooldown=60.0, max_trips=3, clock=time.monotonic):
+        self.min_interval = 1.0 / rate_per_host if rate_per_host > 0 else 0.0
+        self.max_interval = 1.0 / min_rate
+        self.slow_factor = slow_factor
+        self.slow_latency = slow_latency
+        self.window = window
+        self.failure_rate = failure_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+        self.clock = clock
+        self.hosts = {}
+
+    def host(self, url):
+        name = urlparse(url).netloc
+        if name not in self.hosts:
+            self.hosts[name] = HostState(self.min_interval, self.window)
+        return self.hosts[name]
+
+    def gave_up(self, url):
+        return self.host(url).trips > self.max_trips
+
+    def reserve(self, url):
+        # Book the next start slot for url's host; returns the seconds to wait for it.
+        # Raises CircuitOpen once the host has been given up on.
+        state = self.host(url)
+        if state.trips > self.max_trips:
+            raise CircuitOpen(f"{urlparse(url).netloc} failed through {self.max_trips} cooldowns")
+        now = self.clock()
+        start = max(now, state.next_slot)
+        interval = state.interval
+        if state.open_until is not None:
+            # Cooldown over: this request is the probe, and the next one waits long
+            # enough for the probe's outcome to close or reopen the breaker
+            start = max(start, state.open_until)
+            state.open_until = None
+            interval = self.max_interval
+        state.next_slot = start + interval
+        return start - now
+
+    def record(self, url, latency, ok, status=None, retry_after=None):
+        state = self.host(url)
+        now = self.clock()
+        state.outcomes.append(ok)
+        if ok:
+            state.consecutive_failures = 0
+            state.trips = 0
+            if state.latency is not None and latency > max(self.slow_factor * state.latency, self.slow_latency):
+                # Much slower than usual (and slow in absolute terms): the host is struggling, ease off
+                state.interval = min(self.max_interval, max(state.interval, self.min_interval, 0.1) * 1.25)
+            elif state.error_rate() < self.failure_rate / 2:
+                state.interval = max(self.min_interval, state.interval * 0.8)
+            state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+            return
+
+        state.consecutive_failures += 1
+        if status in THROTTLE_STATUSES:
+            state.interval = min(self.max_interval, max(state.interval, self.min_interval, 0.5) * 2)
+            if retry_after:
+                state.next_slot = max(state.next_slot, now + retry_after)
+        else:
+            state.interval = min(self.max_interval, max(state.interval, self.min_interval, 0.25) * 1.5)
+
+        sustained = len(state.outcomes) >= self.window // 2 and state.error_rate() >= self.failure_rate
+        if state.consecutive_failures >= self.max_consecutive_failures or sustained:
+            state.trips += 1
+            state.outcomes.clear()
+            state.consecutive_failures = 0
+            metrics.inc("circuit_trips")
+            if state.trips > self.max_trips:
+                print(f"Circuit open for {urlparse(url).netloc}: still failing after {self.max_trips} cooldowns, giving up")
+                return
+            cooldown = self.cooldown * 2 ** (state.trips - 1)
+            state.open_until = max(now + cooldown, state.next_slot)
+            print(f"Circuit open for {urlparse(url).netloc}: pausing {cooldown:.0f}s (trip {state.trips}/{self.max_trips})")
+
+
+class ListingBudget:
+    # How many more detail fetches a crawl may start before reaching max_listings. A URL
+    # takes one when it is first admitted (its retries are free); a URL given up on, or
+    # whose record turns out unchanged, gives its unit back. Once a URL of a batch is
+    # refused, no new URL of that batch is admitted, so the page is cut short rather
+    # than finished with gaps.
+    def __init__(self, left):
+        self.left = left
+        self.admitted = set()
+        self.refused = False
+
+    def start_batch(self):
+        self.admitted = set()
+        self.refused = False
+
+    def admit(self, url, closed=False):
+        # closed: admit no new URL (the crawl is stopping), only retries
+        if url in self.admitted:
+            return True
+        if closed or self.refused or self.left <= 0:
+            self.refused = True
+            return False
+        self.left -= 1
+        self.admitted.add(url)
+        return True
+
+    def give_back(self):
+        self.left += 1
+
+
+class CrawlScheduler:
+    def __init__(self, limiter=None, attempts=3, concurrency=1, backoff_base=2.0, backoff_cap=120.0,
+                 clock=time.monotonic, sleep=time.sleep, async_sleep=asyncio.sleep, rng=random):
+        self.limiter = limiter or AdaptiveRateLimiter(clock=clock)
+        self.attempts = attempts
+        self.concurrency = max(1, concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.clock = clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.rng = rng
+        self.retries = 0
+        self.failures = 0
+
+    def gave_up(self, url):
+        return self.limiter.gave_up(url)
+
+    def pop_ready(self, queue):
+        # First queued (url, attempt, not_before) whose backoff has passed, or the
+        # seconds until the earliest one is due
+        now = self.clock()
+        for i, item in enumerate(queue):
+            if item[2] <= now:
+                del queue[i]
+                return item, 0.0
+        return None, min(item[2] for item in queue) - now
+
+    def outcome(self, queue, item, started, result, error):
+        # Record the attempt with the limiter; on failure requeue the URL at the end,
+        # or drop it once it is out of attempts. Returns True on success, False on a
+        # requeued failure and None once the URL has been given up on.
+        url, attempt, _ = item
+        latency = self.clock() - started
+        if error is None and result is not None:
+            self.limiter.record(url, latency, True)
+            return True
+        status = error.status if isinstance(error, Throttled) else None
+        retry_after = error.retry_after if isinstance(error, Throttled) else None
+        self.limiter.record(url, latency, False, status, retry_after)
+        metrics.inc(f"throttled_{status}" if status else "failed_attempts")
+        if error is not None:
+            print(f"Fetch failed for {url}: {error}")
+        if attempt + 1 >= self.attempts:
+            self.failures += 1
+            metrics.inc("gave_up")
+            print(f"Giving up on {url} after {self.attempts} attempts")
+            return None
+        delay = max(backoff_delay(attempt, self.backoff_base, self.backoff_cap, self.rng), retry_after or 0.0)
+        self.retries += 1
+        metrics.inc("retries")
+        print(f"Retry {attempt + 1}/{self.attempts - 1} for {url} in {delay:.1f}s, after the rest of the page")
+        queue.append((url, attempt + 1, self.clock() + delay))
+        return False
+
+    def run(self, urls, fetch, on_result=None, admit=None, on_give_up=None):
+        # fetch(url) -> result, or None / an exception on failure.
+        # Returns {url: result} for the URLs that succeeded, or with on_result, hands each
+        # success to on_result(url, result) as it arrives and keeps nothing.
+        # admit(url), if given, is asked before each attempt; a refused URL is dropped
+        # (see ListingBudget: retries of an admitted URL are never refused).
+        # on_give_up(url) is called once a URL is out of attempts.
+        queue = deque((url, 0, 0.0) for url in urls)
+        results = {}
+        while queue:
+            item, wait = self.pop_ready(queue)
+            if item is None:
+                self.sleep(wait)
+                continue
+            if admit is not None and not admit(item[0]):
+                continue
+            try:
+                delay = self.limiter.reserve(item[0])
+            except CircuitOpen as e:
+                print(f"Stopping: {e}")
+                break
+            if delay > 0:
+                self.sleep(delay)
+            started = self.clock()
+            result, error = None, None
+            try:
+                result = fetch(item[0])
+            except Exception as e:
+                error = e
+            done = self.outcome(queue, item, started, result, error)
+            if done:
+                if on_result is not None:
+                    on_result(item[0], result)
+                else:
+                    results[item[0]] = result
+            elif done is None and on_give_up is not None:
+                on_give_up(item[0])
+        return results
+
+    async def run_async(self, urls, fetch, on_result=None, admit=None, on_give_up=None):
+        # Same as run(), with `concurrency` workers awaiting fetch(url). on_result is
+        # awaited, so a consumer behind a bounded queue holds the workers back. Workers
+        # stay up until no fetch is in flight, since a failed one may still be requeued.
+        queue = deque((url, 0, 0.0) for url in urls)
+        results = {}
+        stopped = False
+        in_flight = 0
+        finished = asyncio.Condition()
+
+        async def worker():
+            nonlocal stopped, in_flight
+            while (queue or in_flight) and not stopped:
+                if not queue:
+                    # Wait for an in-flight fetch to finish (or be requeued for a retry)
+                    async with finished:
+                        await finished.wait()
+                    continue
+                item, wait = self.pop_ready(queue)
+                if item is None:
+                    await self.async_sleep(wait)
+                    continue
+                in_flight += 1
+                try:
+                    if admit is not None and not admit(item[0]):
+                        continue
+                    try:
+                        delay = self.limiter.reserve(item[0])
+                    except CircuitOpen as e:
+                        print(f"Stopping: {e}")
+                        stopped = True
+                        break
+                    if delay > 0:
+                        await self.async_sleep(delay)
+                    started = self.clock()
+                    result, error = None, None
+                    try:
+                        result = await fetch(item[0])
+                    except Exception as e:
+                        error = e
+                    done = self.outcome(queue, item, started, result, error)
+                    if done:
+                        if on_result is not None:
+                            await on_result(item[0], result)
+                        else:
+                            results[item[0]] = result
+                    elif done is None and on_give_up is not None:
+                        on_give_up(item[0])
+                finally:
+                    in_flight -= 1
+                    async with finished:
+                        finished.notify_all()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(queue)) or 1)))
+        return results
+
+class FairSlots:
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.limits = {}
+        self.active = {}
+        self.in_use = 0
+        # site -> futures of its waiting fetches; `turns` is the round-robin order of
+        # the sites that have any
+        self.waiting = {}
+        self.turns = deque()
+
+    def set_limit(self, site, limit):
+        # At most `limit` of the slots for site (None: no cap below the capacity)
+        self.limits[site] = limit
+
+    def has_room(self, site):
+        limit = self.limits.get(site)
+        return self.in_use < self.capacity and (limit is None or self.active.get(site, 0) < limit)
+
+    def grant(self, site):
+        self.in_use += 1
+        self.active[site] = self.active.get(site, 0) + 1
+
+    async def acquire(self, site):
+        if not self.waiting.get(site) and self.has_room(site):
+            self.grant(site)
+            return
+        future = asyncio.get_running_loop().create_future()
+        if not self.waiting.get(site):
+            self.waiting[site] = deque()
+            self.turns.append(site)
+        self.waiting[site].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as it was cancelled: hand the slot on
+                self.release(site)
+            raise
+
+    def release(self, site):
+        self.in_use -= 1
+        self.active[site] -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        # Give free slots to waiting sites in turn, skipping sites at their own cap
+        skipped = 0
+        while self.turns and self.in_use < self.capacity and skipped < len(self.turns):
+            site = self.turns.popleft()
+            queue = self.waiting[site]
+            while queue and queue[0].done():
+                queue.popleft()  # cancelled while waiting
+            if not queue:
+                del self.waiting[site]
+                continue
+            if not self.has_room(site):
+                self.turns.append(site)
+                skipped += 1
+                continue
+            self.grant(site)
+            queue.popleft().set_result(None)
+            skipped = 0
+            if queue:
+                self.turns.append(site)
+            else:
+                del self.waiting[site]
+
+    @asynccontextmanager
+    async def slot(self, site):
+        await self.acquire(site)
+        try:
+            yield
+        finally:
+            self.release(site)
@@ -0,0 +1,263 @@
+from datetime import datetime
+import hashlib
+import sqlite3
+import json
+import re
+from storage import iter_csv_chunks
+
+
+# Columns added to listings after the first release, for refresh crawls
+REFRESH_COLUMNS = {"card_title": "TEXT", "card_price": "TEXT", "status": "TEXT", "last_seen": "TEXT"}
+
+# history statuses: new (first seen), listed (first card seen of a listing indexed
+# without one, e.g. seeded from the CSV), price_changed, title_changed, relisted, delisted
+HISTORY_FIELDS = ["Link", "scrape_time", "Price", "status"]
+
+
+class SeenIndex:
+    # Persistent index of scraped listings keyed by Link.
+    #
+    # card_fingerprint hashes the listing card on the search page, so a crawl can skip
+    # detail pages whose card has not changed. record_fingerprint hashes the scraped
+    # fields, so a re-scraped listing is only persisted when its content changed.
+    #
+    # Every scrape also keeps the card's title and price. Refresh crawls (refresh_status)
+    # compare only those, and a history table keeps (link, scrape_time, price, status)
+    # rows: one per listing when it first appears, changes price or title, disappears or
+    # comes back.
+    #
+    # read_only opens an existing index for lookups only (e.g. shards checking their
+    # target's index while another process may write it).
+    def __init__(self, db_file="seen.db", read_only=False):
+        self.db_file = db_file
+        self.read_only = read_only
+        # link -> (status, card title, card price) of refreshed listings waiting for their detail page
+        self.pending = {}
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+            return
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "link TEXT PRIMARY KEY, card_fingerprint TEXT, record_fingerprint TEXT, scraped_at TEXT)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(listings)")}
+        for name, kind in REFRESH_COLUMNS.items():
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE listings ADD COLUMN {name} {kind}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS history (link TEXT, scrape_time TEXT, price TEXT, status TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS history_link ON history (link, scrape_time)")
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def bootstrap_from_csv(self, csv_file):
+        # Seed an empty index with the links already in the CSV
+        if len(self):
+            return
+        count = 0
+        for chunk in iter_csv_chunks(csv_file, 50000, usecols=["Link"]):
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO listings (link) VALUES (?)",
+                ((link,) for link in chunk["Link"] if link and link != "N/A"),
+            )
+            count += len(chunk)
+        self.conn.commit()
+        if count:
+            print(f"Seeded seen index {self.db_file} with {len(self)} links from {csv_file}")
+
+    def should_scrape(self, link, card_fingerprint=None):
+        row = self.conn.execute(
+            "SELECT card_fingerprint FROM listings WHERE link = ?", (link,)
+        ).fetchone()
+        if row is None:
+            return True
+        if row[0] is None:
+            # Seeded from the CSV: remember the card so the next refresh can compare
+            if card_fingerprint and not self.read_only:
+                self.conn.execute(
+                    "UPDATE listings SET card_fingerprint = ? WHERE link = ?", (card_fingerprint, link)
+                )
+            return False
+        return card_fingerprint is not None and row[0] != card_fingerprint
+
+    def record_changed(self, link, record_fingerprint):
+        row = self.conn.execute(
+            "SELECT record_fingerprint FROM listings WHERE link = ?", (link,)
+        ).fetchone()
+        return row is None or row[0] != record_fingerprint
+
+    def refresh_status(self, link, card_text):
+        # Refresh crawls: why the listing's detail page must be fetched again ("new",
+        # "price_changed", "title_changed", "relisted"), or None when its card's title and
+        # price are unchanged. Either way the listing counts as seen in this pass.
+        title, price = card_summary(card_text)
+        now = datetime.now().isoformat(timespec='seconds')
+        row = self.card_row(link)
+        status = card_status(row, title, price)
+        if status == "listed":
+            # Scraped before its card was kept: start its history from this card
+            self.conn.execute(
+                "UPDATE listings SET card_title = ?, card_price = ?, status = 'listed', last_seen = ? WHERE link = ?",
+                (title, price, now, link),
+            )
+            self.conn.execute("INSERT INTO history VALUES (?, ?, ?, 'listed')", (link, now, price))
+            return None
+        if row is not None:
+            self.conn.execute("UPDATE listings SET last_seen = ? WHERE link = ?", (now, link))
+        if status:
+            self.pending[link] = (status, title, price)
+        return status
+
+    def card_row(self, link):
+        # (card title, card price, status) of a listing, or None if it is not indexed
+        return self.conn.execute(
+            "SELECT card_title, card_price, status FROM listings WHERE link = ?", (link,)
+        ).fetchone()
+
+    def mark_delisted(self, pass_started):
+        # After a complete refresh pass: listings whose card was not seen since
+        # pass_started are gone from the site. Returns how many were delisted.
+        now = datetime.now().isoformat(timespec='seconds')
+        gone = self.conn.execute(
+            "SELECT link, card_price FROM listings WHERE COALESCE(status, 'listed') = 'listed' "
+            "AND (last_seen IS NULL OR last_seen < ?)", (pass_started,)
+        ).fetchall()
+        self.conn.executemany("INSERT INTO history VALUES (?, ?, ?, 'delisted')", ((link, now, price) for link, price in gone))
+        self.conn.executemany("UPDATE listings SET status = 'delisted' WHERE link = ?", ((link,) for link, _ in gone))
+        self.conn.commit()
+        self.pending.clear()
+        return len(gone)
+
+    def iter_history(self):
+        # (link, scrape_time, price, status) rows, per listing in time order
+        yield from self.conn.execute("SELECT link, scrape_time, price, status FROM history ORDER BY link, scrape_time")
+
+    def mark_scraped(self, link, card_fingerprint, record_fingerprint, card=None):
+        # card: (title, price) of the listing's search card (see card_summary), kept so a
+        # later refresh compares against the card the record was scraped from. Without a
+        # card (or card fingerprint), the listing's current ones are kept.
+        # Not committed until commit(), which callers run after the journal is flushed
+        now = datetime.now().isoformat(timespec='seconds')
+        if link in self.pending:
+            # A refreshed listing: its card is only taken as known once the detail page is in
+            status, title, price = self.pending.pop(link)
+        elif card is not None:
+            title, price = card
+            status = card_status(self.card_row(link), title, price)
+        else:
+            status = title = price = None
+        self.conn.execute(
+            "INSERT INTO listings (link, card_fingerprint, record_fingerprint, scraped_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(link) DO UPDATE SET "
+            "card_fingerprint = COALESCE(excluded.card_fingerprint, listings.card_fingerprint), "
+            "record_fingerprint = excluded.record_fingerprint, scraped_at = excluded.scraped_at",
+            (link, card_fingerprint, record_fingerprint, now),
+        )
+        if card is not None or status:
+            self.conn.execute(
+                "UPDATE listings SET card_title = ?, card_price = ?, status = 'listed', last_seen = ? WHERE link = ?",
+                (title, price, now, link),
+            )
+        if status:
+            self.conn.execute("INSERT INTO history VALUES (?, ?, ?, ?)", (link, now, price, status))
+
+    def merge_from(self, other_db_file):
+        # Copy entries from another index (e.g. a shard's), newer scrapes winning
+        self.conn.commit()
+        self.conn.execute("ATTACH DATABASE ? AS other", (other_db_file,))
+        try:
+            self.conn.execute(
+                "INSERT INTO listings (link, card_fingerprint, record_fingerprint, scraped_at, card_title, card_price) "
+                "SELECT link, card_fingerprint, record_fingerprint, scraped_at, card_title, card_price "
+                "FROM other.listings WHERE true "
+                "ON CONFLICT(link) DO UPDATE SET card_fingerprint = excluded.card_fingerprint, "
+                "record_fingerprint = excluded.record_fingerprint, scraped_at = excluded.scraped_at, "
+                "card_title = COALESCE(excluded.card_title, listings.card_title), "
+                "card_price = COALESCE(excluded.card_price, listings.card_price) "
+                "WHERE excluded.scraped_at IS NOT NULL"
+            )
+            self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE other")
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        if not self.read_only:
+            self.conn.commit()
+        self.conn.close()
+
+
+def persist_record(journal, seen, link, card_text, property_data, known=None):
+    # Journal a scraped record if its content changed, and mark it scraped in `seen` with
+    # the search card it was found by (which also records the listing's history).
+    # card_text None (a record re-extracted from a snapshot) keeps the listing's card.
+    # known: a read-only index that must also have an older version for the record to
+    # count as changed (a shard's view of its target's index). Returns True if the
+    # record was journaled.
+    record_fp = record_fingerprint(property_data)
+    changed = seen.record_changed(link, record_fp) and (known is None or known.record_changed(link, record_fp))
+    if changed:
+        journal.append(property_data)
+    if card_text is None:
+        seen.mark_scraped(link, None, record_fp)
+    else:
+        seen.mark_scraped(link, card_fingerprint(card_text), record_fp, card_summary(card_text))
+    return changed
+
+
+def card_summary(card_text):
+    # (title, price) of a search card: its first line, and the first naira amount (digits
+    # only), or the first comma-grouped number when the currency sign is missing
+    lines = [line.strip() for line in (card_text or "").splitlines() if line.strip()]
+    title = lines[0] if lines else None
+    match = re.search(r"₦\s*([\d,]+)", card_text or "") or re.search(r"\b\d{1,3}(?:,\d{3})+\b", card_text or "")
+    price = re.sub(r"\D", "", match.group(match.lastindex or 0)) if match else None
+    return title, price or None
+
+
+def card_status(row, title, price):
+    # History status of a listing whose card now shows title and price; row is its
+    # card_row(). "listed": indexed before its card was kept. None: nothing changed.
+    if row is None:
+        return "new"
+    if row[2] == "delisted":
+        return "relisted"
+    if row[0] is None:
+        return "listed"
+    if price != row[1]:
+        return "price_changed"
+    if title != row[0]:
+        return "title_changed"
+    return None
+
+
+def card_fingerprint(card_text):
+    return hashlib.sha1(re.sub(r"\s+", " ", card_text or "").strip().encode('utf-8')).hexdigest()
+
+
+def record_fingerprint(property_data):
+    content = {k: v for k, v in property_data.items() if k != "Link"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+if __name__ == "__main__":
+    # Export a target's price/availability history:
+    #   python seen_index.py state/for-rent-lagos/seen.db history.csv
+    import csv
+    import sys
+    index = SeenIndex(sys.argv[1])
+    with open(sys.argv[2], 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HISTORY_FIELDS)
+        count = 0
+        for row in index.iter_history():
+            writer.writerow(row)
+            count += 1
+    index.close()
+    print(f"Wrote {count} history rows to {sys.argv[2]}")
@@ -0,0 +1,304 @@
+from datetime import datetime
+import multiprocessing
+import shutil
+import json
+import time
+import re
+import os
+from storage import PropertyJournal
+from seen_index import SeenIndex, card_fingerprint, persist_record
+from snapshots import open_store, save_snapshot
+from scheduler import AdaptiveRateLimiter, CrawlScheduler, backoff_delay
+from timing import PhaseTimer, timings
+from metrics import metrics
+
+# Sharded crawl: discover how many result pages a target has, split the page range
+# across worker processes (each with its own browser or HTTP client), then merge.
+#
+# Layout under state/<target>/shards/:
+#   plan.json                 page range of every shard, reused by retries and reruns with
+#                             the same --shards/--max-pages (otherwise its progress is
+#                             merged and the pages are planned again)
+#   <i>/properties.csv.journal  records scraped by shard i
+#   <i>/done_pages.txt          result pages shard i has finished, one per line
+#   <i>/seen.db                 shard i's seen index, merged into the target's
+
+
+def discover_last_page(page_html):
+    # Highest page number linked from the first results page (?page=N / &page=N)
+    pages = [int(n) for n in re.findall(r"[?&;]page=(\d+)", page_html)]
+    return max(pages, default=1)
+
+
+def fetch_first_page(target, backend, headless):
+    if backend == "http":
+        from http_fetch import make_sync_client, fetch_html_sync
+        with make_sync_client() as client:
+            return fetch_html_sync(client, target.search_url)
+    from playwright.sync_api import sync_playwright
+    from readiness import goto_ready, SEARCH_READY_SELECTOR
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        try:
+            page = browser.new_page()
+            goto_ready(page, target.search_url, SEARCH_READY_SELECTOR)
+            return page.content()
+        finally:
+            browser.close()
+
+
+def plan_shards(first_page, last_page, shard_count):
+    # Contiguous, nearly equal page ranges, e.g. 1-34, 35-67, 68-100
+    pages = list(range(first_page, last_page + 1))
+    shard_count = max(1, min(shard_count, len(pages)))
+    size, extra = divmod(len(pages), shard_count)
+    shards = []
+    start = 0
+    for i in range(shard_count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append({"shard": i, "first_page": pages[start], "last_page": pages[end - 1]})
+        start = end
+    return shards
+
+
+def load_or_create_plan(target, shard_count, backend, headless, max_pages=None):
+    shards_dir = os.path.join(target.state_dir, "shards")
+    plan_file = os.path.join(shards_dir, "plan.json")
+    if os.path.exists(plan_file):
+        with open(plan_file, 'r') as f:
+            plan = json.load(f)
+        if plan.get("shard_count") == shard_count and plan.get("max_pages") == max_pages:
+            print(f"Resuming shard plan for {target.name}: pages 1-{plan['last_page']} in {len(plan['shards'])} shards")
+            return plan
+        # Made for other parameters: keep what its shards scraped, then start over
+        print(f"Shard plan for {target.name} was made for {plan.get('shard_count')} shards and max pages "
+              f"{plan.get('max_pages')}, not {shard_count} and {max_pages}; merging its progress and planning again")
+        merge_shards(target, plan)
+        shutil.rmtree(shards_dir, ignore_errors=True)
+
+    last_page = discover_last_page(fetch_first_page(target, backend, headless))
+    if max_pages:
+        last_page = min(last_page, max_pages)
+    plan = {
+        "search_url": target.search_url,
+        "shard_count": shard_count,
+        "max_pages": max_pages,
+        "last_page": last_page,
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "shards": plan_shards(1, last_page, shard_count),
+    }
+    os.makedirs(shards_dir, exist_ok=True)
+    with open(f"{plan_file}.tmp", 'w') as f:
+        json.dump(plan, f, indent=2)
+    os.replace(f"{plan_file}.tmp", plan_file)
+    print(f"Planned {len(plan['shards'])} shards for {target.name} over pages 1-{last_page}")
+    return plan
+
+
+def shard_dir(target, shard):
+    return os.path.join(target.state_dir, "shards", str(shard["shard"]))
+
+
+def read_done_pages(done_file):
+    if not os.path.exists(done_file):
+        return set()
+    with open(done_file, 'r') as f:
+        return {int(line) for line in f if line.strip().isdigit()}
+
+
+def mark_page_done(done_file, page_number):
+    with open(done_file, 'a') as f:
+        f.write(f"{page_number}\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def crawl_shard(job):
+    # Runs in a worker process. Returns (shard number, error message or None).
+    target, shard, backend, headless, rate_per_host, metrics_file, block_resources, timings_file = job
+    # Each worker appends its own snapshots to the shared metrics file, labelled with its shard
+    metrics.configure(metrics_file, target=target.name, shard=shard["shard"])
+    timings.configure(timings_file)
+    directory = shard_dir(target, shard)
+    os.makedirs(directory, exist_ok=True)
+    done_file = os.path.join(directory, "done_pages.txt")
+    done = read_done_pages(done_file)
+    pages = [n for n in range(shard["first_page"], shard["last_page"] + 1) if n not in done]
+    print(f"[shard {shard['shard']}] pages {shard['first_page']}-{shard['last_page']}, {len(pages)} to do")
+    if not pages:
+        return shard["shard"], None
+
+    journal = PropertyJournal(os.path.join(directory, "properties.csv"))
+    seen = SeenIndex(os.path.join(directory, "seen.db"))
+    try:
+        # Shards write snapshots straight into the target's store: blobs are per Link and renamed into place
+        snapshots = open_store(target.snapshot_dir)
+        scheduler = CrawlScheduler(AdaptiveRateLimiter(rate_per_host))
+        if backend == "http":
+            crawl_shard_http(target, shard, pages, journal, seen, done_file, scheduler, snapshots)
+        else:
+            crawl_shard_browser(target, shard, pages, journal, seen, done_file, headless, scheduler, snapshots,
+                                block_resources)
+        return shard["shard"], None
+    except Exception as e:
+        print(f"[shard {shard['shard']}] failed: {e}")
+        return shard["shard"], str(e)
+    finally:
+        journal.flush()
+        seen.close()
+        timings.close()
+
+
+def finish_page(shard, page_number, to_scrape, scraped, journal, seen, done_file, target_seen, gave_up=False):
+    # Journal the page's changed results (in link order), then checkpoint it; the journal is flushed first
+    for url, card_text in to_scrape:
+        if url in scraped:
+            metrics.record_fields(scraped[url])
+            persist_record(journal, seen, url, card_text, scraped[url], known=target_seen)
+    with metrics.time("persist"):
+        journal.flush()
+        seen.commit()
+    metrics.write()
+    if gave_up:
+        # Leave the page unmarked so the shard's retry starts with it again
+        raise RuntimeError(f"site keeps failing on page {page_number}")
+    mark_page_done(done_file, page_number)
+    print(f"[shard {shard['shard']}] page {page_number}: {len(scraped)} properties")
+
+
+def crawl_shard_browser(target, shard, pages, journal, seen, done_file, headless, scheduler, snapshots=None,
+                        block_resources=True):
+    from playwright.sync_api import sync_playwright
+    from readiness import goto_ready, SEARCH_READY_SELECTOR
+    from crawler import search_page_cards, scrape_detail_page
+    from browser_pool import PagePool
+    # The target's index (bootstrapped by run_sharded), so shards skip known listings
+    target_seen = SeenIndex(target.seen_db, read_only=True)
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        try:
+            detail_pages = PagePool(browser, block=block_resources)
+            page = detail_pages.new_page()
+            for page_number in pages:
+                for attempt in range(3):
+                    timer = PhaseTimer(target.page_url(page_number), "search")
+                    try:
+                        goto_ready(page, timer.url, SEARCH_READY_SELECTOR, timer)
+                        timer.log()
+                        break
+                    except Exception as e:
+                        print(f"[shard {shard['shard']}] page {page_number} navigation failed (attempt {attempt + 1}/3): {e}")
+                        time.sleep(max(backoff_delay(attempt), getattr(e, "retry_after", None) or 0))
+                else:
+                    raise RuntimeError(f"could not load page {page_number}")
+
+                with metrics.time("search_links"):
+                    cards = search_page_cards(page, target.base_url)
+                to_scrape = [(url, card_text) for url, card_text in cards
+                             if target_seen.should_scrape(url, card_fingerprint(card_text))]
+                scraped = scheduler.run([url for url, _ in to_scrape], lambda url: scrape_detail_page(detail_pages, url, snapshots))
+                finish_page(shard, page_number, to_scrape, scraped, journal, seen, done_file, target_seen,
+                            scheduler.gave_up(target.search_url))
+        finally:
+            target_seen.close()
+            browser.close()
+
+
+def crawl_shard_http(target, shard, pages, journal, seen, done_file, scheduler, snapshots=None):
+    from http_fetch import make_sync_client, fetch_html_sync, parse_search_html, extract_from_html
+    target_seen = SeenIndex(target.seen_db, read_only=True)
+    with make_sync_client() as client:
+        try:
+            for page_number in pages:
+                for attempt in range(3):
+                    timer = PhaseTimer(target.page_url(page_number), "search")
+                    try:
+                        with timer.phase("navigate"):
+                            page_html = fetch_html_sync(client, timer.url)
+                        timer.log()
+                        with metrics.time("search_links"):
+                            cards, _ = parse_search_html(page_html, target.base_url)
+                        break
+                    except Exception as e:
+                        print(f"[shard {shard['shard']}] page {page_number} fetch failed (attempt {attempt + 1}/3): {e}")
+                        time.sleep(max(backoff_delay(attempt), getattr(e, "retry_after", None) or 0))
+                else:
+                    raise RuntimeError(f"could not load page {page_number}")
+
+                to_scrape = [(url, card_text) for url, card_text in cards
+                             if target_seen.should_scrape(url, card_fingerprint(card_text))]
+
+                def fetch_detail(url):
+                    timer = PhaseTimer(url)
+                    try:
+                        with timer.phase("navigate"):
+                            page_html = fetch_html_sync(client, url)
+                        with timer.phase("parse"):
+                            property_data = extract_from_html(page_html, url)
+                        with timer.phase("snapshot"):
+                            save_snapshot(snapshots, url, page_html)
+                        return property_data
+                    finally:
+                        timer.log()
+
+                scraped = scheduler.run([url for url, _ in to_scrape], fetch_detail)
+                finish_page(shard, page_number, to_scrape, scraped, journal, seen, done_file, target_seen,
+                            scheduler.gave_up(target.search_url))
+        finally:
+            target_seen.close()
+
+
+def merge_shards(target, plan):
+    # Fold every shard's journal and seen index into the target's, then compact
+    journal = PropertyJournal(target.csv_file)
+    seen = SeenIndex(target.seen_db)
+    seen.bootstrap_from_csv(target.csv_file)
+    merged = 0
+    for shard in plan["shards"]:
+        directory = shard_dir(target, shard)
+        shard_journal = PropertyJournal(os.path.join(directory, "properties.csv"))
+        for record in shard_journal.iter_journal():
+            journal.append(record)
+            merged += 1
+        shard_seen = os.path.join(directory, "seen.db")
+        if os.path.exists(shard_seen):
+            seen.merge_from(shard_seen)
+    journal.flush()
+    seen.close()
+    if len(journal):
+        with metrics.time("persist"):
+            journal.compact()
+    print(f"Merged {merged} properties from {len(plan['shards'])} shards into {target.csv_file}")
+
+
+def run_sharded(target, shard_count, backend="browser", headless=True, retries=2, max_pages=None, rate_per_host=1.0,
+                metrics_file=None, block_resources=True, timings_file=None):
+    plan = load_or_create_plan(target, shard_count, backend, headless, max_pages)
+    # Seed the target's seen index from its CSV before the shards read it, so listings
+    # already in the CSV are not scraped again
+    seen = SeenIndex(target.seen_db)
+    seen.bootstrap_from_csv(target.csv_file)
+    seen.close()
+    pending = list(plan["shards"])
+    # spawn, not fork: Playwright's driver does not survive being forked
+    ctx = multiprocessing.get_context("spawn")
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying {len(pending)} failed shards (attempt {attempt + 1}/{retries + 1})")
+        # The per-host rate is split between the shards, which cannot share a limiter
+        jobs = [(target, shard, backend, headless, rate_per_host / len(pending), metrics_file, block_resources,
+                 timings_file) for shard in pending]
+        with ctx.Pool(processes=len(pending)) as pool:
+            outcomes = pool.map(crawl_shard, jobs, chunksize=1)
+        failed = {number for number, error in outcomes if error}
+        pending = [shard for shard in pending if shard["shard"] in failed]
+
+    merge_shards(target, plan)
+    if pending:
+        # Keep shard state so the next run only redoes the failed shards' remaining pages
+        print(f"Shards {[shard['shard'] for shard in pending]} still failing; their progress is kept for the next run")
+    else:
+        shutil.rmtree(os.path.join(target.state_dir, "shards"), ignore_errors=True)
+        print(f"Sharded crawl of {target.name} complete")
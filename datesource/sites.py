@@ -0,0 +1,230 @@
+from urllib.parse import urljoin, urlparse
+import argparse
+import json
+import sys
+from extract import EXTRACT_JS, EXTRACT_ARGS, DESCRIPTION_XPATH, build_property_data, empty_property_data
+from readiness import SEARCH_READY_SELECTOR, DETAIL_READY_SELECTOR
+from field_rules import first_number, contact_value, price_value, photos_value
+from browser_pool import site_of, is_first_party
+
+# Site adapters: everything that is specific to one listing portal. The crawl
+# pipeline (async_scraper.py), storage and seen index are shared; an adapter says how
+# to find the search pages, the listing cards and the next page on them, and how to
+# turn a detail page into a record with the storage.FIELDNAMES schema. Each adapter
+# also carries its politeness budget: its own rate limit per host, and a cap on how
+# many of the crawl's global concurrency slots it may hold at once (scheduler.FairSlots).
+#
+# SiteAdapter is nigeriapropertycentre.com, the site the crawler was written for.
+# Portals that can be described by CSS selectors alone are added without code, from a
+# JSON file of SelectorSite settings (crawler.py --sites):
+#
+#   [{"name": "example", "base_url": "https://example.com",
+#     "search_path": "/{slug}", "card_selector": "article.listing",
+#     "card_link_selector": "a.listing-link", "next_selector": "a.next",
+#     "fields": {"Title": "h1", "Address": ".location", "Price": ".amount",
+#                "Bedrooms": ".beds", "Description": ".description"},
+#     "rate_per_host": 0.5, "max_concurrency": 2}]
+#
+# Targets name their site as "<site>:<slug>" (e.g. example:for-rent/lagos), or by a
+# search URL on the site's host.
+
+DEFAULT_SITE = "propertycentre"
+
+# Returns the innerText of the first element matching each field's selector (null when missing)
+SELECTOR_JS = """
+(fields) => Object.fromEntries(Object.entries(fields).map(([field, selector]) => {
+    const el = document.querySelector(selector);
+    return [field, el ? el.innerText : null];
+}))
+"""
+
+# How a SelectorSite turns each field's element text into the stored value
+FIELD_VALUES = {
+    "Price": price_value,
+    "Contact": contact_value,
+    "Photos": lambda text: photos_value(text) if "of" in text else first_number(text),
+    "Bedrooms": first_number,
+    "Bathrooms": first_number,
+    "Toilets": first_number,
+    "Parking Spaces": first_number,
+}
+
+
+class SiteAdapter:
+    name = DEFAULT_SITE
+    base_url = "https://nigeriapropertycentre.com"
+    # Search URLs the site uses for the targets we crawl today; any other
+    # "<listing-type>/<place>" slug gets the site's generic query URL
+    known_search_urls = {
+        "for-rent/lagos": "https://nigeriapropertycentre.com/for-rent/lagos?selectedLoc=1&q=for-rent+lagos",
+        "for-sale/lagos": "https://nigeriapropertycentre.com/for-sale/lagos?selectedLoc=1&q=for-sale+lagos",
+    }
+    card_selector = ".wp-block-content"
+    card_link_selector = "a:has(h4.content-title)"
+    next_selector = "a.pagination-next, a[rel='next']"
+    search_ready_selector = SEARCH_READY_SELECTOR
+    detail_ready_selector = DETAIL_READY_SELECTOR
+    # Waited for (briefly) on rendered detail pages before extracting; None to skip
+    description_selector = f"xpath={DESCRIPTION_XPATH}"
+    extract_js = EXTRACT_JS
+    extract_args = EXTRACT_ARGS
+    # None: the crawl's --rate-per-host / all of its slots
+    rate_per_host = None
+    max_concurrency = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name}: {self.base_url})"
+
+    def search_url(self, slug):
+        return self.known_search_urls.get(slug) or f"{self.base_url}/{slug}?q={slug.replace('/', '+')}"
+
+    def matches(self, url):
+        # url is on this site's host (or a subdomain), and port
+        return urlparse(url).port == urlparse(self.base_url).port and is_first_party(url, site_of(self.base_url))
+
+    def target_name(self, slug):
+        # State directory name of a target; this site's keep the names they always had
+        return slug.replace("/", "-")
+
+    def parse_search_html(self, page_html, url):
+        # -> ([(detail_url, card_text)], next_page_url or None)
+        from http_fetch import parse_search_html
+        return parse_search_html(page_html, url)
+
+    def parse_detail_html(self, page_html):
+        # Static HTML -> the same raw dict the browser gets from extract_js
+        from http_fetch import parse_detail_html
+        return parse_detail_html(page_html)
+
+    def build(self, raw, url):
+        # Raw extraction -> property_data with every storage.FIELDNAMES field
+        return build_property_data(raw, url)
+
+    def extract_html(self, page_html, url):
+        return self.build(self.parse_detail_html(page_html), url)
+
+
+class SelectorSite(SiteAdapter):
+    # A portal described by selectors: search_path is formatted with the target's slug,
+    # and each field of `fields` is the text of the first element its CSS selector matches
+    description_selector = None
+    extract_js = SELECTOR_JS
+
+    def __init__(self, name, base_url, card_selector, card_link_selector, next_selector, fields,
+                 search_path="/{slug}", search_urls=None, detail_ready_selector=None, rate_per_host=None,
+                 max_concurrency=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.search_path = search_path
+        self.known_search_urls = search_urls or {}
+        self.card_selector = card_selector
+        self.card_link_selector = card_link_selector
+        self.next_selector = next_selector
+        self.fields = fields
+        self.search_ready_selector = card_selector
+        self.detail_ready_selector = detail_ready_selector or ", ".join(fields.values())
+        self.extract_args = fields
+        self.rate_per_host = rate_per_host
+        self.max_concurrency = max_concurrency
+
+    def search_url(self, slug):
+        return self.known_search_urls.get(slug) or urljoin(f"{self.base_url}/", self.search_path.format(slug=slug))
+
+    def target_name(self, slug):
+        return f"{self.name}-{slug.replace('/', '-')}".strip("-")
+
+    def parse_search_html(self, page_html, url):
+        from lxml import html as lxml_html
+        from http_fetch import inner_text
+        tree = lxml_html.fromstring(page_html)
+        cards = []
+        for card in tree.cssselect(self.card_selector):
+            links = card.cssselect(self.card_link_selector)
+            href = links[0].get("href") if links else None
+            if href:
+                cards.append((urljoin(url, href), inner_text(card)))
+        next_elem = tree.cssselect(self.next_selector)
+        next_href = next_elem[0].get("href") if next_elem else None
+        return cards, (urljoin(url, next_href) if next_href else None)
+
+    def parse_detail_html(self, page_html):
+        from lxml import html as lxml_html
+        from http_fetch import inner_text
+        tree = lxml_html.fromstring(page_html)
+        raw = {}
+        for field, selector in self.fields.items():
+            found = tree.cssselect(selector)
+            raw[field] = inner_text(found[0]) if found else None
+        return raw
+
+    def build(self, raw, url):
+        property_data = empty_property_data(url)
+        for field, text in raw.items():
+            text = (text or "").strip()
+            if text and field in property_data and field != "Link":
+                value = FIELD_VALUES.get(field, str)(text)
+                property_data[field] = value or "N/A"
+        return property_data
+
+
+SITES = {DEFAULT_SITE: SiteAdapter()}
+
+
+def register(site):
+    SITES[site.name] = site
+    return site
+
+
+def load_sites(path):
+    # Register the SelectorSite settings in a JSON file (a list of objects)
+    with open(path, encoding='utf-8') as f:
+        settings = json.load(f)
+    return [register(SelectorSite(**site)) for site in settings]
+
+
+def get_site(name):
+    if name not in SITES:
+        raise ValueError(f"Unknown site {name!r}; known sites: {', '.join(SITES)}")
+    return SITES[name]
+
+
+def site_for_url(url):
+    # The adapter whose host serves url; anything else (e.g. fixture_site.py) is read
+    # like the default site
+    for site in SITES.values():
+        if site.name != DEFAULT_SITE and site.matches(url):
+            return site
+    return SITES[DEFAULT_SITE]
+
+
+def split_spec(spec):
+    # "<site>:<slug>" -> (site, slug); plain slugs and URLs -> (None, spec)
+    if urlparse(spec).scheme in ("http", "https"):
+        return None, spec
+    name, sep, slug = spec.partition(":")
+    return (name, slug) if sep else (None, spec)
+
+
+if __name__ == "__main__":
+    # Offline check of an adapter: python sites.py saved_detail_page.html url [--site NAME --sites FILE]
+    parser = argparse.ArgumentParser(description="Extract a saved detail page with a site adapter")
+    parser.add_argument("html_file")
+    parser.add_argument("url")
+    parser.add_argument("--site", default=None, help="adapter to use (default: the one for the URL's host)")
+    parser.add_argument("--sites", default=None, metavar="FILE", help="JSON file of selector-based site adapters")
+    parser.add_argument("--search", action="store_true", help="the file is a search results page")
+    args = parser.parse_args()
+    if args.sites:
+        load_sites(args.sites)
+    site = get_site(args.site) if args.site else site_for_url(args.url)
+    with open(args.html_file, encoding='utf-8') as f:
+        saved_html = f.read()
+    print(f"Using {site}", file=sys.stderr)
+    if args.search:
+        cards, next_url = site.parse_search_html(saved_html, args.url)
+        for link, card_text in cards:
+            print(f"{link}  {card_text[:80]!r}")
+        print(f"Next page: {next_url}")
+    else:
+        for key, value in site.extract_html(saved_html, args.url).items():
+            print(f"{key}: {value[:200] if isinstance(value, str) else value}")
@@ -0,0 +1,182 @@
+from datetime import datetime
+import multiprocessing
+import argparse
+import hashlib
+import json
+import sys
+import os
+from storage import PropertyJournal, CsvChunkWriter, FIELDNAMES
+from seen_index import SeenIndex, persist_record
+
+# Raw HTML of every scraped detail page, so extraction fixes can be re-run offline
+# instead of re-crawling. One zstd blob per listing, addressed by the sha1 of its Link:
+#   state/<target>/snapshots/ab/ab12...ef.html.zst
+# A blob is a JSON header line ({"link": ..., "fetched_at": ...}) followed by the HTML.
+# Re-scraping a listing replaces its blob.
+
+
+def snapshot_key(link):
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()
+
+
+class SnapshotStore:
+    def __init__(self, root, level=6):
+        # Imported here so crawls with --no-snapshots do not need zstandard installed
+        import zstandard
+        self.root = root
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def path(self, link):
+        key = snapshot_key(link)
+        return os.path.join(self.root, key[:2], f"{key}.html.zst")
+
+    def save(self, link, page_html):
+        # Written to a temporary file and renamed, so a crash never leaves half a blob
+        path = self.path(link)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = json.dumps({"link": link, "fetched_at": datetime.now().isoformat(timespec='seconds')})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.compressor.compress(f"{header}\n{page_html}".encode('utf-8')))
+        os.replace(tmp_path, path)
+
+    def load_file(self, path):
+        # -> (header dict, html)
+        with open(path, 'rb') as f:
+            payload = self.decompressor.decompress(f.read()).decode('utf-8')
+        header, _, page_html = payload.partition("\n")
+        return json.loads(header), page_html
+
+    def load(self, link):
+        path = self.path(link)
+        return self.load_file(path)[1] if os.path.exists(path) else None
+
+    def __contains__(self, link):
+        return os.path.exists(self.path(link))
+
+    def paths(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            os.path.join(self.root, prefix, name)
+            for prefix in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, prefix))
+            for name in os.listdir(os.path.join(self.root, prefix))
+            if name.endswith(".html.zst")
+        )
+
+
+def open_store(snapshot_dir):
+    # SnapshotStore for a target, or None when snapshots are off or zstandard is missing
+    if not snapshot_dir:
+        return None
+    try:
+        return SnapshotStore(snapshot_dir)
+    except ImportError:
+        print("zstandard is not installed; detail page HTML will not be saved")
+        return None
+
+
+def save_snapshot(snapshots, link, page_html):
+    # A failed snapshot never fails the scrape
+    if snapshots is None or not page_html:
+        return
+    try:
+        snapshots.save(link, page_html)
+    except Exception as e:
+        print(f"Failed to save snapshot of {link}: {e}")
+
+
+worker_store = None
+worker_site = None
+
+
+def init_worker(root, site=None):
+    global worker_store, worker_site
+    worker_store = SnapshotStore(root)
+    worker_site = site
+    # build_property_data logs every page; keep the workers quiet
+    sys.stdout = open(os.devnull, 'w')
+
+
+def extract_snapshot(path):
+    # Runs in a worker process. Returns (fetched_at, property_data), or None for an unreadable blob.
+    from http_fetch import extract_from_html
+    try:
+        header, page_html = worker_store.load_file(path)
+        if worker_site is not None:
+            return header["fetched_at"], worker_site.extract_html(page_html, header["link"])
+        return header["fetched_at"], extract_from_html(page_html, header["link"])
+    except Exception:
+        return None
+
+
+def reextract(snapshot_dir, workers=None, chunksize=32, site=None):
+    # Re-run the parser (site's extraction, see sites.py) over every snapshot in parallel;
+    # records come back in fetch order
+    store = SnapshotStore(snapshot_dir)
+    paths = store.paths()
+    with multiprocessing.Pool(processes=workers, initializer=init_worker, initargs=(snapshot_dir, site)) as pool:
+        results = pool.map(extract_snapshot, paths, chunksize=chunksize)
+    failed = results.count(None)
+    if failed:
+        print(f"Skipped {failed} unreadable snapshots in {snapshot_dir}")
+    results = sorted((result for result in results if result), key=lambda result: result[0])
+    return [property_data for _, property_data in results]
+
+
+def reextract_target(target, workers=None, output_file=None):
+    # Rebuild a target's CSV from its snapshots. Re-extracted records go through the
+    # journal, so they replace the rows with the same Link and listings scraped before
+    # snapshots existed are kept; like a crawl, only records whose content changed are
+    # journaled, and the seen index takes their new fingerprints (so the next crawl does
+    # not count them as changed again). With output_file, only the re-extracted records
+    # are written there.
+    records = reextract(target.snapshot_dir, workers, site=target.site)
+    if output_file:
+        import pandas as pd
+        writer = CsvChunkWriter(output_file)
+        try:
+            if records:
+                writer.write(pd.DataFrame(records, columns=FIELDNAMES))
+        finally:
+            writer.close()
+        print(f"Re-extracted {len(records)} properties from {target.snapshot_dir} into {output_file}")
+        return len(records)
+
+    journal = PropertyJournal(target.csv_file, batch_size=5000)
+    seen = SeenIndex(target.seen_db)
+    seen.bootstrap_from_csv(target.csv_file)
+    changed = 0
+    try:
+        for property_data in records:
+            # No search card here: the listing keeps the one it was crawled with
+            changed += persist_record(journal, seen, property_data["Link"], None, property_data)
+        journal.flush()
+        seen.commit()
+    finally:
+        seen.close()
+    if len(journal):
+        journal.compact()
+    print(f"Re-extracted {len(records)} properties from {target.snapshot_dir} into {target.csv_file} ({changed} changed)")
+    return len(records)
+
+
+if __name__ == "__main__":
+    from targets import parse_targets, DEFAULT_TARGETS
+    parser = argparse.ArgumentParser(description="Re-extract properties from saved detail page HTML, without network access")
+    parser.add_argument("targets", nargs="*", help=f"targets to rebuild (default: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--state-dir", default="state")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--out", default=None, help="write the re-extracted records to this CSV instead of updating the target's CSV")
+    parser.add_argument("--sites", default=None, metavar="FILE", help="JSON file of the site adapters the targets were crawled with (see sites.py)")
+    args = parser.parse_args()
+    if args.sites:
+        from sites import load_sites
+        load_sites(args.sites)
+    targets = parse_targets(args.targets, args.state_dir)
+    if args.out and len(targets) > 1:
+        parser.error("--out takes a single target")
+    for target in targets:
+        reextract_target(target, args.workers, args.out)
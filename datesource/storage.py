@@ -0,0 +1,227 @@
+import pandas as pd
+import json
+import time
+import os
+
+FIELDNAMES = ["Title", "Address", "Price", "Description", "Contact", "Photos", "Link",
+              "Bedrooms", "Bathrooms", "Toilets", "Parking Spaces"]
+
+
+class PropertyJournal:
+    # Append-only persistence for scraped listings.
+    #
+    # New records are buffered and appended as JSON lines to a journal file next to
+    # the CSV, flushed (and fsync'd) every `batch_size` records or `flush_interval`
+    # seconds. The CSV itself is only rewritten by compact(), which streams the old
+    # CSV and the journal into a temp file and atomically renames it into place.
+    def __init__(self, csv_file, journal_file=None, batch_size=20, flush_interval=30.0):
+        self.csv_file = csv_file
+        self.journal_file = journal_file or f"{csv_file}.journal"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.existing_count = count_csv_rows(csv_file)
+        self.journal_count = self._recover_journal()
+
+    def __len__(self):
+        return self.existing_count + self.journal_count + len(self.buffer)
+
+    def _recover_journal(self):
+        # Drop a torn last line left by a crash mid-write, then count the records
+        if not os.path.exists(self.journal_file):
+            return 0
+        count = 0
+        good_size = 0
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                good_size += len(line)
+                count += 1
+        if good_size < os.path.getsize(self.journal_file):
+            print(f"Truncating torn journal tail in {self.journal_file}")
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(good_size)
+                f.flush()
+                os.fsync(f.fileno())
+        if count:
+            print(f"Recovered {count} journaled properties from {self.journal_file}")
+        return count
+
+    def append(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self.buffer)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_count += len(self.buffer)
+        print(f"Journaled {len(self.buffer)} properties to {self.journal_file}")
+        self.buffer = []
+
+    def iter_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def iter_records(self, chunksize=5000):
+        # Streams the compacted CSV followed by the journal, one dict at a time
+        for chunk in iter_csv_chunks(self.csv_file, chunksize):
+            yield from chunk.to_dict('records')
+        yield from self.iter_journal()
+
+    def compact(self, output_file=None, chunksize=5000):
+        # Merge the CSV and the journal into `output_file` (default: the CSV itself).
+        # A journaled record replaces any older CSV row with the same Link, and only the
+        # latest journal entry per Link is kept. The journal is removed only once the CSV
+        # it was merged into has been renamed into place.
+        self.flush()
+        output_file = output_file or self.csv_file
+        last_entry = {}
+        for i, record in enumerate(self.iter_journal()):
+            last_entry[record.get("Link")] = i
+        journal_links = set(last_entry)
+        tmp_file = f"{output_file}.tmp"
+
+        writer = ParquetChunkWriter(tmp_file) if output_file.endswith(".parquet") else CsvChunkWriter(tmp_file)
+        total = 0
+        try:
+            for chunk in iter_csv_chunks(self.csv_file, chunksize):
+                if journal_links:
+                    chunk = chunk[~chunk["Link"].isin(journal_links)]
+                writer.write(chunk)
+                total += len(chunk)
+            batch = []
+            for i, record in enumerate(self.iter_journal()):
+                if last_entry.get(record.get("Link")) != i:
+                    continue
+                batch.append(record)
+                if len(batch) >= chunksize:
+                    writer.write(pd.DataFrame(batch, columns=FIELDNAMES))
+                    total += len(batch)
+                    batch = []
+            if batch:
+                writer.write(pd.DataFrame(batch, columns=FIELDNAMES))
+                total += len(batch)
+        finally:
+            writer.close()
+
+        os.replace(tmp_file, output_file)
+        fsync_dir(output_file)
+        print(f"Compacted {total} properties into {output_file}")
+
+        if output_file == self.csv_file:
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+                fsync_dir(self.journal_file)
+            self.existing_count = total
+            self.journal_count = 0
+        return total
+
+
+class CsvChunkWriter:
+    def __init__(self, path):
+        self.f = open(path, 'w', encoding='utf-8', newline='')
+        self.wrote_header = False
+
+    def write(self, df):
+        df.to_csv(self.f, index=False, header=not self.wrote_header)
+        self.wrote_header = True
+
+    def close(self):
+        if not self.wrote_header:
+            pd.DataFrame(columns=FIELDNAMES).to_csv(self.f, index=False)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+
+class ParquetChunkWriter:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([(name, pa.string()) for name in FIELDNAMES])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.path = path
+
+    def write(self, df):
+        df = df.reindex(columns=FIELDNAMES).astype("string")
+        self.writer.write_table(self.pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+        with open(self.path, 'rb') as f:
+            os.fsync(f.fileno())
+
+
+def iter_csv_chunks(csv_file, chunksize=5000, usecols=None):
+    # Values are kept as the exact strings that were scraped ("N/A" stays "N/A")
+    if not os.path.exists(csv_file):
+        return
+    try:
+        yield from pd.read_csv(csv_file, encoding='utf-8', dtype=str, keep_default_na=False,
+                               chunksize=chunksize, usecols=usecols)
+    except pd.errors.EmptyDataError:
+        return
+
+
+def iter_journal_chunks(journal_file, offset=0, chunksize=50000, skip_bad=False):
+    # Raw chunks of the complete journal lines from byte `offset` on, with the offset
+    # just past each chunk (a line still being written is left for the next update).
+    # skip_bad: skip lines that are not JSON (e.g. when offset is not at a line start) instead of raising
+    if not os.path.exists(journal_file):
+        return
+    with open(journal_file, 'rb') as f:
+        f.seek(offset)
+        records = []
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                if not skip_bad:
+                    raise
+                print(f"Skipping an unreadable line of {journal_file} at byte {offset}: {e}")
+            offset += len(line)
+            if len(records) >= chunksize:
+                yield pd.DataFrame(records).reindex(columns=FIELDNAMES).fillna("N/A").astype(str), offset
+                records = []
+        if records:
+            yield pd.DataFrame(records).reindex(columns=FIELDNAMES).fillna("N/A").astype(str), offset
+
+
+def count_csv_rows(csv_file):
+    try:
+        return sum(len(chunk) for chunk in iter_csv_chunks(csv_file, 50000, usecols=["Link"]))
+    except Exception as e:
+        print(f"Failed to count rows in {csv_file}: {e}")
+        return 0
+
+
+def fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,80 @@
+from urllib.parse import urlparse
+import os
+from storage import CsvChunkWriter, iter_csv_chunks
+from sites import get_site, site_for_url, split_spec, DEFAULT_SITE
+
+DEFAULT_TARGETS = ["for-rent/lagos", "for-sale/lagos"]
+
+# The shared CSV both old scripts wrote to, before state was split per target
+LEGACY_CSV = "properties.csv"
+
+
+class Target:
+    # One search to crawl, with its own state files under state_dir/<name>/.
+    # spec: a slug of the default site ("for-rent/lagos"), "<site>:<slug>", or a search URL
+    # (crawled with the adapter of its host, see sites.py). A search URL on a host other
+    # than its site's (e.g. fixture_site.py) has the host in its name, so its state never
+    # mixes with the site's own target of the same slug.
+    def __init__(self, spec, state_dir="state"):
+        site_name, spec = split_spec(spec)
+        if spec.startswith("http://") or spec.startswith("https://"):
+            self.site = get_site(site_name) if site_name else site_for_url(spec)
+            self.search_url = spec
+            slug = urlparse(spec).path.strip("/")
+        else:
+            self.site = get_site(site_name or DEFAULT_SITE)
+            slug = spec.strip("/")
+            self.search_url = self.site.search_url(slug)
+        parsed = urlparse(self.search_url)
+        self.base_url = f"{parsed.scheme}://{parsed.netloc}"
+        self.slug = slug
+        self.on_site_host = self.site.matches(self.search_url)
+        self.name = self.site.target_name(slug)
+        if not self.on_site_host:
+            host = parsed.netloc.replace(":", "-")
+            self.name = f"{host}-{self.name}" if self.name else host
+        self.listing_type = slug.split("/")[0]
+        self.state_dir = os.path.join(state_dir, self.name)
+        self.csv_file = os.path.join(self.state_dir, "properties.csv")
+        self.last_page_file = os.path.join(self.state_dir, "last_page.txt")
+        self.seen_db = os.path.join(self.state_dir, "seen.db")
+        # Raw detail page HTML for offline re-extraction; None turns snapshots off
+        self.snapshot_dir = os.path.join(self.state_dir, "snapshots")
+
+    def __repr__(self):
+        return f"Target({self.name}: {self.search_url})"
+
+    def page_url(self, page_number):
+        return f"{self.search_url}&page={page_number}" if "?" in self.search_url else f"{self.search_url}?page={page_number}"
+
+    def prepare(self, legacy_csv=LEGACY_CSV):
+        os.makedirs(self.state_dir, exist_ok=True)
+        # The legacy CSV only ever held nigeriapropertycentre.com listings
+        legacy = self.site.name == DEFAULT_SITE and self.on_site_host
+        if legacy and not os.path.exists(self.csv_file) and os.path.exists(legacy_csv):
+            self.import_legacy_csv(legacy_csv)
+
+    def import_legacy_csv(self, legacy_csv):
+        # Seed this target's CSV with the rows of the shared legacy CSV whose Link
+        # belongs to this listing type (e.g. /for-rent/), streaming it in chunks
+        marker = f"/{self.listing_type}/"
+        tmp_file = f"{self.csv_file}.tmp"
+        writer = CsvChunkWriter(tmp_file)
+        count = 0
+        try:
+            for chunk in iter_csv_chunks(legacy_csv):
+                chunk = chunk[chunk["Link"].str.contains(marker, regex=False)]
+                writer.write(chunk)
+                count += len(chunk)
+        finally:
+            writer.close()
+        os.replace(tmp_file, self.csv_file)
+        print(f"Imported {count} {self.listing_type} properties from {legacy_csv} into {self.csv_file}")
+
+
+def parse_targets(specs, state_dir="state"):
+    targets = [Target(spec, state_dir) for spec in specs or DEFAULT_TARGETS]
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate targets: {names}")
+    return targets
@@ -0,0 +1,18 @@
+import random
+from bench_field_rules import EDGE_CASES, check, synthetic_page
+from field_rules import parse_fallback_text, parse_spec_row
+
+
+def test_rule_table_matches_the_line_loop():
+    rng = random.Random(0)
+    check(EDGE_CASES + [synthetic_page(rng) for _ in range(200)])
+
+
+def test_superscripts_count_as_digits():
+    assert parse_fallback_text("Plot of m²")["Photos"] == "m²"
+    assert parse_fallback_text("Bedrooms ²")["Bedrooms"] == "N/A"
+
+
+def test_spec_rows():
+    assert parse_spec_row(" Bedrooms ", "4 beds") == {"Bedrooms": "4"}
+    assert parse_spec_row("Serviced", "Yes") == {}
@@ -0,0 +1,51 @@
+import json
+import os
+import pytest
+from extract import EXTRACT_ARGS, EXTRACT_JS, build_property_data
+from http_fetch import extract_from_html, parse_detail_html
+
+# detail_page.html is a saved detail page in the site's layout (the description and
+# fallback XPaths resolve in it); detail_page.json is what EXTRACT_JS returns for it in
+# the browser. The HTTP backend must read the same values out of the static HTML, so
+# both backends journal identical records.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+URL = "https://nigeriapropertycentre.com/for-rent/flats-apartments/lekki/1024377-3-bedroom-flat"
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_static_html_reads_what_the_browser_reads():
+    assert parse_detail_html(load_fixture("detail_page.html")) == json.loads(load_fixture("detail_page.json"))
+
+
+def test_http_extraction_matches_the_browser_path():
+    property_data = extract_from_html(load_fixture("detail_page.html"), URL)
+    assert property_data == build_property_data(json.loads(load_fixture("detail_page.json")), URL)
+    assert property_data["Price"] == "4500000"
+    assert property_data["Contact"] == "08031234567"
+    assert property_data["Photos"] == "14"
+    # Missing from the specifications table, found by the fallback text
+    assert property_data["Parking Spaces"] == "2"
+    assert property_data["Description"].startswith("Property description\n\nTastefully finished")
+
+
+def test_browser_path_matches_the_recorded_extraction():
+    # Re-checks detail_page.json against a real browser, where one is installed
+    sync_api = pytest.importorskip("playwright.sync_api")
+    with sync_api.sync_playwright() as p:
+        try:
+            browser = p.chromium.launch()
+        except Exception as e:
+            pytest.skip(f"no browser: {str(e).splitlines()[0]}")
+        try:
+            page = browser.new_page()
+            page.set_content(load_fixture("detail_page.html"))
+            raw = page.evaluate(EXTRACT_JS, EXTRACT_ARGS)
+        finally:
+            browser.close()
+    assert raw == json.loads(load_fixture("detail_page.json"))
+    assert build_property_data(raw, URL) == extract_from_html(load_fixture("detail_page.html"), URL)
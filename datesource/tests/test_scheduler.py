@@ -0,0 +1,274 @@
+import asyncio
+import httpx
+import pytest
+from fixture_site import FixtureSite
+from http_fetch import fetch_html_sync
+from scheduler import (AdaptiveRateLimiter, CircuitOpen, CrawlScheduler, FairSlots, ListingBudget, Throttled,
+                       backoff_delay, parse_retry_after)
+
+# The rate limiter and scheduler run on a fake clock here: sleeping only moves the
+# clock forward and records the wait. The fixture site tests at the end use real time
+# against fixture_site.py's 429/503 modes, with Retry-After of a second.
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+class MaxRng:
+    # Jitter always at its top end
+    def uniform(self, low, high):
+        return high
+
+
+class FlakyFetch:
+    # Fails each URL's first `failures[url]` attempts with `error`
+    def __init__(self, failures, error=None):
+        self.failures = dict(failures)
+        self.error = error
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        if self.failures.get(url, 0) > 0:
+            self.failures[url] -= 1
+            if self.error is not None:
+                raise self.error(url)
+            return None
+        return f"record {url}"
+
+
+def make_scheduler(clock, **kwargs):
+    limiter = AdaptiveRateLimiter(kwargs.pop("rate_per_host", 1.0), clock=clock, **kwargs.pop("limiter", {}))
+    return CrawlScheduler(limiter, clock=clock, sleep=clock.sleep, async_sleep=clock.async_sleep, rng=MaxRng(), **kwargs)
+
+
+def test_backoff_delay_doubles_up_to_the_cap():
+    assert [backoff_delay(attempt, base=2.0, cap=120.0, rng=MaxRng()) for attempt in range(8)] == \
+        [2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 120.0, 120.0]
+    # Half of the delay is never jittered away
+    assert backoff_delay(3, base=2.0, cap=120.0) >= 8.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("30") == 30.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_limiter_spaces_requests_per_host():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rate_per_host=2.0, clock=clock)
+    assert limiter.reserve("http://a.test/1") == 0.0
+    assert limiter.reserve("http://a.test/2") == 0.5
+    # Another host has its own schedule
+    assert limiter.reserve("http://b.test/1") == 0.0
+
+
+def test_limiter_honours_retry_after_and_slows_down():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rate_per_host=2.0, clock=clock)
+    limiter.reserve("http://a.test/1")
+    limiter.record("http://a.test/1", 0.1, False, 429, 30.0)
+    assert limiter.reserve("http://a.test/2") == 30.0
+    assert limiter.host("http://a.test/").interval == 1.0
+    # Fast successes speed it back up to the configured rate, never past it
+    for _ in range(20):
+        limiter.record("http://a.test/2", 0.1, True)
+    assert limiter.host("http://a.test/").interval == 0.5
+
+
+def test_scheduler_retries_after_backoff_or_retry_after():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, backoff_base=2.0)
+    fetch = FlakyFetch({"http://a.test/1": 1}, error=lambda url: Throttled(url, 503, 30.0))
+    results = scheduler.run(["http://a.test/1", "http://a.test/2"], fetch)
+    assert set(results) == {"http://a.test/1", "http://a.test/2"}
+    # The failed URL goes to the end of the batch, not retried in place
+    assert fetch.calls == ["http://a.test/1", "http://a.test/2", "http://a.test/1"]
+    assert scheduler.retries == 1
+    # Retry-After (30s) outweighs the first backoff (2s)
+    assert clock.now >= 30.0
+
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, backoff_base=2.0)
+    results = scheduler.run(["http://a.test/1"], FlakyFetch({"http://a.test/1": 2}))
+    assert results == {"http://a.test/1": "record http://a.test/1"}
+    # Backoffs of 2s and 4s with the jitter at its top
+    assert clock.now >= 6.0
+
+
+def test_scheduler_gives_up_after_its_attempts():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, attempts=3)
+    given_up = []
+    fetch = FlakyFetch({"http://a.test/1": 5})
+    results = scheduler.run(["http://a.test/1", "http://a.test/2"], fetch, on_give_up=given_up.append)
+    assert list(results) == ["http://a.test/2"]
+    assert fetch.calls.count("http://a.test/1") == 3
+    assert given_up == ["http://a.test/1"]
+    assert scheduler.failures == 1
+
+
+def test_circuit_breaker_pauses_the_host_then_gives_up():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rate_per_host=1000.0, max_consecutive_failures=3, cooldown=60.0, max_trips=2,
+                                  clock=clock)
+    url = "http://a.test/1"
+    for _ in range(3):
+        clock.now += limiter.reserve(url)
+        limiter.record(url, 0.1, False)
+    # Open: nothing goes out until the cooldown is over
+    assert limiter.reserve(url) >= 60.0
+    clock.now += 60.0
+    # Still failing: the second trip doubles the cooldown
+    for _ in range(3):
+        clock.now += limiter.reserve(url)
+        limiter.record(url, 0.1, False)
+    assert limiter.reserve(url) >= 120.0
+    clock.now += 120.0
+    for _ in range(3):
+        clock.now += limiter.reserve(url)
+        limiter.record(url, 0.1, False)
+    assert limiter.gave_up(url)
+    with pytest.raises(CircuitOpen):
+        limiter.reserve(url)
+    # Other hosts are unaffected
+    assert limiter.reserve("http://b.test/1") == 0.0
+
+
+def test_circuit_breaker_closes_after_a_successful_probe():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rate_per_host=1000.0, max_consecutive_failures=2, cooldown=10.0, clock=clock)
+    url = "http://a.test/1"
+    for _ in range(2):
+        limiter.reserve(url)
+        limiter.record(url, 0.1, False)
+    clock.now += limiter.reserve(url)
+    limiter.record(url, 0.1, True)
+    assert limiter.host(url).trips == 0
+    assert not limiter.gave_up(url)
+
+
+def test_scheduler_stops_once_the_circuit_is_open_for_good():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, attempts=10,
+                               limiter=dict(max_consecutive_failures=2, cooldown=5.0, max_trips=1))
+    urls = [f"http://a.test/{i}" for i in range(10)]
+    fetch = FlakyFetch({url: 10 for url in urls})
+    assert scheduler.run(urls, fetch) == {}
+    assert scheduler.gave_up(urls[0])
+    # Two trips of two failures each, then the batch ends without trying the rest
+    assert len(fetch.calls) == 4
+
+
+def test_retries_of_admitted_listings_run_under_the_budget():
+    # Budget 2: a and b are admitted, c is refused, and a's retry still goes ahead
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, concurrency=2)
+    budget = ListingBudget(2)
+    fetch = FlakyFetch({"a": 1})
+
+    async def fetch_async(url):
+        return fetch(url)
+
+    results = asyncio.run(scheduler.run_async(["a", "b", "c"], fetch_async, admit=budget.admit,
+                                              on_give_up=lambda url: budget.give_back()))
+    assert sorted(results) == ["a", "b"]
+    assert fetch.calls.count("a") == 2 and "c" not in fetch.calls
+    assert budget.refused and budget.left == 0
+
+
+def test_a_listing_given_up_on_returns_its_budget():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, attempts=2)
+    budget = ListingBudget(2)
+    results = scheduler.run(["a", "b", "c"], FlakyFetch({"a": 2}), admit=budget.admit,
+                            on_give_up=lambda url: budget.give_back())
+    assert list(results) == ["b"]
+    assert budget.left == 1
+
+
+def test_fair_slots_cap_each_site():
+    slots = FairSlots(4)
+    slots.set_limit("small", 1)
+    active = {"small": 0, "big": 0}
+    peak = {"small": 0, "big": 0}
+
+    async def fetch(site):
+        async with slots.slot(site):
+            active[site] += 1
+            peak[site] = max(peak[site], active[site])
+            await asyncio.sleep(0.01)
+            active[site] -= 1
+
+    async def crawl():
+        await asyncio.gather(*(fetch(site) for site in ["big"] * 8 + ["small"] * 3))
+
+    asyncio.run(crawl())
+    assert peak == {"small": 1, "big": 4}
+    assert slots.in_use == 0
+
+
+def test_run_async_keeps_to_its_concurrency():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rate_per_host=1000.0, concurrency=3)
+    active = 0
+    peak = 0
+
+    async def fetch(url):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return url
+
+    urls = [f"http://a.test/{i}" for i in range(10)]
+    assert sorted(asyncio.run(scheduler.run_async(urls, fetch))) == sorted(urls)
+    assert peak == 3
+
+
+def crawl_fixture(site, attempts=5):
+    base_url = site.start()
+    # min_rate keeps the slow-downs short; Retry-After (1s) still applies
+    limiter = AdaptiveRateLimiter(rate_per_host=1000.0, min_rate=4.0)
+    scheduler = CrawlScheduler(limiter, attempts=attempts, backoff_base=0.05)
+    try:
+        with httpx.Client() as client:
+            urls = site.listing_urls(base_url)
+            return urls, scheduler, scheduler.run(urls, lambda url: fetch_html_sync(client, url))
+    finally:
+        site.stop()
+
+
+def test_fixture_site_rate_limit_is_retried_after_retry_after():
+    site = FixtureSite(pages=1, per_page=6, rate=20.0, burst=2)
+    urls, scheduler, results = crawl_fixture(site)
+    assert sorted(results) == sorted(urls)
+    assert site.stats.get(429, 0) > 0
+    assert scheduler.retries >= site.stats[429]
+    # After a 429 the host's pace was slowed below the configured rate
+    assert scheduler.limiter.host(urls[0]).interval > scheduler.limiter.min_interval
+
+
+def test_fixture_site_unavailable_is_retried():
+    site = FixtureSite(pages=1, per_page=6, unavailable=0.3, seed=1)
+    urls, scheduler, results = crawl_fixture(site)
+    assert sorted(results) == sorted(urls)
+    assert site.stats.get(503, 0) > 0
+    assert scheduler.retries == site.stats[503]
@@ -0,0 +1,43 @@
+from seen_index import SeenIndex, card_fingerprint, persist_record
+
+
+class ListJournal(list):
+    # Stands in for storage.PropertyJournal
+    def append(self, property_data):
+        super().append(dict(property_data))
+
+
+def record(price):
+    return {"Title": "3 Bedroom Flat", "Price": price, "Link": "https://site/listing/1"}
+
+
+def test_a_plain_crawl_keeps_the_card_for_the_next_refresh(tmp_path):
+    seen = SeenIndex(str(tmp_path / "seen.db"))
+    journal = ListJournal()
+    link = "https://site/listing/1"
+    card = "3 Bedroom Flat\n₦ 2,500,000"
+    assert seen.should_scrape(link, card_fingerprint(card))
+    assert persist_record(journal, seen, link, card, record("2500000"))
+    assert seen.card_row(link) == ("3 Bedroom Flat", "2500000", "listed")
+
+    # The first refresh already sees the price change
+    assert seen.refresh_status(link, "3 Bedroom Flat\n₦ 2,750,000") == "price_changed"
+    assert persist_record(journal, seen, link, "3 Bedroom Flat\n₦ 2,750,000", record("2750000"))
+    assert [(price, status) for _, _, price, status in seen.iter_history()] == \
+        [("2500000", "new"), ("2750000", "price_changed")]
+    assert len(journal) == 2
+    seen.close()
+
+
+def test_a_record_without_its_card_keeps_the_card(tmp_path):
+    seen = SeenIndex(str(tmp_path / "seen.db"))
+    journal = ListJournal()
+    link = "https://site/listing/1"
+    card = "3 Bedroom Flat\n₦ 2,500,000"
+    persist_record(journal, seen, link, card, record("2500000"))
+    # Unchanged record: not journaled again
+    assert not persist_record(journal, seen, link, None, record("2500000"))
+    assert persist_record(journal, seen, link, None, record("2600000"))
+    assert not seen.should_scrape(link, card_fingerprint(card))
+    assert seen.card_row(link)[:2] == ("3 Bedroom Flat", "2500000")
+    seen.close()
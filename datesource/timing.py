@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from datetime import datetime
+import threading
+import json
+import time
+import os
+from metrics import metrics
+
+
+class TimingsLog:
+    # Per-page timings of a crawl as JSON lines, through one append handle kept open for
+    # the crawl. Nothing is written until configure() gives it a file (crawler.py
+    # --timings, by default <state-dir>/timings.jsonl).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.file = None
+
+    def configure(self, path=None):
+        self.close()
+        self.path = path
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Line-buffered: each entry is one append, so concurrent shard processes can share the file
+            self.file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def write(self, entry):
+        if self.file is None:
+            return
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+timings = TimingsLog()
+
+
+class PhaseTimer:
+    # Records how long each phase of scraping one page took, in seconds.
+    # kind is "search" or "detail"; log() also feeds the phases to the crawl metrics
+    # as "<kind>_<phase>" stages.
+    def __init__(self, url, kind="detail"):
+        self.url = url
+        self.kind = kind
+        self.phases = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        parts = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        return f"{self.total():.2f}s total ({parts})"
+
+    def log(self):
+        for name, seconds in self.phases.items():
+            metrics.observe(f"{self.kind}_{name}", seconds)
+        entry = {
+            "url": self.url,
+            "kind": self.kind,
+            "time": datetime.now().isoformat(timespec='seconds'),
+            "total": round(self.total(), 4),
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+        }
+        try:
+            timings.write(entry)
+        except Exception as e:
+            print(f"Failed to write timings: {e}")